@@ -39,6 +39,19 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def get_token_subject(token: Optional[str]) -> Optional[str]:
+    """
+    Returns the subject ("sub") of a valid access token, or None.
+    Used where a dependency cannot raise HTTP errors, e.g. WebSocket handshakes.
+    """
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
 # --- FastAPI Dependency for Protected Routes ---
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """
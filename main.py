@@ -1,5 +1,5 @@
-from fastapi import FastAPI
-from typing import Dict
+from fastapi import FastAPI, WebSocket, status
+from typing import Dict, Optional
 
 # Initialize the main FastAPI application
 app = FastAPI(
@@ -20,6 +20,57 @@ app.include_router(agent.router, prefix="/agent", tags=["Specialized Agent"])
 # app.include_router(experience.router, prefix="/experience", tags=["Multi-Modal Experiences"])
 # ---
 
+# --- Social Platform ---
+from .auth import get_token_subject
+from .social_platform import SocialPlatform
+
+social_platform = SocialPlatform()
+
+@app.on_event("startup")
+async def start_social_platform() -> None:
+    await social_platform.start()
+
+@app.on_event("shutdown")
+async def stop_social_platform() -> None:
+    await social_platform.shutdown()
+
+def _websocket_token(websocket: WebSocket) -> Optional[str]:
+    """Access token from the "token" query parameter or a Bearer Authorization header."""
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    return credentials if scheme.lower() == "bearer" else None
+
+@app.websocket("/ws")
+async def realtime_gateway(websocket: WebSocket) -> None:
+    """
+    Real-time event stream for the authenticated user.
+    The user is the subject of the JWT access token passed as ?token= or as a Bearer header.
+    Events are pushed as UTF-8 JSON binary frames through the platform's realtime gateway.
+    """
+    user_id = get_token_subject(_websocket_token(websocket))
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    gateway = social_platform.realtime_manager.gateway
+    # Frames are bytes shared by every recipient, so they are sent as-is without copying
+    connection_id = await gateway.register(user_id, websocket.send_bytes, websocket.close)
+    try:
+        # Client frames are only used as text keep-alives for now; binary frames are rejected
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                break
+    finally:
+        await gateway.unregister(connection_id)
+# ---
+
 @app.get("/", tags=["Root"])
 async def read_root() -> Dict[str, str]:
     """
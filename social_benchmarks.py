@@ -0,0 +1,1096 @@
+"""
+Social Platform Benchmarks
+Measures the hot paths of the social platform against their naive baselines
+
+Run all benchmarks:      python social_benchmarks.py
+Run a single benchmark:  python social_benchmarks.py user_search
+"""
+
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Callable, Optional, Set
+
+from social_platform import (
+    UserManager, UserProfile, ConnectionManager, ConnectionType, SocialConnection,
+    RealtimeManager, RealtimeGateway, SocialEvent, SocialPlatform, MessageManager,
+    SQLiteMessageStore, SocialRoom, Message, MessageColumns, MessageSearchIndex, UserStatus, RoomType, np
+)
+from social_sharding import ShardedPlatform
+from array import array
+from collections import Counter
+
+def _random_word(rng: random.Random, min_length: int = 3, max_length: int = 10) -> str:
+    """Generate a random lowercase word"""
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_length, max_length)))
+
+def _time_call(func: Callable, repeat: int) -> float:
+    """Average wall time of a synchronous call in milliseconds"""
+    
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+async def _time_async_call(func: Callable, repeat: int) -> float:
+    """Average wall time of an async call in milliseconds"""
+    
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def _print_header(title: str):
+    print(title)
+    print("=" * 60)
+
+# User search
+def _scan_search_users(users: Dict[str, UserProfile], query: str) -> List[UserProfile]:
+    """Baseline: substring scan over every profile"""
+    
+    query_lower = query.lower()
+    return [
+        user for user in users.values()
+        if (query_lower in user.username.lower() or
+            query_lower in user.display_name.lower() or
+            (user.bio and query_lower in user.bio.lower()))
+    ]
+
+async def benchmark_user_search(sizes: List[int] = (10_000, 100_000, 1_000_000),
+                                queries_per_size: int = 20) -> List[Dict[str, Any]]:
+    """Compare indexed user search latency with the linear scan"""
+    
+    _print_header("User search: trigram index vs scan")
+    rng = random.Random(42)
+    results = []
+    
+    for size in sizes:
+        user_manager = UserManager()
+        
+        for i in range(size):
+            username = f"{_random_word(rng)}_{i}"
+            await user_manager.create_user({
+                "user_id": f"user-{i}",
+                "username": username,
+                "display_name": _random_word(rng).title(),
+                "bio": " ".join(_random_word(rng) for _ in range(rng.randint(0, 8))) or None
+            })
+        
+        usernames = [user.username for user in user_manager.users.values()]
+        queries = [rng.choice(usernames)[:rng.randint(3, 6)] for _ in range(queries_per_size)]
+        
+        scan_ms = sum(
+            _time_call(lambda q=query: _scan_search_users(user_manager.users, q), 1)
+            for query in queries
+        ) / len(queries)
+        index_ms = 0.0
+        for query in queries:
+            index_ms += await _time_async_call(lambda q=query: user_manager.search_users(q, limit=20), 1)
+        index_ms /= len(queries)
+        
+        results.append({"users": size, "scan_ms": scan_ms, "index_ms": index_ms})
+        print(f"{size:>10,} users  scan {scan_ms:9.3f} ms  index {index_ms:9.3f} ms  "
+              f"speedup {scan_ms / max(index_ms, 1e-9):7.1f}x")
+    
+    print()
+    return results
+
+# Connection lookups
+def _scan_get_connection(connection_manager: ConnectionManager, user_id: str,
+                         target_user_id: str) -> Optional[SocialConnection]:
+    """Baseline: walk every outgoing connection of the user"""
+    
+    for connection_id in connection_manager.user_connections.get(user_id, set()):
+        connection = connection_manager.connections.get(connection_id)
+        if connection and connection.target_user_id == target_user_id:
+            return connection
+    return None
+
+def _power_law_degrees(rng: random.Random, users: int, alpha: float, max_degree: int) -> List[int]:
+    """Sample out-degrees from a Pareto distribution"""
+    return [min(max_degree, int(rng.paretovariate(alpha))) for _ in range(users)]
+
+async def benchmark_connection_lookup(users: int = 20_000, alpha: float = 1.2,
+                                      max_degree: int = 15_000, lookups: int = 20_000) -> Dict[str, Any]:
+    """Stress pair lookups and follower listings on a power-law graph"""
+    
+    _print_header("Connection lookup: pair index vs adjacency scan")
+    rng = random.Random(7)
+    connection_manager = ConnectionManager()
+    user_ids = [f"user-{i}" for i in range(users)]
+    
+    # Preferential targets so in-degrees are skewed as well
+    celebrities = user_ids[:max(1, users // 100)]
+    degrees = _power_law_degrees(rng, users, alpha, max_degree)
+    
+    start = time.perf_counter()
+    edges = 0
+    for user_id, degree in zip(user_ids, degrees):
+        targets = set()
+        while len(targets) < min(degree, users - 1):
+            pool = celebrities if rng.random() < 0.3 else user_ids
+            target = rng.choice(pool)
+            if target != user_id:
+                targets.add(target)
+        for target in targets:
+            await connection_manager.create_connection(user_id, target, ConnectionType.FOLLOWER)
+        edges += len(targets)
+    build_s = time.perf_counter() - start
+    
+    # Bias lookups towards high-degree accounts, where the scan hurts most
+    hubs = sorted(user_ids, key=lambda u: len(connection_manager.user_connections.get(u, ())), reverse=True)[:100]
+    pairs = [(rng.choice(hubs), rng.choice(user_ids)) for _ in range(lookups)]
+    
+    start = time.perf_counter()
+    for user_id, target in pairs:
+        _scan_get_connection(connection_manager, user_id, target)
+    scan_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    for user_id, target in pairs:
+        await connection_manager.get_connection(user_id, target)
+    index_ms = (time.perf_counter() - start) * 1000
+    
+    top_target = max(connection_manager.inbound_connections, key=lambda u: len(connection_manager.inbound_connections[u]))
+    start = time.perf_counter()
+    followers_scan = [c for c in connection_manager.connections.values() if c.target_user_id == top_target]
+    followers_scan_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    followers = await connection_manager.get_inbound_connections(top_target)
+    followers_index_ms = (time.perf_counter() - start) * 1000
+    assert len(followers) == len(followers_scan)
+    
+    print(f"{users:,} users, {edges:,} edges, max out-degree {max(degrees):,} (built in {build_s:.1f} s)")
+    print(f"{lookups:,} hub pair lookups  scan {scan_ms:9.1f} ms  index {index_ms:9.1f} ms  "
+          f"speedup {scan_ms / max(index_ms, 1e-9):7.1f}x")
+    print(f"followers of top account ({len(followers):,})  scan {followers_scan_ms:9.1f} ms  "
+          f"index {followers_index_ms:9.1f} ms")
+    print()
+    
+    return {
+        "edges": edges,
+        "scan_ms": scan_ms,
+        "index_ms": index_ms,
+        "followers_scan_ms": followers_scan_ms,
+        "followers_index_ms": followers_index_ms
+    }
+
+# Friend suggestions
+async def _nested_suggest_connections(connection_manager: ConnectionManager, user_id: str,
+                                      limit: int = 10) -> List[str]:
+    """Baseline: nested friend-of-friend walk with list dedup"""
+    
+    suggestions = []
+    user_friends = {
+        conn.target_user_id
+        for conn in await connection_manager.get_user_connections(user_id, ConnectionType.FRIEND)
+    }
+    for friend_id in user_friends:
+        for friend_conn in await connection_manager.get_user_connections(friend_id, ConnectionType.FRIEND):
+            potential_friend = friend_conn.target_user_id
+            if potential_friend != user_id and potential_friend not in user_friends:
+                if potential_friend not in suggestions:
+                    suggestions.append(potential_friend)
+    return suggestions[:limit]
+
+async def benchmark_friend_suggestions(users: int = 20_000, hub_friends: int = 2_000,
+                                       average_friends: int = 20) -> Dict[str, Any]:
+    """Compare CSR friend-of-friend scoring with the nested walk for a high-degree user"""
+    
+    _print_header("Friend suggestions: CSR snapshot vs nested walk")
+    rng = random.Random(11)
+    connection_manager = ConnectionManager()
+    user_ids = [f"user-{i}" for i in range(users)]
+    
+    for user_id in user_ids:
+        for target in rng.sample(user_ids, average_friends):
+            if target != user_id:
+                await connection_manager.create_connection(user_id, target, ConnectionType.FRIEND)
+    hub = "hub"
+    for target in rng.sample(user_ids, hub_friends):
+        await connection_manager.create_connection(hub, target, ConnectionType.FRIEND)
+    
+    start = time.perf_counter()
+    connection_manager.refresh_friend_graph()
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    nested_ms = await _time_async_call(lambda: _nested_suggest_connections(connection_manager, hub), 1)
+    csr_ms = await _time_async_call(lambda: connection_manager.suggest_connections(hub), 5)
+    
+    print(f"{users:,} users, hub with {hub_friends:,} friends, snapshot built in {build_ms:.0f} ms")
+    print(f"nested walk {nested_ms:9.1f} ms  CSR top-k {csr_ms:9.1f} ms  "
+          f"speedup {nested_ms / max(csr_ms, 1e-9):7.1f}x  (NumPy: {'yes' if np is not None else 'no'})")
+    print()
+    
+    return {"build_ms": build_ms, "nested_ms": nested_ms, "csr_ms": csr_ms}
+
+# Realtime fan-out
+class _CountingGateway(RealtimeGateway):
+    """Gateway that counts recipients instead of writing to sockets"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delivered = 0
+    
+    def publish(self, user_ids, event: SocialEvent) -> int:
+        for _ in user_ids:
+            self.delivered += 1
+        return 0
+
+def _scan_subscribers(realtime_manager: RealtimeManager, event_type: str) -> set:
+    """Baseline: test every user's subscription set"""
+    
+    return {
+        user_id for user_id, subscriptions in realtime_manager.user_subscriptions.items()
+        if event_type in subscriptions
+    }
+
+async def benchmark_subscriber_fanout(subscribers: int = 100_000, event_types: int = 50,
+                                      types_per_user: int = 2, events: int = 500) -> Dict[str, Any]:
+    """Compare topic-indexed subscriber lookup with the per-event subscription scan"""
+    
+    _print_header("Subscriber fan-out: topic index vs subscription scan")
+    rng = random.Random(13)
+    realtime_manager = RealtimeManager()
+    realtime_manager.gateway = _CountingGateway()
+    type_names = [f"event_type_{i}" for i in range(event_types)]
+    
+    for i in range(subscribers):
+        await realtime_manager.subscribe_user(f"user-{i}", rng.sample(type_names, types_per_user))
+    
+    emitted = [rng.choice(type_names) for _ in range(events)]
+    
+    start = time.perf_counter()
+    scan_recipients = sum(len(_scan_subscribers(realtime_manager, event_type)) for event_type in emitted)
+    scan_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    for event_type in emitted:
+        set(realtime_manager.event_subscribers.get(event_type, ()))
+    lookup_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    for event_type in emitted:
+        await realtime_manager.emit_event(SocialEvent(
+            event_id=str(len(emitted)), event_type=event_type, user_id="publisher"
+        ))
+    index_ms = (time.perf_counter() - start) * 1000
+    assert realtime_manager.gateway.delivered == scan_recipients
+    
+    print(f"{subscribers:,} subscribers, {event_types} event types, {events} events, "
+          f"{scan_recipients / events:,.0f} recipients/event")
+    print(f"scan lookup {scan_ms / events:8.3f} ms/event  index lookup {lookup_ms / events:8.3f} ms/event  "
+          f"indexed emit incl. delivery {index_ms / events:8.3f} ms/event")
+    print()
+    
+    return {
+        "scan_ms_per_event": scan_ms / events,
+        "lookup_ms_per_event": lookup_ms / events,
+        "emit_ms_per_event": index_ms / events
+    }
+
+# Gateway load
+async def benchmark_gateway_load(clients: int = 5_000, events: int = 200, slow_fraction: float = 0.02,
+                                 queue_size: int = 64, events_per_second: float = 100.0) -> Dict[str, Any]:
+    """Push events to thousands of simulated clients, some of them too slow to keep up"""
+    
+    _print_header("Gateway load: simulated WebSocket clients")
+    rng = random.Random(17)
+    gateway = RealtimeGateway(queue_size=queue_size)
+    received = {"fast": 0, "slow": 0}
+    closed = []
+    
+    async def fast_send(frame: bytes):
+        received["fast"] += 1
+    
+    async def slow_send(frame: bytes):
+        await asyncio.sleep(0.05)
+        received["slow"] += 1
+    
+    async def close():
+        closed.append(True)
+    
+    slow_clients = 0
+    for i in range(clients):
+        slow = rng.random() < slow_fraction
+        slow_clients += slow
+        await gateway.register(f"user-{i}", slow_send if slow else fast_send, close)
+    
+    user_ids = [f"user-{i}" for i in range(clients)]
+    interval = 1.0 / events_per_second
+    publish_s = 0.0
+    
+    start = time.perf_counter()
+    for i in range(events):
+        event = SocialEvent(
+            event_id=str(i), event_type="room_message", user_id="publisher",
+            data={"content": _random_word(rng, 20, 80)}
+        )
+        publish_start = time.perf_counter()
+        gateway.publish(user_ids, event)
+        publish_s += time.perf_counter() - publish_start
+        await asyncio.sleep(interval)
+    
+    # Let the surviving writers drain
+    while any(len(connection.outbox) for connection in gateway.connections.values()):
+        await asyncio.sleep(0.01)
+    total_s = time.perf_counter() - start
+    await gateway.close_all()
+    
+    metrics = gateway.metrics
+    print(f"{clients:,} clients ({slow_clients} slow), {events} events at {events_per_second:.0f}/s, "
+          f"queue size {queue_size}")
+    print(f"serialized {metrics['serialized']} times, enqueued {metrics['enqueued']:,} frames, "
+          f"sent {metrics['sent']:,}, evicted {metrics['evicted']} slow consumers")
+    print(f"publish cost {publish_s * 1000 / events:8.3f} ms/event  "
+          f"({metrics['enqueued'] / max(publish_s, 1e-9):,.0f} frames/s), wall time {total_s:.2f} s")
+    print()
+    
+    return {"metrics": dict(metrics), "publish_ms_per_event": publish_s * 1000 / events}
+
+# Room broadcast
+def _encode_per_recipient(event: SocialEvent, recipients: List[str]) -> int:
+    """Baseline: build and encode the payload separately for every recipient"""
+    
+    encoded = 0
+    for _ in recipients:
+        payload = {
+            "event_id": event.event_id,
+            "event_type": event.event_type,
+            "user_id": event.user_id,
+            "room_id": event.room_id,
+            "data": dict(event.data),
+            "timestamp": event.timestamp
+        }
+        encoded += len(json.dumps(payload).encode("utf-8"))
+    return encoded
+
+async def benchmark_room_broadcast(members: int = 5_000, messages_per_second: float = 200.0,
+                                   seconds: float = 2.0) -> Dict[str, Any]:
+    """Broadcast chat messages into a busy room through the full send_message path"""
+    
+    _print_header("Room broadcast: serialize-once fan-out")
+    rng = random.Random(19)
+    platform = SocialPlatform()
+    gateway = platform.realtime_manager.gateway
+    delivered = {"frames": 0, "bytes": 0}
+    
+    async def client_send(frame: bytes):
+        delivered["frames"] += 1
+        delivered["bytes"] += len(frame)
+    
+    room = await platform.room_manager.create_room({
+        "name": "Main Stage", "owner_id": "user-0", "capacity": members + 1
+    })
+    member_ids = [f"user-{i}" for i in range(members)]
+    for user_id in member_ids:
+        await platform.realtime_manager.subscribe_to_room(user_id, room.room_id)
+        await gateway.register(user_id, client_send)
+    
+    total_messages = int(messages_per_second * seconds)
+    interval = 1.0 / messages_per_second
+    latencies = []
+    
+    start = time.perf_counter()
+    next_send = start
+    for i in range(total_messages):
+        send_start = time.perf_counter()
+        await platform.send_message({
+            "sender_id": rng.choice(member_ids),
+            "room_id": room.room_id,
+            "content": " ".join(_random_word(rng) for _ in range(rng.randint(3, 20)))
+        })
+        latencies.append((time.perf_counter() - send_start) * 1000)
+        next_send += interval
+        await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+    
+    while any(len(connection.outbox) for connection in gateway.connections.values()):
+        await asyncio.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    await platform.shutdown()
+    
+    # Baseline cost of encoding per recipient, measured on a few messages
+    sample_event = SocialEvent(
+        event_id="sample", event_type="message_message_sent", user_id="user-0", room_id=room.room_id,
+        data={"message_id": "m", "content": "hello room " * 5, "message_type": "text"}
+    )
+    baseline_ms = _time_call(lambda: _encode_per_recipient(sample_event, member_ids), 5)
+    encode_once_ms = _time_call(lambda: RealtimeGateway.encode_event(sample_event), 1000)
+    
+    latencies.sort()
+    print(f"{members:,} members, {total_messages} messages targeted at {messages_per_second:.0f}/s")
+    print(f"achieved {total_messages / elapsed:7.1f} msgs/s, delivered {delivered['frames']:,} frames "
+          f"({delivered['bytes'] / 1e6:.1f} MB), encoded {gateway.metrics['serialized']} times")
+    print(f"send_message fan-out  p50 {latencies[len(latencies) // 2]:7.3f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms")
+    print(f"encoding per message  per-recipient {baseline_ms:8.3f} ms  once {encode_once_ms:8.4f} ms")
+    print()
+    
+    return {
+        "achieved_rate": total_messages / elapsed,
+        "frames": delivered["frames"],
+        "p99_ms": latencies[int(len(latencies) * 0.99)],
+        "per_recipient_encode_ms": baseline_ms,
+        "encode_once_ms": encode_once_ms
+    }
+
+# Message store
+async def benchmark_message_store(messages: int = 50_000, rooms: int = 20, senders: int = 200,
+                                  hot_messages_per_room: int = 500, cold_reads: int = 500,
+                                  page_size: int = 50) -> Dict[str, Any]:
+    """Sustained writes through the SQLite store and cold history reads after a restart"""
+    
+    _print_header(f"Message store ({messages:,} messages, {rooms} rooms, {senders} concurrent senders)")
+    
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp(prefix="social-bench-")
+    path = os.path.join(directory, "messages.db")
+    room_ids = [f"room_{i}" for i in range(rooms)]
+    
+    # Sustained writes from concurrent senders with group commit
+    store = SQLiteMessageStore(path)
+    message_manager = MessageManager(store=store, hot_messages_per_room=hot_messages_per_room)
+    await store.open()
+    
+    async def sender(manager: MessageManager, sender_id: str, count: int, commit_each: bool):
+        for i in range(count):
+            await manager.send_message({
+                "sender_id": sender_id,
+                "room_id": rng.choice(room_ids),
+                "content": f"message {i} " + " ".join(_random_word(rng) for _ in range(8))
+            })
+            if commit_each:
+                await manager.store.flush()
+            else:
+                await asyncio.sleep(0)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(message_manager, f"user_{i}", messages // senders, False) for i in range(senders)))
+    await store.flush()
+    write_elapsed = time.perf_counter() - start
+    store_metrics = store.get_metrics()
+    resident = len(message_manager.messages)
+    await store.close()
+    
+    # Baseline: a single sender waiting for its own commit after every message
+    baseline_messages = min(messages, 2_000)
+    baseline_store = SQLiteMessageStore(os.path.join(directory, "baseline.db"), commit_interval=0)
+    baseline_manager = MessageManager(store=baseline_store, hot_messages_per_room=hot_messages_per_room)
+    await baseline_store.open()
+    start = time.perf_counter()
+    await sender(baseline_manager, "baseline", baseline_messages, True)
+    baseline_elapsed = time.perf_counter() - start
+    await baseline_store.close()
+    
+    # Cold reads: a fresh manager has nothing in memory, every page comes from the index
+    store = SQLiteMessageStore(path)
+    message_manager = MessageManager(store=store, hot_messages_per_room=hot_messages_per_room)
+    await store.open()
+    
+    heads = {room_id: await store.get_room_head(room_id) for room_id in room_ids}
+    latencies = []
+    for _ in range(cold_reads):
+        room_id = rng.choice(room_ids)
+        cursor = rng.randrange(1, heads[room_id])
+        start = time.perf_counter()
+        await message_manager.get_room_messages_page(room_id, page_size, cursor)
+        latencies.append((time.perf_counter() - start) * 1000)
+    await store.close()
+    
+    latencies.sort()
+    write_rate = store_metrics["committed"] / write_elapsed
+    baseline_rate = baseline_messages / baseline_elapsed
+    print(f"group commit      {write_rate:10,.0f} msgs/s  ({store_metrics['batches']:,} batches, "
+          f"avg {store_metrics['average_batch']:.1f} msgs), {resident:,} messages resident")
+    print(f"commit per write  {baseline_rate:10,.0f} msgs/s")
+    print(f"cold page of {page_size}   p50 {latencies[len(latencies) // 2]:7.3f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:7.3f} ms")
+    print()
+    
+    return {
+        "write_rate": write_rate,
+        "baseline_write_rate": baseline_rate,
+        "average_batch": store_metrics["average_batch"],
+        "resident_messages": resident,
+        "cold_page_p99_ms": latencies[int(len(latencies) * 0.99)]
+    }
+
+# Record memory
+@dataclass
+class _DictUserProfile:
+    """Baseline: UserProfile as a regular dataclass with eager containers"""
+    user_id: str
+    username: str
+    display_name: str
+    avatar_url: Optional[str] = None
+    bio: Optional[str] = None
+    status: UserStatus = UserStatus.ONLINE
+    preferences: Dict[str, Any] = field(default_factory=dict)
+    privacy_settings: Dict[str, Any] = field(default_factory=dict)
+    interests: List[str] = field(default_factory=list)
+    achievements: List[Dict[str, Any]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    hashed_password: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class _DictSocialConnection:
+    """Baseline: SocialConnection as a regular dataclass with eager containers"""
+    connection_id: str
+    user_id: str
+    target_user_id: str
+    connection_type: ConnectionType
+    created_at: float
+    strength: float = 0.5
+    mutual: bool = False
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class _DictSocialRoom:
+    """Baseline: SocialRoom as a regular dataclass with eager containers"""
+    room_id: str
+    name: str
+    description: str
+    room_type: RoomType
+    owner_id: str
+    capacity: int
+    current_users: Set[str] = field(default_factory=set)
+    moderators: Set[str] = field(default_factory=set)
+    settings: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+    tags: List[str] = field(default_factory=list)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class _DictMessage:
+    """Baseline: Message as a regular dataclass with eager containers"""
+    message_id: str
+    sender_id: str
+    room_id: Optional[str] = None
+    recipient_id: Optional[str] = None
+    content: str = ""
+    message_type: str = "text"
+    attachments: List[Dict[str, Any]] = field(default_factory=list)
+    reactions: Dict[str, List[str]] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+    edited_at: Optional[float] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+@dataclass
+class _DictSocialEvent:
+    """Baseline: SocialEvent as a regular dataclass with eager containers"""
+    event_id: str
+    event_type: str
+    user_id: str
+    room_id: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+def _bytes_per_record(factory: Callable[[int], Any], count: int) -> float:
+    """Traced allocation per record, excluding the shared field values"""
+    
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [factory(i) for i in range(count)]
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    
+    del records
+    return allocated / count - 8  # minus the list slot
+
+async def benchmark_record_memory(count: int = 100_000) -> Dict[str, Dict[str, float]]:
+    """Compare bytes per record of the slotted record types with regular dataclasses"""
+    
+    _print_header(f"Record memory ({count:,} records per type)")
+    
+    # Field values are created up front so only the records themselves are measured
+    ids = [str(uuid.uuid4()) for _ in range(count)]
+    user_id, room_id, now = ids[0], ids[1], time.time()
+    
+    record_types = {
+        "UserProfile": (
+            lambda cls: lambda i: cls(user_id=ids[i], username="user", display_name="User",
+                                      created_at=now, last_active=now),
+            UserProfile, _DictUserProfile
+        ),
+        "SocialConnection": (
+            lambda cls: lambda i: cls(connection_id=ids[i], user_id=user_id, target_user_id=room_id,
+                                      connection_type=ConnectionType.FRIEND, created_at=now),
+            SocialConnection, _DictSocialConnection
+        ),
+        "SocialRoom": (
+            lambda cls: lambda i: cls(room_id=ids[i], name="room", description="", room_type=RoomType.PUBLIC,
+                                      owner_id=user_id, capacity=50, created_at=now),
+            SocialRoom, _DictSocialRoom
+        ),
+        "Message": (
+            lambda cls: lambda i: cls(message_id=ids[i], sender_id=user_id, room_id=room_id,
+                                      content="hello", timestamp=now),
+            Message, _DictMessage
+        ),
+        "SocialEvent": (
+            lambda cls: lambda i: cls(event_id=ids[i], event_type="message_sent", user_id=user_id,
+                                      room_id=room_id, timestamp=now),
+            SocialEvent, _DictSocialEvent
+        ),
+    }
+    
+    results = {}
+    for name, (factory, slotted_cls, dict_cls) in record_types.items():
+        dict_bytes = _bytes_per_record(factory(dict_cls), count)
+        slotted_bytes = _bytes_per_record(factory(slotted_cls), count)
+        results[name] = {"dataclass": dict_bytes, "slotted": slotted_bytes}
+        print(f"{name:18s} dataclass {dict_bytes:7.0f} B  slotted {slotted_bytes:7.0f} B  "
+              f"({dict_bytes / slotted_bytes:4.1f}x smaller)")
+    print()
+    
+    return results
+
+# Message analytics
+def _fill_columns(columns: MessageColumns, rng: random.Random, count: int, rooms: int, senders: int,
+                  start: float, span: float):
+    """Bulk-fill the columns with synthetic messages spread evenly over span seconds"""
+    
+    columns.room_ids = [f"room_{i}" for i in range(rooms)]
+    columns.room_index = {room_id: i for i, room_id in enumerate(columns.room_ids)}
+    columns.sender_ids = [f"user_{i}" for i in range(senders)]
+    columns.sender_index = {user_id: i for i, user_id in enumerate(columns.sender_ids)}
+    columns.message_types = ["text"]
+    columns.type_index = {"text": 0}
+    
+    step = span / count
+    columns.timestamps = array("d", (start + i * step for i in range(count)))
+    columns.room_codes = array("q", (int(rooms * rng.random() ** 2) for _ in range(count)))
+    columns.sender_codes = array("q", (rng.randrange(senders) for _ in range(count)))
+    columns.type_codes = array("q", bytes(8 * count))
+    columns.content_starts = array("q", bytes(8 * count))
+    columns.content_lengths = array("q", bytes(8 * count))
+    columns.live = bytearray(b"\x01" * count)
+    columns.rows = {f"m{i}": i for i in range(count)}
+
+async def benchmark_message_analytics(sizes: List[int] = (1_000_000, 10_000_000), rooms: int = 1_000,
+                                      senders: int = 100_000, days: float = 30.0,
+                                      baseline_limit: int = 1_000_000) -> List[Dict[str, Any]]:
+    """Messages per room in the last hour and top senders, columnar vs walking message objects"""
+    
+    _print_header(f"Message analytics ({rooms:,} rooms, {senders:,} senders, {days:.0f} days of history)")
+    
+    rng = random.Random(42)
+    results = []
+    
+    for size in sizes:
+        now = time.time()
+        columns = MessageColumns()
+        _fill_columns(columns, rng, size, rooms, senders, now - days * 86400, days * 86400)
+        since = now - 3600
+        
+        per_room_ms = _time_call(lambda: columns.count_by_room(since=since), 20)
+        top_day_ms = _time_call(lambda: columns.top_senders(10, since=now - 86400), 5)
+        full_scan_ms = _time_call(lambda: columns.count_by_room(), 3)
+        
+        baseline_ms = None
+        if size <= baseline_limit:
+            messages = {
+                f"m{i}": Message(message_id=f"m{i}", sender_id=columns.sender_ids[columns.sender_codes[i]],
+                                 room_id=columns.room_ids[columns.room_codes[i]], timestamp=columns.timestamps[i])
+                for i in range(size)
+            }
+            
+            def walk_per_room():
+                counts = Counter()
+                for message in messages.values():
+                    if message.timestamp >= since and message.room_id:
+                        counts[message.room_id] += 1
+                return counts
+            
+            baseline_ms = _time_call(walk_per_room, 3)
+            assert dict(walk_per_room()) == columns.count_by_room(since=since)
+            del messages
+        
+        print(f"{size:>12,} messages  last hour per room {per_room_ms:8.3f} ms  "
+              f"top senders 24h {top_day_ms:8.3f} ms  all-time per room {full_scan_ms:8.2f} ms")
+        if baseline_ms is not None:
+            print(f"{'':>12}           object walk per room {baseline_ms:8.1f} ms")
+        
+        results.append({
+            "messages": size,
+            "last_hour_per_room_ms": per_room_ms,
+            "top_senders_day_ms": top_day_ms,
+            "all_time_per_room_ms": full_scan_ms,
+            "object_walk_ms": baseline_ms
+        })
+    
+    print(f"(vectorized: {'numpy' if np is not None else 'unavailable, pure-Python fallback'})")
+    print()
+    return results
+
+# Room message pages
+async def _page_with_per_message_lookups(platform: SocialPlatform, room_id: str, limit: int) -> Dict[str, Any]:
+    """Baseline: look up and project the sender of every message separately"""
+    
+    messages, next_cursor = await platform.message_manager.get_room_messages_page(room_id, limit)
+    
+    message_list = []
+    for message in messages:
+        sender = await platform.user_manager.get_user(message.sender_id)
+        message_list.append({
+            "message_id": message.message_id,
+            "sender": {
+                "user_id": sender.user_id,
+                "username": sender.username,
+                "display_name": sender.display_name
+            } if sender else None,
+            "content": message.content,
+            "message_type": message.message_type,
+            "timestamp": message.timestamp,
+            "reactions": {emoji: list(user_ids) for emoji, user_ids in (message.reactions or {}).items()}
+        })
+    
+    return {"success": True, "messages": message_list, "next_cursor": next_cursor}
+
+async def benchmark_room_page(senders: int = 3, messages: int = 1_000, page_size: int = 50,
+                              repeat: int = 2_000) -> Dict[str, Any]:
+    """End-to-end get_room_messages page latency with cached sender projections"""
+    
+    _print_header(f"Room message page ({page_size} messages from {senders} senders)")
+    
+    platform = SocialPlatform()
+    user_ids = [
+        (await platform.register_user({"username": f"sender_{i}", "bio": "x" * 200}))["user"]["user_id"]
+        for i in range(senders)
+    ]
+    room = await platform.room_manager.create_room({"name": "benchmark", "owner_id": user_ids[0]})
+    for i in range(messages):
+        await platform.message_manager.send_message({
+            "sender_id": user_ids[i % senders], "room_id": room.room_id, "content": f"message {i}"
+        })
+    
+    assert (await platform.get_room_messages(room.room_id, page_size)) == \
+        (await _page_with_per_message_lookups(platform, room.room_id, page_size))
+    
+    baseline_ms = await _time_async_call(
+        lambda: _page_with_per_message_lookups(platform, room.room_id, page_size), repeat
+    )
+    cached_ms = await _time_async_call(lambda: platform.get_room_messages(room.room_id, page_size), repeat)
+    cache = platform.user_manager.sender_projections
+    
+    print(f"per-message lookups {baseline_ms * 1000:8.1f} us/page")
+    print(f"projection cache    {cached_ms * 1000:8.1f} us/page  ({baseline_ms / cached_ms:.1f}x, "
+          f"{cache.hits:,} hits / {cache.misses:,} misses)")
+    print()
+    await platform.shutdown()
+    
+    return {"baseline_us": baseline_ms * 1000, "cached_us": cached_ms * 1000}
+
+# Direct-message inbox
+def _scan_inbox(message_manager: MessageManager, user_id: str, limit: int) -> List[str]:
+    """Baseline: group the user's received messages by sender and sort by last activity"""
+    
+    last_activity: Dict[str, float] = {}
+    for message_id in message_manager.user_messages.get(user_id, []):
+        message = message_manager.messages[message_id]
+        last_activity[message.sender_id] = max(last_activity.get(message.sender_id, 0.0), message.timestamp)
+    return sorted(last_activity, key=last_activity.get, reverse=True)[:limit]
+
+async def benchmark_inbox(conversations: int = 5_000, messages_per_conversation: int = 20,
+                          page_size: int = 20) -> Dict[str, Any]:
+    """Open the first inbox page of a user with thousands of conversations"""
+    
+    _print_header(f"Inbox ({conversations:,} conversations x {messages_per_conversation} messages)")
+    
+    rng = random.Random(42)
+    message_manager = MessageManager()
+    peers = [f"peer_{i}" for i in range(conversations)]
+    
+    for _ in range(conversations * messages_per_conversation):
+        peer = rng.choice(peers)
+        sender, recipient = ("owner", peer) if rng.random() < 0.5 else (peer, "owner")
+        await message_manager.send_message({"sender_id": sender, "recipient_id": recipient, "content": "hi"})
+    
+    baseline_ms = _time_call(lambda: _scan_inbox(message_manager, "owner", page_size), 20)
+    indexed_ms = await _time_async_call(lambda: message_manager.get_inbox("owner", page_size), 2_000)
+    thread_ms = await _time_async_call(
+        lambda: message_manager.get_conversation_messages("owner", peers[0], 50), 2_000
+    )
+    
+    print(f"received-message scan   {baseline_ms:9.3f} ms  (incoming only, no sent messages)")
+    print(f"conversation index      {indexed_ms:9.4f} ms  first page of {page_size}")
+    print(f"thread page of 50       {thread_ms:9.4f} ms")
+    print()
+    
+    return {"scan_ms": baseline_ms, "indexed_ms": indexed_ms, "thread_ms": thread_ms}
+
+# Message search
+def _zipf_vocabulary(rng: random.Random, size: int) -> List[str]:
+    """Random words to be drawn with a Zipf-like skew"""
+    return [_random_word(rng) for _ in range(size)]
+
+def _scan_search_messages(messages: List[Message], term: str, limit: int) -> List[str]:
+    """Baseline: case-insensitive substring scan over every message"""
+    
+    term = term.casefold()
+    return [message.message_id for message in messages if term in message.content.casefold()][:limit]
+
+async def benchmark_message_search(messages: int = 200_000, vocabulary: int = 20_000, words_per_message: int = 12,
+                                   rooms: int = 100, queries: int = 50) -> Dict[str, Any]:
+    """Indexing throughput, index size and query latency of the full-text message index"""
+    
+    _print_header(f"Message search ({messages:,} messages, {vocabulary:,} word vocabulary)")
+    
+    rng = random.Random(42)
+    words = _zipf_vocabulary(rng, vocabulary)
+    weights = [1 / (rank + 1) for rank in range(vocabulary)]
+    room_ids = [f"room_{i}" for i in range(rooms)]
+    
+    corpus = [
+        Message(message_id=f"m{i}", sender_id="user", room_id=rng.choice(room_ids),
+                content=" ".join(rng.choices(words, weights, k=words_per_message)))
+        for i in range(messages)
+    ]
+    content_bytes = sum(len(message.content.encode("utf-8")) for message in corpus)
+    
+    index = MessageSearchIndex()
+    start = time.perf_counter()
+    for message in corpus:
+        index.add(message)
+    index_elapsed = time.perf_counter() - start
+    stats = index.get_stats()
+    
+    # Query mixes rare and common terms, a two-word phrase and a room scope
+    term_queries = [rng.choice(words[100:]) + " " + rng.choice(words[:100]) for _ in range(queries)]
+    phrase_queries = []
+    for _ in range(queries):
+        tokens = rng.choice(corpus).content.split()
+        position = rng.randrange(len(tokens) - 1)
+        phrase_queries.append(f'"{tokens[position]} {tokens[position + 1]}"')
+    
+    term_iter, phrase_iter, room_iter = iter(term_queries), iter(phrase_queries), iter(term_queries)
+    term_ms = _time_call(lambda: index.search(next(term_iter)), queries)
+    phrase_ms = _time_call(lambda: index.search(next(phrase_iter)), queries)
+    room_ms = _time_call(lambda: index.search(next(room_iter), room_id=room_ids[0]), queries)
+    scan_ms = _time_call(lambda: _scan_search_messages(corpus, words[500], 20), 3)
+    
+    print(f"indexing        {messages / index_elapsed:10,.0f} msgs/s  "
+          f"({stats['terms']:,} terms, {stats['posting_bytes'] / 1e6:.1f} MB postings for "
+          f"{content_bytes / 1e6:.1f} MB text, {stats['bytes_per_token']:.2f} B/token)")
+    print(f"two-term BM25   {term_ms:8.3f} ms")
+    print(f"phrase          {phrase_ms:8.3f} ms")
+    print(f"room scoped     {room_ms:8.3f} ms")
+    print(f"substring scan  {scan_ms:8.3f} ms  (unranked, single term)")
+    print()
+    
+    return {
+        "index_rate": messages / index_elapsed,
+        "posting_bytes": stats["posting_bytes"],
+        "term_query_ms": term_ms,
+        "phrase_query_ms": phrase_ms,
+        "room_query_ms": room_ms,
+        "scan_ms": scan_ms
+    }
+
+# Room search
+def _scan_search_rooms(rooms: Dict[str, SocialRoom], query: str, filters: Dict[str, Any]) -> List[SocialRoom]:
+    """Baseline: lowercase and filter every room on every call"""
+    
+    query_lower = query.lower()
+    results = []
+    for room in rooms.values():
+        if not (query_lower in room.name.lower() or query_lower in room.description.lower() or
+                any(query_lower in tag.lower() for tag in room.tags)):
+            continue
+        if "room_type" in filters and room.room_type != RoomType(filters["room_type"]):
+            continue
+        if filters.get("has_space") and len(room.current_users) >= room.capacity:
+            continue
+        if "tags" in filters and not any(tag in room.tags for tag in filters["tags"]):
+            continue
+        results.append(room)
+    return results
+
+def _scan_popular_rooms(rooms: Dict[str, SocialRoom], limit: int) -> List[SocialRoom]:
+    """Baseline: sort every room with space by occupancy"""
+    
+    open_rooms = [room for room in rooms.values() if len(room.current_users) < room.capacity]
+    open_rooms.sort(key=lambda room: (-len(room.current_users), room.room_id))
+    return open_rooms[:limit]
+
+async def benchmark_room_search(rooms: int = 100_000, tags: int = 200, full_fraction: float = 0.7,
+                                queries: int = 50) -> Dict[str, Any]:
+    """Filtered room search and popular-rooms-with-space against the per-room scan"""
+    
+    _print_header(f"Room search ({rooms:,} rooms, {full_fraction:.0%} full)")
+    rng = random.Random(11)
+    platform = SocialPlatform()
+    room_manager = platform.room_manager
+    tag_names = [_random_word(rng) for _ in range(tags)]
+    room_types = [RoomType.PUBLIC, RoomType.PRIVATE, RoomType.INVITE_ONLY]
+    
+    for i in range(rooms):
+        capacity = rng.randint(5, 50)
+        occupancy = capacity if rng.random() < full_fraction else rng.randrange(capacity)
+        room_manager.add_room(SocialRoom(
+            room_id=f"room-{i}",
+            name=f"{_random_word(rng)} {_random_word(rng)}",
+            description=" ".join(_random_word(rng) for _ in range(6)),
+            room_type=rng.choice(room_types),
+            owner_id="owner",
+            capacity=capacity,
+            current_users={f"user-{n}" for n in range(occupancy)},
+            tags=rng.sample(tag_names, 3)
+        ))
+    
+    names = [room.name for room in room_manager.rooms.values()]
+    searches = [
+        (rng.choice(names).split()[0][:4], {"has_space": True, "room_type": rng.choice(room_types).value,
+                                             "tags": rng.sample(tag_names, 2)})
+        for _ in range(queries)
+    ]
+    
+    scan_iter, index_iter = iter(searches), iter(searches)
+    scan_ms = _time_call(lambda: _scan_search_rooms(room_manager.rooms, *next(scan_iter)), queries)
+    index_ms = await _time_async_call(lambda: room_manager.search_rooms(*next(index_iter)), queries)
+    popular_scan_ms = _time_call(lambda: _scan_popular_rooms(room_manager.rooms, 20), 5)
+    popular_ms = await _time_async_call(lambda: room_manager.get_popular_rooms(20, has_space=True), queries)
+    
+    print(f"filtered search   scan {scan_ms:9.3f} ms  index {index_ms:9.3f} ms  "
+          f"speedup {scan_ms / max(index_ms, 1e-9):7.1f}x")
+    print(f"popular w/ space  scan {popular_scan_ms:9.3f} ms  index {popular_ms:9.3f} ms  "
+          f"speedup {popular_scan_ms / max(popular_ms, 1e-9):7.1f}x")
+    print()
+    
+    return {
+        "search_scan_ms": scan_ms,
+        "search_index_ms": index_ms,
+        "popular_scan_ms": popular_scan_ms,
+        "popular_index_ms": popular_ms
+    }
+
+# Bulk membership
+async def _populated_room(members: int) -> SocialPlatform:
+    """Platform with one room whose members are all subscribed to it"""
+    
+    platform = SocialPlatform()
+    platform.realtime_manager.gateway = _CountingGateway()
+    await platform.create_room({"room_id": "hall", "name": "hall", "owner_id": "owner", "capacity": members + 1})
+    for i in range(members):
+        await platform.join_room("hall", f"user-{i}")
+    platform.realtime_manager.gateway.delivered = 0
+    return platform
+
+async def benchmark_room_evacuation(members: int = 10_000) -> Dict[str, Any]:
+    """Close a crowded room member by member vs one evacuate_room pass"""
+    
+    _print_header(f"Room evacuation ({members:,} members)")
+    results = {}
+    
+    for name in ("per-member leave", "evacuate_room"):
+        platform = await _populated_room(members)
+        events_before = platform.realtime_manager.event_log.next_seq
+        
+        start = time.perf_counter()
+        if name == "evacuate_room":
+            await platform.evacuate_room("hall")
+        else:
+            for user_id in list(platform.room_manager.rooms["hall"].current_users):
+                await platform.leave_room("hall", user_id)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        events = platform.realtime_manager.event_log.next_seq - events_before
+        delivered = platform.realtime_manager.gateway.delivered
+        await platform.shutdown()
+        
+        results[name] = {"ms": elapsed_ms, "events": events, "deliveries": delivered}
+        print(f"{name:<18} {elapsed_ms:9.1f} ms  {events:>6,} events  {delivered:>12,} deliveries")
+    
+    print()
+    return results
+
+# Sharding
+async def _send_room_messages(send: Callable, room_ids: List[str], messages: int, concurrency: int) -> float:
+    """Send messages round-robin over the rooms from concurrent senders, in messages per second"""
+    
+    counter = iter(range(messages))
+    
+    async def sender(worker: int):
+        for i in counter:
+            await send({"sender_id": f"user-{worker}", "room_id": room_ids[i % len(room_ids)],
+                        "content": f"message {i} from sender {worker}"})
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(sender(worker) for worker in range(concurrency)))
+    return messages / (time.perf_counter() - start)
+
+async def benchmark_sharded_throughput(shard_counts: List[int] = (1, 2, 4), rooms: int = 256,
+                                       messages: int = 20_000, concurrency: int = 256) -> List[Dict[str, Any]]:
+    """Room message throughput through N shard processes vs a single in-process platform"""
+    
+    _print_header(f"Sharded send_message throughput ({os.cpu_count()} CPUs, {rooms} rooms)")
+    room_ids = [f"room-{i}" for i in range(rooms)]
+    results = []
+    
+    platform = SocialPlatform()
+    for room_id in room_ids:
+        await platform.create_room({"room_id": room_id, "name": room_id, "owner_id": "owner"})
+    rate = await _send_room_messages(platform.send_message, room_ids, messages, concurrency)
+    await platform.shutdown()
+    results.append({"shards": 0, "messages_per_second": rate})
+    print(f"in-process          {rate:10,.0f} msgs/s")
+    
+    for shards in shard_counts:
+        sharded = ShardedPlatform(shards=shards)
+        await sharded.start()
+        try:
+            await asyncio.gather(*(
+                sharded.create_room({"room_id": room_id, "name": room_id, "owner_id": "owner"})
+                for room_id in room_ids
+            ))
+            rate = await _send_room_messages(sharded.send_message, room_ids, messages, concurrency)
+            stats = await sharded.get_shard_stats()
+        finally:
+            await sharded.shutdown()
+        
+        room_counts = [shard["rooms"] for shard in stats]
+        results.append({"shards": shards, "messages_per_second": rate, "rooms_per_shard": room_counts})
+        print(f"{shards} shard process(es) {rate:10,.0f} msgs/s  (rooms per shard {room_counts})")
+    
+    print()
+    return results
+
+BENCHMARKS: Dict[str, Callable] = {
+    "user_search": benchmark_user_search,
+    "connection_lookup": benchmark_connection_lookup,
+    "friend_suggestions": benchmark_friend_suggestions,
+    "subscriber_fanout": benchmark_subscriber_fanout,
+    "gateway_load": benchmark_gateway_load,
+    "room_broadcast": benchmark_room_broadcast,
+    "message_store": benchmark_message_store,
+    "record_memory": benchmark_record_memory,
+    "message_analytics": benchmark_message_analytics,
+    "room_page": benchmark_room_page,
+    "inbox": benchmark_inbox,
+    "message_search": benchmark_message_search,
+    "room_search": benchmark_room_search,
+    "room_evacuation": benchmark_room_evacuation,
+    "sharded_throughput": benchmark_sharded_throughput,
+}
+
+async def run_benchmarks(names: List[str]):
+    """Run the named benchmarks, or all of them"""
+    
+    for name in names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (available: {', '.join(BENCHMARKS)})")
+            continue
+        await BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmarks(sys.argv[1:]))
@@ -5,13 +5,35 @@ Enables collaborative experiences, community interactions, and real-time social
 
 import asyncio
 import json
+import os
+import re
 import time
 import uuid
-from typing import Dict, List, Any, Optional, Set, Callable
-from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Set, Callable, Tuple, Iterable, Awaitable, AsyncIterator
+from dataclasses import dataclass, field, asdict
 from enum import Enum
 import weakref
 from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, OrderedDict, deque
+import heapq
+import math
+import bisect
+import logging
+import sqlite3
+import struct
+import threading
+import zlib
+from itertools import islice
+from contextlib import AsyncExitStack, aclosing, asynccontextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, pure-Python paths are used without it
+    np = None
+
+logger = logging.getLogger(__name__)
 
 class UserStatus(Enum):
     ONLINE = "online"
@@ -47,7 +69,11 @@ class PrivacyLevel(Enum):
     PRIVATE = "private"
     CUSTOM = "custom"
 
-@dataclass
+# Record types are slotted to drop the per-instance __dict__. Optional
+# containers (metadata, attachments, reactions, event data) stay None until
+# something is stored in them, so empty records carry no dicts or lists.
+
+@dataclass(slots=True)
 class UserProfile:
     """Comprehensive user profile with social features"""
     user_id: str
@@ -63,9 +89,9 @@ class UserProfile:
     created_at: float = field(default_factory=time.time)
     last_active: float = field(default_factory=time.time)
     hashed_password: Optional[str] = None
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class SocialConnection:
     """Represents a connection between two users"""
     connection_id: str
@@ -75,9 +101,9 @@ class SocialConnection:
     created_at: float
     strength: float = 0.5  # Connection strength (0.0 to 1.0)
     mutual: bool = False
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class SocialRoom:
     """Virtual room for social interactions"""
     room_id: str
@@ -91,9 +117,9 @@ class SocialRoom:
     settings: Dict[str, Any] = field(default_factory=dict)
     created_at: float = field(default_factory=time.time)
     tags: List[str] = field(default_factory=list)
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     """Social message with rich content support"""
     message_id: str
@@ -102,20 +128,20 @@ class Message:
     recipient_id: Optional[str] = None
     content: str = ""
     message_type: str = "text"
-    attachments: List[Dict[str, Any]] = field(default_factory=list)
-    reactions: Dict[str, List[str]] = field(default_factory=dict)  # emoji -> user_ids
+    attachments: Optional[List[Dict[str, Any]]] = None
+    reactions: Optional[Dict[str, Set[str]]] = None  # emoji -> user_ids
     timestamp: float = field(default_factory=time.time)
     edited_at: Optional[float] = None
-    metadata: Dict[str, Any] = field(default_factory=dict)
+    metadata: Optional[Dict[str, Any]] = None
 
-@dataclass
+@dataclass(slots=True)
 class SocialEvent:
     """Social platform event for real-time updates"""
     event_id: str
     event_type: str
     user_id: str
     room_id: Optional[str] = None
-    data: Dict[str, Any] = field(default_factory=dict)
+    data: Optional[Dict[str, Any]] = None
     timestamp: float = field(default_factory=time.time)
 
 class EventHandler(ABC):
@@ -126,13 +152,378 @@ class EventHandler(ABC):
         """Handle a social event"""
         pass
 
+def loop_to_rebind(bound: Optional[asyncio.AbstractEventLoop]) -> Optional[asyncio.AbstractEventLoop]:
+    """
+    Get the running event loop if it is not the one state was bound to
+    Queues, tasks and timer handles from a previous (closed) loop cannot be
+    reused, so callers rebuild them whenever this returns a loop.
+    """
+    
+    loop = asyncio.get_running_loop()
+    return None if loop is bound else loop
+
+class TrigramIndex:
+    """
+    Trigram inverted index for substring search over keyed texts
+    Texts are padded at the end so every substring of one or two characters
+    is the prefix of some indexed trigram, letting short queries resolve
+    through the prefix map instead of scanning every key. Used for user
+    profiles and rooms.
+    """
+    
+    GRAM_SIZE = 3
+    PAD = "\x00"
+    
+    def __init__(self):
+        self.postings: Dict[str, Set[str]] = {}  # trigram -> keys
+        self.prefixes: Dict[str, Set[str]] = {}  # 1-2 char prefix -> trigrams
+    
+    def grams(self, texts: List[Optional[str]]) -> Set[str]:
+        """Get the padded trigrams of the given texts"""
+        
+        grams = set()
+        
+        for text in texts:
+            if not text:
+                continue
+            padded = text.lower() + self.PAD * (self.GRAM_SIZE - 1)
+            for i in range(len(padded) - self.GRAM_SIZE + 1):
+                grams.add(padded[i:i + self.GRAM_SIZE])
+        
+        return grams
+    
+    def add(self, key: str, grams: Set[str]):
+        """Add a key to the postings of the given trigrams"""
+        
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = set()
+                for size in range(1, self.GRAM_SIZE):
+                    self.prefixes.setdefault(gram[:size], set()).add(gram)
+            posting.add(key)
+    
+    def remove(self, key: str, grams: Set[str]):
+        """Remove a key from the postings of the given trigrams"""
+        
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(key)
+            if not posting:
+                del self.postings[gram]
+                for size in range(1, self.GRAM_SIZE):
+                    prefix_grams = self.prefixes.get(gram[:size])
+                    if prefix_grams is not None:
+                        prefix_grams.discard(gram)
+                        if not prefix_grams:
+                            del self.prefixes[gram[:size]]
+    
+    def update(self, key: str, old_texts: List[Optional[str]], new_texts: List[Optional[str]]):
+        """Reindex a key, touching only the trigrams that changed"""
+        
+        old_grams = self.grams(old_texts)
+        new_grams = self.grams(new_texts)
+        
+        self.remove(key, old_grams - new_grams)
+        self.add(key, new_grams - old_grams)
+    
+    def candidates(self, query: str) -> Optional[Set[str]]:
+        """
+        Get keys whose indexed text may contain the query
+        Returns None when every key is a candidate (empty query). Results are
+        a superset of the true matches and must be verified by the caller.
+        """
+        
+        query_lower = query.lower()
+        
+        if not query_lower:
+            return None
+        
+        if len(query_lower) < self.GRAM_SIZE:
+            result = set()
+            for gram in self.prefixes.get(query_lower, ()):
+                result.update(self.postings[gram])
+            return result
+        
+        query_grams = {
+            query_lower[i:i + self.GRAM_SIZE]
+            for i in range(len(query_lower) - self.GRAM_SIZE + 1)
+        }
+        
+        # Intersect starting from the rarest trigram
+        postings = []
+        for gram in query_grams:
+            posting = self.postings.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result.intersection_update(posting)
+            if not result:
+                break
+        
+        return result
+
+class TimerWheel:
+    """
+    Hashed timing wheel for deadline expiry
+    Keys are bucketed by deadline tick, so advancing the wheel only visits the
+    slots that came due. Sizing the wheel to span the longest timeout keeps
+    each visited slot made up almost entirely of expired keys.
+    """
+    
+    def __init__(self, tick: float = 1.0, slots: int = 4096):
+        self.tick = tick
+        self.slots: List[Dict[str, float]] = [{} for _ in range(slots)]  # key -> deadline
+        self.entries: Dict[str, int] = {}  # key -> scheduled tick
+        self.current_tick: Optional[int] = None
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def schedule(self, key: str, deadline: float):
+        """Schedule (or reschedule) a key to expire at the deadline"""
+        
+        self.cancel(key)
+        
+        tick_number = math.ceil(deadline / self.tick)
+        if self.current_tick is not None and tick_number <= self.current_tick:
+            tick_number = self.current_tick + 1
+        
+        self.slots[tick_number % len(self.slots)][key] = deadline
+        self.entries[key] = tick_number
+    
+    def cancel(self, key: str) -> bool:
+        """Remove a key from the wheel"""
+        
+        tick_number = self.entries.pop(key, None)
+        if tick_number is None:
+            return False
+        
+        self.slots[tick_number % len(self.slots)].pop(key, None)
+        return True
+    
+    def advance(self, now: float) -> List[str]:
+        """Advance the wheel to now and return the keys that expired"""
+        
+        target_tick = math.floor(now / self.tick)
+        if self.current_tick is None:
+            self.current_tick = min(min(self.entries.values(), default=target_tick), target_tick) - 1
+        
+        # A full rotation visits every slot once
+        first_tick = max(self.current_tick + 1, target_tick - len(self.slots) + 1)
+        expired = []
+        
+        for tick_number in range(first_tick, target_tick + 1):
+            slot = self.slots[tick_number % len(self.slots)]
+            if not slot:
+                continue
+            
+            # Keys a full rotation (or more) away stay in the slot
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self.entries[key]
+            expired.extend(due)
+        
+        self.current_tick = max(self.current_tick, target_tick)
+        return expired
+
+class PresenceDispatcher:
+    """
+    Concurrent, coalescing fan-out of presence changes
+    Changes for the same user within the coalesce window collapse into one
+    notification carrying the latest status. Every callback drains its own
+    bounded queue, so a slow subscriber only ever delays itself.
+    """
+    
+    def __init__(self, coalesce_window: float = 0.05, queue_size: int = 1024):
+        self.coalesce_window = coalesce_window
+        self.queue_size = queue_size
+        self.callbacks: List[Callable] = []
+        self.pending: Dict[str, UserStatus] = {}  # user_id -> latest status
+        self.metrics: Dict[str, int] = {
+            "submitted": 0,
+            "coalesced": 0,
+            "dispatched": 0,
+            "dropped": 0,
+            "errors": 0
+        }
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+    
+    def add_callback(self, callback: Callable):
+        """Register a presence callback"""
+        
+        self.callbacks.append(callback)
+        if self._loop is not None:
+            self._start_worker(callback)
+    
+    def submit(self, user_id: str, status: UserStatus):
+        """Queue a presence change, replacing any pending one for the user"""
+        
+        self.metrics["submitted"] += 1
+        if user_id in self.pending:
+            self.metrics["coalesced"] += 1
+        self.pending[user_id] = status
+        
+        self._ensure_workers()
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.coalesce_window, self._flush)
+    
+    async def drain(self):
+        """Dispatch pending changes now and wait until every callback has run"""
+        
+        if self._loop is not None:
+            self._ensure_workers()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush()
+        
+        await asyncio.gather(*(queue.join() for queue in self._queues))
+    
+    async def close(self):
+        """Drain outstanding notifications and stop the callback workers"""
+        
+        if self._loop is None:
+            return
+        
+        await self.drain()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        
+        self._queues = []
+        self._workers = []
+        self._loop = None
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get dispatch counters and current queue depths"""
+        
+        metrics: Dict[str, Any] = dict(self.metrics)
+        metrics["pending"] = len(self.pending)
+        metrics["queue_depths"] = [queue.qsize() for queue in self._queues]
+        return metrics
+    
+    def _ensure_workers(self):
+        """Bind queues, workers and the flush timer to the running event loop"""
+        
+        loop = loop_to_rebind(self._loop)
+        if loop is None:
+            return
+        
+        self._loop = loop
+        self._queues = []
+        self._workers = []
+        self._flush_handle = None
+        for callback in self.callbacks:
+            self._start_worker(callback)
+    
+    def _start_worker(self, callback: Callable):
+        """Create the bounded queue and worker task for a callback"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues.append(queue)
+        self._workers.append(self._loop.create_task(self._run_worker(callback, queue)))
+    
+    def _flush(self):
+        """Hand every pending change to each callback queue"""
+        
+        self._flush_handle = None
+        pending, self.pending = self.pending, {}
+        
+        for user_id, status in pending.items():
+            for queue in self._queues:
+                try:
+                    queue.put_nowait((user_id, status))
+                except asyncio.QueueFull:
+                    self.metrics["dropped"] += 1
+    
+    async def _run_worker(self, callback: Callable, queue: asyncio.Queue):
+        """Deliver queued changes to one callback"""
+        
+        while True:
+            user_id, status = await queue.get()
+            try:
+                await callback(user_id, status)
+                self.metrics["dispatched"] += 1
+            except Exception:
+                self.metrics["errors"] += 1
+                logger.exception("Error in presence callback %r", callback)
+            finally:
+                queue.task_done()
+
+class SenderProjectionCache:
+    """
+    LRU cache of the public sender block shown next to messages
+    Projections are shared between responses and must be treated as read-only.
+    """
+    
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()  # user_id -> projection
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a cached projection"""
+        
+        projection = self.entries.get(user_id)
+        if projection is None:
+            self.misses += 1
+            return None
+        
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        return projection
+    
+    def put(self, user_id: str, projection: Dict[str, Any]):
+        """Cache a projection, evicting the least recently used one when full"""
+        
+        self.entries[user_id] = projection
+        self.entries.move_to_end(user_id)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, user_id: str):
+        """Drop a projection after its profile changed"""
+        self.entries.pop(user_id, None)
+
 class UserManager:
     """Manages user profiles, authentication, and presence"""
     
-    def __init__(self):
+    SEARCH_FIELDS = ("username", "display_name", "bio")
+    ONLINE_STATUSES = (UserStatus.ONLINE, UserStatus.AWAY, UserStatus.BUSY)
+    
+    def __init__(self, session_idle_timeout: Optional[float] = 1800.0, expiry_tick: float = 1.0):
         self.users: Dict[str, UserProfile] = {}
         self.active_sessions: Dict[str, Dict[str, Any]] = {}
-        self.presence_callbacks: List[Callable] = []
+        self.user_sessions: Dict[str, Set[str]] = {}  # user_id -> session_ids
+        
+        # Idle session expiry (disabled when session_idle_timeout is None)
+        self.session_idle_timeout = session_idle_timeout
+        self.session_wheel = TimerWheel(
+            tick=expiry_tick,
+            slots=math.ceil((session_idle_timeout or expiry_tick) / expiry_tick) + 1
+        )
+        self._expiry_task: Optional[asyncio.Task] = None
+        
+        self.presence_dispatcher = PresenceDispatcher()
+        self.presence_callbacks: List[Callable] = self.presence_dispatcher.callbacks
+        self.search_index = TrigramIndex()
+        self.interest_index: Dict[str, Set[str]] = {}  # interest -> user_ids
+        self.sender_projections = SenderProjectionCache()
+        
+        # Presence index: status -> user_ids, plus sorted copies of the online
+        # statuses for cursor paging (offline users, the bulk, are never paged)
+        self.status_index: Dict[UserStatus, Set[str]] = {status: set() for status in UserStatus}
+        self.status_order: Dict[UserStatus, List[str]] = {status: [] for status in self.ONLINE_STATUSES}
     
     async def create_user(self, user_data: Dict[str, Any]) -> UserProfile:
         """Create a new user profile"""
@@ -156,20 +547,60 @@ class UserManager:
             preferences=user_data.get("preferences", {}),
             privacy_settings=user_data.get("privacy_settings", default_privacy),
             interests=user_data.get("interests", []),
-            metadata=user_data.get("metadata", {})
+            metadata=user_data.get("metadata") or None
         )
         
-        self.users[user_id] = user_profile
+        self.add_user(user_profile)
         
         # Initialize session
         await self.create_session(user_id)
         
         return user_profile
     
+    def add_user(self, user_profile: UserProfile):
+        """Store an existing profile and index it"""
+        
+        user_id = user_profile.user_id
+        previous = self.users.get(user_id)
+        self.users[user_id] = user_profile
+        self.sender_projections.invalidate(user_id)
+        
+        # Index searchable fields
+        self.search_index.update(
+            user_id,
+            self._search_texts(previous) if previous else [],
+            self._search_texts(user_profile)
+        )
+        self._index_interests(user_id, previous.interests if previous else [], user_profile.interests)
+        self._index_status(user_id, previous.status if previous else None, user_profile.status)
+    
     async def get_user(self, user_id: str) -> Optional[UserProfile]:
         """Get user profile by ID"""
         return self.users.get(user_id)
     
+    async def get_sender_projections(self, user_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get the public sender block for each distinct user id, None for unknown users"""
+        
+        projections: Dict[str, Optional[Dict[str, Any]]] = {}
+        
+        for user_id in user_ids:
+            if user_id in projections:
+                continue
+            
+            projection = self.sender_projections.get(user_id)
+            if projection is None:
+                user = self.users.get(user_id)
+                if user is not None:
+                    projection = {
+                        "user_id": user.user_id,
+                        "username": user.username,
+                        "display_name": user.display_name
+                    }
+                    self.sender_projections.put(user_id, projection)
+            projections[user_id] = projection
+        
+        return projections
+    
     async def update_user(self, user_id: str, updates: Dict[str, Any]) -> Optional[UserProfile]:
         """Update user profile"""
         
@@ -177,12 +608,24 @@ class UserManager:
             return None
         
         user = self.users[user_id]
+        old_texts = self._search_texts(user)
+        old_interests = list(user.interests)
+        old_status = user.status
         
         # Update allowed fields
         for field, value in updates.items():
             if hasattr(user, field) and field not in ["user_id", "created_at"]:
                 setattr(user, field, value)
         
+        # Keep search index and cached projections current
+        self.sender_projections.invalidate(user_id)
+        if any(field in updates for field in self.SEARCH_FIELDS):
+            self.search_index.update(user_id, old_texts, self._search_texts(user))
+        if "interests" in updates:
+            self._index_interests(user_id, old_interests, user.interests)
+        if user.status != old_status:
+            self._index_status(user_id, old_status, user.status)
+        
         # Update last active time
         user.last_active = time.time()
         
@@ -203,6 +646,7 @@ class UserManager:
         
         # Notify if status changed
         if old_status != status:
+            self._index_status(user_id, old_status, status)
             await self._notify_presence_change(user_id)
         
         return True
@@ -211,14 +655,22 @@ class UserManager:
         """Create a new user session"""
         
         session_id = str(uuid.uuid4())
+        now = time.time()
         
         self.active_sessions[session_id] = {
             "user_id": user_id,
-            "created_at": time.time(),
-            "last_activity": time.time(),
+            "created_at": now,
+            "last_activity": now,
             "metadata": {}
         }
         
+        if user_id not in self.user_sessions:
+            self.user_sessions[user_id] = set()
+        self.user_sessions[user_id].add(session_id)
+        
+        if self.session_idle_timeout is not None:
+            self.session_wheel.schedule(session_id, now + self.session_idle_timeout)
+        
         # Set user as online
         await self.set_user_status(user_id, UserStatus.ONLINE)
         
@@ -227,52 +679,239 @@ class UserManager:
     async def end_session(self, session_id: str) -> bool:
         """End a user session"""
         
-        if session_id not in self.active_sessions:
-            return False
+        return await self.end_sessions([session_id]) > 0
+    
+    async def end_sessions(self, session_ids: List[str]) -> int:
+        """End several sessions, sending at most one presence update per user"""
         
-        session = self.active_sessions[session_id]
-        user_id = session["user_id"]
+        offline_candidates = set()
+        ended = 0
         
-        # Remove session
-        del self.active_sessions[session_id]
+        for session_id in session_ids:
+            session = self.active_sessions.pop(session_id, None)
+            if session is None:
+                continue
+            
+            self.session_wheel.cancel(session_id)
+            
+            user_id = session["user_id"]
+            sessions = self.user_sessions.get(user_id)
+            if sessions is not None:
+                sessions.discard(session_id)
+                if not sessions:
+                    del self.user_sessions[user_id]
+            
+            offline_candidates.add(user_id)
+            ended += 1
+        
+        # Set users as offline once their last session is gone
+        for user_id in offline_candidates:
+            if user_id not in self.user_sessions:
+                await self.set_user_status(user_id, UserStatus.OFFLINE)
         
-        # Check if user has other active sessions
-        user_sessions = [s for s in self.active_sessions.values() if s["user_id"] == user_id]
+        return ended
+    
+    async def get_user_sessions(self, user_id: str) -> List[str]:
+        """Get the active session ids of a user"""
+        return list(self.user_sessions.get(user_id, ()))
+    
+    async def touch_session(self, session_id: str) -> bool:
+        """Record activity on a session, postponing its expiry"""
+        
+        session = self.active_sessions.get(session_id)
+        if session is None:
+            return False
         
-        if not user_sessions:
-            # Set user as offline if no other sessions
-            await self.set_user_status(user_id, UserStatus.OFFLINE)
+        # The wheel entry is left in place and rescheduled lazily when it fires
+        session["last_activity"] = time.time()
         
         return True
     
+    async def expire_sessions(self, now: Optional[float] = None) -> int:
+        """End sessions that have been idle longer than the timeout"""
+        
+        if self.session_idle_timeout is None:
+            return 0
+        
+        now = time.time() if now is None else now
+        expired = []
+        
+        for session_id in self.session_wheel.advance(now):
+            session = self.active_sessions.get(session_id)
+            if session is None:
+                continue
+            
+            deadline = session["last_activity"] + self.session_idle_timeout
+            if deadline > now:
+                self.session_wheel.schedule(session_id, deadline)
+            else:
+                expired.append(session_id)
+        
+        return await self.end_sessions(expired)
+    
+    def start_session_expiry(self):
+        """Start the background idle-session expiry task"""
+        
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._expiry_loop())
+    
+    async def stop_session_expiry(self):
+        """Stop the background idle-session expiry task"""
+        
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            try:
+                await self._expiry_task
+            except asyncio.CancelledError:
+                pass
+            self._expiry_task = None
+    
+    async def _expiry_loop(self):
+        """Advance the session wheel once per tick"""
+        
+        while True:
+            await asyncio.sleep(self.session_wheel.tick)
+            try:
+                await self.expire_sessions()
+            except Exception:
+                logger.exception("Error expiring sessions")
+    
     async def get_online_users(self) -> List[UserProfile]:
         """Get list of online users"""
         
         return [
-            user for user in self.users.values()
-            if user.status in [UserStatus.ONLINE, UserStatus.AWAY, UserStatus.BUSY]
+            self.users[user_id]
+            for status in self.ONLINE_STATUSES
+            for user_id in self.status_index[status]
         ]
     
-    async def search_users(self, query: str, filters: Dict[str, Any] = None) -> List[UserProfile]:
-        """Search for users based on query and filters"""
+    async def get_online_users_page(self, cursor: Optional[str] = None,
+                                    limit: int = 50) -> Tuple[List[UserProfile], Optional[str]]:
+        """
+        Get a page of online users ordered by user id
+        Pass the returned cursor back to get the next page; it is None on the last page.
+        """
+        
+        streams = []
+        for status in self.ONLINE_STATUSES:
+            order = self.status_order[status]
+            start = bisect.bisect_right(order, cursor) if cursor is not None else 0
+            streams.append(islice(order, start, None))
+        
+        page_ids = list(islice(heapq.merge(*streams), limit + 1))
+        next_cursor = page_ids[limit - 1] if len(page_ids) > limit else None
+        
+        return [self.users[user_id] for user_id in page_ids[:limit]], next_cursor
+    
+    async def get_status_counts(self) -> Dict[str, int]:
+        """Get the number of users in each presence status"""
+        return {status.value: len(user_ids) for status, user_ids in self.status_index.items()}
+    
+    def _index_status(self, user_id: str, old_status: Optional[UserStatus], new_status: UserStatus):
+        """Move a user between presence index buckets"""
+        
+        if old_status is not None and user_id in self.status_index[old_status]:
+            self.status_index[old_status].discard(user_id)
+            order = self.status_order.get(old_status)
+            if order is not None:
+                del order[bisect.bisect_left(order, user_id)]
+        
+        if user_id not in self.status_index[new_status]:
+            self.status_index[new_status].add(user_id)
+            order = self.status_order.get(new_status)
+            if order is not None:
+                bisect.insort(order, user_id)
+    
+    async def search_users(self, query: str, filters: Dict[str, Any] = None,
+                           limit: Optional[int] = None, offset: int = 0) -> List[UserProfile]:
+        """Search for users based on query and filters, best matches first"""
         
-        results = []
         query_lower = query.lower()
+        candidate_ids = self.search_index.candidates(query_lower)
         
-        for user in self.users.values():
-            # Check if query matches username, display name, or bio
-            if (query_lower in user.username.lower() or
-                query_lower in user.display_name.lower() or
-                (user.bio and query_lower in user.bio.lower())):
-                
-                # Apply filters if provided
-                if filters:
-                    if not self._user_matches_filters(user, filters):
-                        continue
-                
-                results.append(user)
+        if candidate_ids is None:
+            candidates = self.users.values()
+        else:
+            candidates = (self.users[user_id] for user_id in candidate_ids if user_id in self.users)
         
-        return results
+        ranked = []
+        
+        for user in candidates:
+            # Verify the match, trigram candidates may be false positives
+            rank = self._match_rank(user, query_lower)
+            if rank is None:
+                continue
+            
+            # Apply filters if provided
+            if filters:
+                if not self._user_matches_filters(user, filters):
+                    continue
+            
+            ranked.append((rank, user.username.lower(), user.user_id, user))
+        
+        ranked.sort(key=lambda entry: entry[:3])
+        
+        end = offset + limit if limit is not None else None
+        return [entry[3] for entry in ranked[offset:end]]
+    
+    async def get_common_interests(self, user_id: str, candidate_ids: List[str]) -> Dict[str, List[str]]:
+        """Get the interests each candidate shares with a user"""
+        
+        common: Dict[str, List[str]] = {candidate_id: [] for candidate_id in candidate_ids}
+        
+        user = self.users.get(user_id)
+        if not user:
+            return common
+        
+        candidates = set(candidate_ids)
+        for interest in user.interests:
+            for candidate_id in candidates.intersection(self.interest_index.get(interest, ())):
+                common[candidate_id].append(interest)
+        
+        return common
+    
+    def _index_interests(self, user_id: str, old_interests: List[str], new_interests: List[str]):
+        """Move a user between interest index postings"""
+        
+        old_set = set(old_interests)
+        new_set = set(new_interests)
+        
+        for interest in old_set - new_set:
+            posting = self.interest_index.get(interest)
+            if posting is not None:
+                posting.discard(user_id)
+                if not posting:
+                    del self.interest_index[interest]
+        
+        for interest in new_set - old_set:
+            if interest not in self.interest_index:
+                self.interest_index[interest] = set()
+            self.interest_index[interest].add(user_id)
+    
+    def _search_texts(self, user: UserProfile) -> List[Optional[str]]:
+        """Get the searchable texts of a user"""
+        return [getattr(user, field) for field in self.SEARCH_FIELDS]
+    
+    def _match_rank(self, user: UserProfile, query_lower: str) -> Optional[int]:
+        """Rank how well a user matches the query, None if it does not match"""
+        
+        username = user.username.lower()
+        if username == query_lower:
+            return 0
+        if username.startswith(query_lower):
+            return 1
+        
+        display_name = user.display_name.lower()
+        if display_name.startswith(query_lower):
+            return 2
+        if query_lower in username:
+            return 3
+        if query_lower in display_name:
+            return 4
+        if user.bio and query_lower in user.bio.lower():
+            return 5
+        
+        return None
     
     def _user_matches_filters(self, user: UserProfile, filters: Dict[str, Any]) -> bool:
         """Check if user matches the provided filters"""
@@ -297,22 +936,152 @@ class UserManager:
         if not user:
             return
         
-        for callback in self.presence_callbacks:
-            try:
-                await callback(user_id, user.status)
-            except Exception as e:
-                print(f"Error in presence callback: {e}")
+        # Dispatched concurrently after the coalesce window
+        self.presence_dispatcher.submit(user_id, user.status)
     
     def add_presence_callback(self, callback: Callable):
         """Add a callback for presence changes"""
-        self.presence_callbacks.append(callback)
+        self.presence_dispatcher.add_callback(callback)
+    
+    async def flush_presence(self):
+        """Wait until all pending presence notifications have been delivered"""
+        await self.presence_dispatcher.drain()
+    
+    def get_presence_metrics(self) -> Dict[str, Any]:
+        """Get presence dispatch metrics (coalesced, dropped, errors, ...)"""
+        return self.presence_dispatcher.get_metrics()
+
+class FriendGraphSnapshot:
+    """
+    Immutable compressed sparse row snapshot of the FRIEND graph
+    User ids are interned to integers; the friends of user i are
+    neighbors[offsets[i]:offsets[i + 1]]
+    """
+    
+    def __init__(self, user_ids: List[str], offsets: array, neighbors: array, version: int):
+        self.user_ids = user_ids
+        self.user_index: Dict[str, int] = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.version = version
+        self.built_at = time.time()
+    
+    @classmethod
+    def build(cls, connections: Dict[str, SocialConnection],
+              user_connections: Dict[str, Set[str]], version: int) -> "FriendGraphSnapshot":
+        """Build a snapshot from the live connection indexes"""
+        
+        user_ids: List[str] = []
+        user_index: Dict[str, int] = {}
+        
+        def intern(user_id: str) -> int:
+            index = user_index.get(user_id)
+            if index is None:
+                index = user_index[user_id] = len(user_ids)
+                user_ids.append(user_id)
+            return index
+        
+        adjacency: Dict[int, List[int]] = {}
+        for user_id, connection_ids in user_connections.items():
+            friends = [
+                intern(connections[connection_id].target_user_id)
+                for connection_id in connection_ids
+                if connections[connection_id].connection_type == ConnectionType.FRIEND
+            ]
+            if friends:
+                adjacency[intern(user_id)] = friends
+        
+        offsets = array("q", [0])
+        neighbors = array("q")
+        for index in range(len(user_ids)):
+            neighbors.extend(adjacency.get(index, ()))
+            offsets.append(len(neighbors))
+        
+        return cls(user_ids, offsets, neighbors, version)
+    
+    def suggest(self, user_id: str, limit: int = 10,
+                exclude: Optional[Set[str]] = None) -> List[Tuple[str, int]]:
+        """Get top friend-of-friend candidates ranked by mutual friend count"""
+        
+        index = self.user_index.get(user_id)
+        if index is None:
+            return []
+        
+        excluded = {index}
+        excluded.update(self.neighbors[self.offsets[index]:self.offsets[index + 1]])
+        for excluded_id in exclude or ():
+            if excluded_id in self.user_index:
+                excluded.add(self.user_index[excluded_id])
+        
+        if np is not None:
+            scored = self._score_vectorized(index, excluded, limit)
+        else:
+            scored = self._score_counter(index, excluded, limit)
+        
+        return [(self.user_ids[candidate], count) for candidate, count in scored]
+    
+    def _score_vectorized(self, index: int, excluded: Set[int], limit: int) -> List[Tuple[int, int]]:
+        """Score candidates with a single bincount over all friends' neighbor ranges"""
+        
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        neighbors = np.frombuffer(self.neighbors, dtype=np.int64)
+        
+        friends = neighbors[offsets[index]:offsets[index + 1]]
+        starts = offsets[friends]
+        lengths = offsets[friends + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return []
+        
+        # Gather every friend's neighbor slice into one flat index array
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        counts = np.bincount(neighbors[positions], minlength=len(self.user_ids))
+        counts[np.fromiter(excluded, dtype=np.int64, count=len(excluded))] = 0
+        
+        candidates = np.flatnonzero(counts)
+        if len(candidates) > limit:
+            # Keep everything above the limit-th best count, then the lowest
+            # ids among the ties, matching the Counter fallback exactly
+            candidate_counts = counts[candidates]
+            kth = len(candidates) - limit
+            threshold = np.partition(candidate_counts, kth)[kth]
+            above = candidates[candidate_counts > threshold]
+            tied = candidates[candidate_counts == threshold][:limit - len(above)]
+            candidates = np.concatenate((above, tied))
+        
+        scored = [(int(candidate), int(counts[candidate])) for candidate in candidates]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored
+    
+    def _score_counter(self, index: int, excluded: Set[int], limit: int) -> List[Tuple[int, int]]:
+        """Score candidates by counting neighbor slices without NumPy"""
+        
+        offsets = self.offsets
+        neighbors = self.neighbors
+        counts: Counter = Counter()
+        
+        for friend in neighbors[offsets[index]:offsets[index + 1]]:
+            counts.update(neighbors[offsets[friend]:offsets[friend + 1]])
+        
+        for candidate in excluded:
+            counts.pop(candidate, None)
+        
+        return heapq.nsmallest(limit, counts.items(), key=lambda item: (-item[1], item[0]))
 
 class ConnectionManager:
     """Manages social connections between users"""
     
-    def __init__(self):
+    def __init__(self, friend_graph_interval: float = 60.0):
         self.connections: Dict[str, SocialConnection] = {}
         self.user_connections: Dict[str, Set[str]] = {}  # user_id -> connection_ids
+        self.pair_connections: Dict[Tuple[str, str], List[str]] = {}  # (user_id, target_user_id) -> connection_ids, oldest first
+        self.inbound_connections: Dict[str, Set[str]] = {}  # target_user_id -> source user_ids
+        
+        # Friend graph snapshot, rebuilt in the background every friend_graph_interval seconds
+        self.friend_graph: Optional[FriendGraphSnapshot] = None
+        self.friend_graph_version = 0
+        self.friend_graph_interval = friend_graph_interval
+        self._friend_graph_task: Optional[asyncio.Task] = None
     
     async def create_connection(self, user_id: str, target_user_id: str, 
                               connection_type: ConnectionType) -> SocialConnection:
@@ -334,6 +1103,17 @@ class ConnectionManager:
             connection.mutual = True
             reverse_connection.mutual = True
         
+        self.add_connection(connection)
+        
+        return connection
+    
+    def add_connection(self, connection: SocialConnection):
+        """Store an existing connection and index it"""
+        
+        connection_id = connection.connection_id
+        user_id = connection.user_id
+        target_user_id = connection.target_user_id
+        
         self.connections[connection_id] = connection
         
         # Update user connections index
@@ -341,18 +1121,32 @@ class ConnectionManager:
             self.user_connections[user_id] = set()
         self.user_connections[user_id].add(connection_id)
         
-        return connection
+        # Update pair and inbound indexes
+        self.pair_connections.setdefault((user_id, target_user_id), []).append(connection_id)
+        if target_user_id not in self.inbound_connections:
+            self.inbound_connections[target_user_id] = set()
+        self.inbound_connections[target_user_id].add(user_id)
+        
+        if connection.connection_type == ConnectionType.FRIEND:
+            self.friend_graph_version += 1
     
-    async def get_connection(self, user_id: str, target_user_id: str) -> Optional[SocialConnection]:
-        """Get connection between two users"""
+    async def get_connection(self, user_id: str, target_user_id: str,
+                             connection_type: Optional[ConnectionType] = None) -> Optional[SocialConnection]:
+        """Get the newest connection between two users, optionally of one type"""
         
-        user_connection_ids = self.user_connections.get(user_id, set())
+        connection_id = self._pair_connection_id(user_id, target_user_id, connection_type)
+        if connection_id is None:
+            return None
         
-        for connection_id in user_connection_ids:
-            connection = self.connections.get(connection_id)
-            if connection and connection.target_user_id == target_user_id:
-                return connection
+        return self.connections.get(connection_id)
+    
+    def _pair_connection_id(self, user_id: str, target_user_id: str,
+                            connection_type: Optional[ConnectionType] = None) -> Optional[str]:
+        """Get the id of the newest connection between two users, optionally of one type"""
         
+        for connection_id in reversed(self.pair_connections.get((user_id, target_user_id), ())):
+            if connection_type is None or self.connections[connection_id].connection_type == connection_type:
+                return connection_id
         return None
     
     async def get_user_connections(self, user_id: str, 
@@ -370,6 +1164,25 @@ class ConnectionManager:
         
         return connections
     
+    async def get_inbound_connections(self, target_user_id: str,
+                                    connection_type: Optional[ConnectionType] = None) -> List[SocialConnection]:
+        """Get all connections pointing at a user (e.g. followers)"""
+        
+        source_user_ids = self.inbound_connections.get(target_user_id, set())
+        connections = []
+        
+        for source_user_id in source_user_ids:
+            for connection_id in self.pair_connections[(source_user_id, target_user_id)]:
+                connection = self.connections[connection_id]
+                if connection_type is None or connection.connection_type == connection_type:
+                    connections.append(connection)
+        
+        return connections
+    
+    async def get_inbound_count(self, target_user_id: str) -> int:
+        """Get the number of users connected to a user"""
+        return len(self.inbound_connections.get(target_user_id, ()))
+    
     async def update_connection_strength(self, connection_id: str, strength: float) -> bool:
         """Update connection strength based on interactions"""
         
@@ -390,6 +1203,7 @@ class ConnectionManager:
         
         connection = self.connections[connection_id]
         user_id = connection.user_id
+        target_user_id = connection.target_user_id
         
         # Remove from connections
         del self.connections[connection_id]
@@ -398,6 +1212,21 @@ class ConnectionManager:
         if user_id in self.user_connections:
             self.user_connections[user_id].discard(connection_id)
         
+        if connection.connection_type == ConnectionType.FRIEND:
+            self.friend_graph_version += 1
+        
+        # Update pair and inbound indexes
+        pair = (user_id, target_user_id)
+        pair_ids = self.pair_connections.get(pair)
+        if pair_ids is not None and connection_id in pair_ids:
+            pair_ids.remove(connection_id)
+            if not pair_ids:
+                del self.pair_connections[pair]
+                if target_user_id in self.inbound_connections:
+                    self.inbound_connections[target_user_id].discard(user_id)
+                    if not self.inbound_connections[target_user_id]:
+                        del self.inbound_connections[target_user_id]
+        
         return True
     
     async def get_mutual_connections(self, user_id: str, target_user_id: str) -> List[str]:
@@ -411,26 +1240,168 @@ class ConnectionManager:
         
         return list(user_friends.intersection(target_friends))
     
+    async def count_mutuals(self, user_id: str, candidate_ids: List[str]) -> Dict[str, int]:
+        """Count mutual friends between a user and each candidate in one pass"""
+        
+        user_friends = {
+            conn.target_user_id
+            for conn in await self.get_user_connections(user_id, ConnectionType.FRIEND)
+        }
+        counts: Dict[str, int] = {}
+        
+        for candidate_id in candidate_ids:
+            candidate_connection_ids = self.user_connections.get(candidate_id, set())
+            count = 0
+            
+            # Walk whichever side is smaller; both count distinct FRIEND targets only
+            if len(candidate_connection_ids) <= len(user_friends):
+                mutuals = set()
+                for connection_id in candidate_connection_ids:
+                    connection = self.connections[connection_id]
+                    if (connection.connection_type == ConnectionType.FRIEND and
+                        connection.target_user_id in user_friends):
+                        mutuals.add(connection.target_user_id)
+                count = len(mutuals)
+            else:
+                for friend_id in user_friends:
+                    if self._pair_connection_id(candidate_id, friend_id, ConnectionType.FRIEND) is not None:
+                        count += 1
+            
+            counts[candidate_id] = count
+        
+        return counts
+    
     async def suggest_connections(self, user_id: str, limit: int = 10) -> List[str]:
         """Suggest new connections based on mutual friends and interests"""
         
-        suggestions = []
-        user_connections = await self.get_user_connections(user_id, ConnectionType.FRIEND)
-        user_friends = {conn.target_user_id for conn in user_connections}
+        scored = await self.suggest_connections_scored(user_id, limit)
+        return [candidate_id for candidate_id, _ in scored]
+    
+    async def suggest_connections_scored(self, user_id: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Suggest friends of friends with their mutual friend counts, best first"""
+        
+        # The snapshot may lag behind; never suggest someone already befriended since
+        live_friends = {
+            conn.target_user_id
+            for conn in await self.get_user_connections(user_id, ConnectionType.FRIEND)
+        }
+        
+        return self.get_friend_graph().suggest(user_id, limit, exclude=live_friends)
+    
+    def get_friend_graph(self) -> FriendGraphSnapshot:
+        """
+        Get the friend graph snapshot
+        While the background refresher runs the request path never rebuilds,
+        except for the very first snapshot; without it a stale snapshot is
+        rebuilt here once it is old enough.
+        """
+        
+        snapshot = self.friend_graph
+        if snapshot is None:
+            return self.refresh_friend_graph()
+        
+        refreshing = self._friend_graph_task is not None and not self._friend_graph_task.done()
+        if (not refreshing and snapshot.version != self.friend_graph_version and
+                time.time() - snapshot.built_at >= self.friend_graph_interval):
+            snapshot = self.refresh_friend_graph()
+        
+        return snapshot
+    
+    def start_friend_graph_refresh(self):
+        """Start the background friend graph refresh task"""
+        
+        if self._friend_graph_task is None or self._friend_graph_task.done():
+            self._friend_graph_task = asyncio.create_task(self._friend_graph_loop())
+    
+    async def stop_friend_graph_refresh(self):
+        """Stop the background friend graph refresh task"""
+        
+        if self._friend_graph_task is not None:
+            self._friend_graph_task.cancel()
+            try:
+                await self._friend_graph_task
+            except asyncio.CancelledError:
+                pass
+            self._friend_graph_task = None
+    
+    async def _friend_graph_loop(self):
+        """Rebuild the friend graph snapshot once per interval when connections changed"""
+        
+        while True:
+            await asyncio.sleep(self.friend_graph_interval)
+            try:
+                if self.friend_graph is None or self.friend_graph.version != self.friend_graph_version:
+                    self.refresh_friend_graph()
+            except Exception:
+                logger.exception("Error rebuilding friend graph")
+    
+    def refresh_friend_graph(self) -> FriendGraphSnapshot:
+        """Rebuild the friend graph snapshot immediately"""
+        
+        self.friend_graph = FriendGraphSnapshot.build(
+            self.connections, self.user_connections, self.friend_graph_version
+        )
+        return self.friend_graph
+
+class OccupancyHeap:
+    """
+    Rooms ordered by occupancy, highest first, ties by room id
+    A binary heap with lazy deletion: an update pushes a new entry and
+    leaves the old one behind, to be skipped when read and dropped when
+    stale entries outnumber live ones. Reading the top k walks the heap
+    best-first without popping.
+    """
+    
+    def __init__(self):
+        self.heap: List[Tuple[int, str]] = []  # (-occupancy, room_id), possibly stale
+        self.current: Dict[str, int] = {}  # room_id -> occupancy
+    
+    def __len__(self) -> int:
+        return len(self.current)
+    
+    def __contains__(self, room_id: str) -> bool:
+        return room_id in self.current
+    
+    def set(self, room_id: str, occupancy: int):
+        """Insert a room or move it to a new occupancy"""
         
-        # Find friends of friends
-        for friend_id in user_friends:
-            friend_connections = await self.get_user_connections(friend_id, ConnectionType.FRIEND)
+        if self.current.get(room_id) == occupancy:
+            return
+        self.current[room_id] = occupancy
+        heapq.heappush(self.heap, (-occupancy, room_id))
+        self._maybe_compact()
+    
+    def discard(self, room_id: str):
+        """Remove a room if present"""
+        
+        if self.current.pop(room_id, None) is not None:
+            self._maybe_compact()
+    
+    def iter_top(self):
+        """Yield live (-occupancy, room_id) entries in order"""
+        
+        heap = self.heap
+        current = self.current
+        seen: Set[str] = set()
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
             
-            for friend_conn in friend_connections:
-                potential_friend = friend_conn.target_user_id
-                
-                # Skip if already connected or is the user themselves
-                if potential_friend != user_id and potential_friend not in user_friends:
-                    if potential_friend not in suggestions:
-                        suggestions.append(potential_friend)
+            # A room can have several entries with its current occupancy
+            room_id = entry[1]
+            if current.get(room_id) == -entry[0] and room_id not in seen:
+                seen.add(room_id)
+                yield entry
+    
+    def _maybe_compact(self):
+        """Rebuild the heap from live entries once stale ones dominate"""
         
-        return suggestions[:limit]
+        if len(self.heap) > 2 * len(self.current) + 64:
+            self.heap = [(-occupancy, room_id) for room_id, occupancy in self.current.items()]
+            heapq.heapify(self.heap)
 
 class RoomManager:
     """Manages social rooms and spaces"""
@@ -439,6 +1410,19 @@ class RoomManager:
         self.rooms: Dict[str, SocialRoom] = {}
         self.user_rooms: Dict[str, Set[str]] = {}  # user_id -> room_ids
         self.room_callbacks: List[Callable] = []
+        self.membership_callbacks: List[Callable] = []
+        
+        # Search indexes: trigrams over name/description/tags, exact tag and type postings
+        self.search_index = TrigramIndex()
+        self.tag_index: Dict[str, Set[str]] = {}  # tag -> room_ids
+        self.type_index: Dict[RoomType, Set[str]] = {room_type: set() for room_type in RoomType}
+        self.room_positions: Dict[str, int] = {}  # room_id -> creation order
+        self.next_position = 0
+        
+        # Occupancy order, rooms with space kept apart from full ones
+        self.open_rooms: Set[str] = set()
+        self.open_order = OccupancyHeap()
+        self.full_order = OccupancyHeap()
     
     async def create_room(self, room_data: Dict[str, Any]) -> SocialRoom:
         """Create a new social room"""
@@ -454,16 +1438,40 @@ class RoomManager:
             capacity=room_data.get("capacity", 50),
             settings=room_data.get("settings", {}),
             tags=room_data.get("tags", []),
-            metadata=room_data.get("metadata", {})
+            metadata=room_data.get("metadata") or None
         )
         
         # Add owner as moderator
         room.moderators.add(room.owner_id)
         
-        self.rooms[room_id] = room
+        self.add_room(room)
         
         return room
     
+    def add_room(self, room: SocialRoom):
+        """Store an existing room and index its members"""
+        
+        # Replacing a room keeps its place in the creation order, as the dict does
+        position = self.room_positions.get(room.room_id, self.next_position)
+        existing = self.rooms.get(room.room_id)
+        if existing is not None:
+            self._unindex_room(existing)
+        else:
+            self.next_position += 1
+        self.rooms[room.room_id] = room
+        
+        for user_id in room.current_users:
+            if user_id not in self.user_rooms:
+                self.user_rooms[user_id] = set()
+            self.user_rooms[user_id].add(room.room_id)
+        
+        self.search_index.add(room.room_id, self.search_index.grams(self._search_texts(room)))
+        for tag in set(room.tags):
+            self.tag_index.setdefault(tag, set()).add(room.room_id)
+        self.type_index[room.room_type].add(room.room_id)
+        self.room_positions[room.room_id] = position
+        self._index_occupancy(room, None)
+    
     async def get_room(self, room_id: str) -> Optional[SocialRoom]:
         """Get room by ID"""
         return self.rooms.get(room_id)
@@ -480,7 +1488,9 @@ class RoomManager:
             return False
         
         # Add user to room
+        previous = len(room.current_users)
         room.current_users.add(user_id)
+        self._index_occupancy(room, previous)
         
         # Update user rooms index
         if user_id not in self.user_rooms:
@@ -500,8 +1510,10 @@ class RoomManager:
             return False
         
         # Remove user from room
+        previous = len(room.current_users)
         room.current_users.discard(user_id)
         room.moderators.discard(user_id)
+        self._index_occupancy(room, previous)
         
         # Update user rooms index
         if user_id in self.user_rooms:
@@ -517,48 +1529,184 @@ class RoomManager:
         
         return True
     
-    async def get_user_rooms(self, user_id: str) -> List[SocialRoom]:
-        """Get all rooms a user is in"""
+    async def join_room_many(self, room_id: str, user_ids: Iterable[str],
+                             actor_id: Optional[str] = None) -> List[str]:
+        """
+        Add many users to a room in one pass
+        Users are admitted in order while there is space; members already in
+        the room are skipped. Callbacks see one membership delta instead of
+        one event per user. Returns the ids that joined.
+        """
         
-        user_room_ids = self.user_rooms.get(user_id, set())
-        return [self.rooms[room_id] for room_id in user_room_ids if room_id in self.rooms]
-    
-    async def search_rooms(self, query: str, filters: Dict[str, Any] = None) -> List[SocialRoom]:
-        """Search for rooms"""
+        room = self.rooms.get(room_id)
+        if not room:
+            return []
+        
+        previous = len(room.current_users)
+        space = room.capacity - previous
+        joined = []
+        for user_id in user_ids:
+            if len(joined) >= space:
+                break
+            if user_id in room.current_users:
+                continue
+            room.current_users.add(user_id)
+            joined.append(user_id)
+            
+            if user_id not in self.user_rooms:
+                self.user_rooms[user_id] = set()
+            self.user_rooms[user_id].add(room_id)
         
-        results = []
-        query_lower = query.lower()
+        if joined:
+            self._index_occupancy(room, previous)
+            await self._notify_membership_delta(room_id, joined, [], actor_id or room.owner_id)
         
-        for room in self.rooms.values():
-            # Check if query matches name, description, or tags
-            if (query_lower in room.name.lower() or
-                query_lower in room.description.lower() or
-                any(query_lower in tag.lower() for tag in room.tags)):
-                
-                # Apply filters if provided
-                if filters:
-                    if not self._room_matches_filters(room, filters):
-                        continue
-                
-                results.append(room)
+        return joined
+    
+    async def leave_room_many(self, room_id: str, user_ids: Iterable[str],
+                              actor_id: Optional[str] = None) -> List[str]:
+        """
+        Remove many users from a room in one pass
+        Callbacks see one membership delta; a temporary room left empty is
+        deleted afterwards. Returns the ids that left.
+        """
+        
+        room = self.rooms.get(room_id)
+        if not room:
+            return []
+        
+        previous = len(room.current_users)
+        left = []
+        for user_id in user_ids:
+            if user_id not in room.current_users:
+                continue
+            room.current_users.discard(user_id)
+            room.moderators.discard(user_id)
+            left.append(user_id)
+            
+            if user_id in self.user_rooms:
+                self.user_rooms[user_id].discard(room_id)
+        
+        if not left:
+            return left
+        
+        self._index_occupancy(room, previous)
+        await self._notify_membership_delta(room_id, [], left, actor_id or room.owner_id)
+        
+        # Delete room if empty and temporary
+        if room.room_type == RoomType.TEMPORARY and not room.current_users:
+            await self.delete_room(room_id)
+        
+        return left
+    
+    async def evacuate_room(self, room_id: str, actor_id: Optional[str] = None) -> List[str]:
+        """Remove every member of a room with a single membership delta"""
+        
+        room = self.rooms.get(room_id)
+        if not room:
+            return []
+        return await self.leave_room_many(room_id, list(room.current_users), actor_id)
+    
+    async def get_user_rooms(self, user_id: str) -> List[SocialRoom]:
+        """Get all rooms a user is in"""
+        
+        user_room_ids = self.user_rooms.get(user_id, set())
+        return [self.rooms[room_id] for room_id in user_room_ids if room_id in self.rooms]
+    
+    async def search_rooms(self, query: str, filters: Dict[str, Any] = None) -> List[SocialRoom]:
+        """Search for rooms, in creation order"""
+        
+        query_lower = query.lower()
+        
+        # Filters narrow the candidates by set intersection, smallest set first
+        postings = self._filter_postings(filters) if filters else []
+        query_ids = self.search_index.candidates(query_lower)
+        if query_ids is not None:
+            postings.append(query_ids)
+        
+        if not postings:
+            return list(self.rooms.values())
+        
+        postings.sort(key=len)
+        room_ids = set(postings[0])
+        for posting in postings[1:]:
+            room_ids.intersection_update(posting)
+            if not room_ids:
+                return []
+        
+        results = []
+        for room_id in sorted(room_ids, key=self.room_positions.__getitem__):
+            room = self.rooms[room_id]
+            # Verify the match, trigram candidates may be false positives
+            if query_ids is None or any(query_lower in text.lower() for text in self._search_texts(room)):
+                results.append(room)
         
         return results
     
-    def _room_matches_filters(self, room: SocialRoom, filters: Dict[str, Any]) -> bool:
-        """Check if room matches the provided filters"""
+    async def get_popular_rooms(self, limit: int = 10, has_space: bool = False) -> List[SocialRoom]:
+        """Get the most occupied rooms; with has_space, full rooms are never visited"""
+        
+        if has_space:
+            entries = list(islice(self.open_order.iter_top(), limit))
+        else:
+            entries = list(islice(heapq.merge(self.full_order.iter_top(), self.open_order.iter_top()), limit))
+        return [self.rooms[room_id] for _, room_id in entries]
+    
+    def _filter_postings(self, filters: Dict[str, Any]) -> List[Set[str]]:
+        """Get the room id set each filter allows"""
+        
+        postings = []
         
         for filter_key, filter_value in filters.items():
             if filter_key == "room_type":
-                if room.room_type != RoomType(filter_value):
-                    return False
+                postings.append(self.type_index[RoomType(filter_value)])
             elif filter_key == "has_space":
-                if filter_value and len(room.current_users) >= room.capacity:
-                    return False
+                if filter_value:
+                    postings.append(self.open_rooms)
             elif filter_key == "tags":
-                if not any(tag in room.tags for tag in filter_value):
-                    return False
+                tagged = set()
+                for tag in filter_value:
+                    tagged.update(self.tag_index.get(tag, ()))
+                postings.append(tagged)
         
-        return True
+        return postings
+    
+    def _search_texts(self, room: SocialRoom) -> List[str]:
+        """Get the searchable texts of a room"""
+        return [room.name, room.description, *room.tags]
+    
+    def _index_occupancy(self, room: SocialRoom, previous: Optional[int]):
+        """Move a room within the occupancy order; previous is None for unindexed rooms"""
+        
+        occupancy = len(room.current_users)
+        if previous == occupancy:
+            return
+        
+        if occupancy < room.capacity:
+            self.full_order.discard(room.room_id)
+            self.open_rooms.add(room.room_id)
+            self.open_order.set(room.room_id, occupancy)
+        else:
+            self.open_order.discard(room.room_id)
+            self.open_rooms.discard(room.room_id)
+            self.full_order.set(room.room_id, occupancy)
+    
+    def _unindex_room(self, room: SocialRoom):
+        """Drop a room from the search and occupancy indexes"""
+        
+        self.search_index.remove(room.room_id, self.search_index.grams(self._search_texts(room)))
+        for tag in set(room.tags):
+            posting = self.tag_index.get(tag)
+            if posting is not None:
+                posting.discard(room.room_id)
+                if not posting:
+                    del self.tag_index[tag]
+        self.type_index[room.room_type].discard(room.room_id)
+        del self.room_positions[room.room_id]
+        
+        self.open_order.discard(room.room_id)
+        self.full_order.discard(room.room_id)
+        self.open_rooms.discard(room.room_id)
     
     async def add_moderator(self, room_id: str, user_id: str, moderator_id: str) -> bool:
         """Add a moderator to a room"""
@@ -581,11 +1729,15 @@ class RoomManager:
         if not room:
             return False
         
-        # Remove all users from room
-        for user_id in list(room.current_users):
-            await self.leave_room(room_id, user_id)
+        # Remove all users from room, one membership delta for all of them
+        await self.evacuate_room(room_id)
+        
+        # A temporary room is deleted by its last leave
+        if room_id not in self.rooms:
+            return True
         
         # Delete room
+        self._unindex_room(room)
         del self.rooms[room_id]
         
         return True
@@ -602,15 +1754,1319 @@ class RoomManager:
     def add_room_callback(self, callback: Callable):
         """Add a callback for room events"""
         self.room_callbacks.append(callback)
+    
+    async def _notify_membership_delta(self, room_id: str, joined: List[str], left: List[str], actor_id: str):
+        """Notify callbacks about a bulk membership change"""
+        
+        for callback in self.membership_callbacks:
+            try:
+                await callback(room_id, joined, left, actor_id)
+            except Exception:
+                logger.exception("Error in membership callback")
+    
+    def add_membership_callback(self, callback: Callable):
+        """Add a callback for bulk membership changes: (room_id, joined, left, actor_id)"""
+        self.membership_callbacks.append(callback)
 
-class MessageManager:
-    """Manages messaging and communication"""
+class MessageStore(ABC):
+    """Durable storage backend for messages beyond the in-memory hot tail"""
+    
+    async def open(self):
+        """Open the backend"""
+        pass
+    
+    async def close(self):
+        """Flush pending writes and close the backend"""
+        pass
+    
+    async def flush(self):
+        """Wait until all queued writes are durable"""
+        pass
+    
+    @abstractmethod
+    async def insert(self, message: Message, seq: Optional[int] = None):
+        """Queue a new message, with its room sequence number if it has one"""
+        pass
+    
+    @abstractmethod
+    async def update(self, message: Message):
+        """Queue an update of a stored message"""
+        pass
+    
+    @abstractmethod
+    async def delete(self, message_id: str):
+        """Queue a message deletion"""
+        pass
+    
+    @abstractmethod
+    async def get(self, message_id: str) -> Optional[Message]:
+        """Load a message by ID"""
+        pass
+    
+    async def get_many(self, message_ids: List[str]) -> List[Message]:
+        """Load several messages by ID, skipping missing ones"""
+        
+        messages = []
+        for message_id in message_ids:
+            message = await self.get(message_id)
+            if message is not None:
+                messages.append(message)
+        return messages
+    
+    @abstractmethod
+    async def get_room_page(self, room_id: str, before_seq: Optional[int] = None, limit: int = 50,
+                            before_timestamp: Optional[float] = None) -> List[Tuple[int, Message]]:
+        """Load (seq, message) pairs of a room older than before_seq, newest first"""
+        pass
+    
+    @abstractmethod
+    async def get_room_head(self, room_id: str) -> int:
+        """Get the next unused sequence number of a room"""
+        pass
+    
+    @abstractmethod
+    async def get_recipient_messages(self, user_id: str, limit: int = 50) -> List[Message]:
+        """Load direct messages for a user, newest first"""
+        pass
+    
+    @abstractmethod
+    def iter_messages(self, direct_only: bool = False, batch_size: int = 1000) -> AsyncIterator[List[Message]]:
+        """Yield every stored message in the order it was inserted, a batch at a time"""
+        pass
+
+class SQLiteMessageStore(MessageStore):
+    """
+    SQLite message store in WAL mode with group commit
+    Writes are queued and a background writer commits everything queued
+    within commit_interval seconds as one transaction. Reads use a separate
+    connection (WAL allows readers alongside the writer). Every uncommitted
+    write is counted under the message, room and recipient it touches, and
+    a read only waits for the queue when one of the keys it reads is still
+    pending, so it never misses a message that left the hot tail.
+    """
+    
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "message_id TEXT PRIMARY KEY, room_id TEXT, seq INTEGER, "
+        "recipient_id TEXT, timestamp REAL NOT NULL, payload TEXT NOT NULL)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS messages_room_seq ON messages (room_id, seq) "
+        "WHERE room_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS messages_recipient ON messages (recipient_id, timestamp) "
+        "WHERE recipient_id IS NOT NULL",
+    )
+    
+    def __init__(self, path: str, commit_interval: float = 0.005, max_pending: int = 10000):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._write_executor: Optional[ThreadPoolExecutor] = None
+        self._read_executor: Optional[ThreadPoolExecutor] = None
+        self._pending: List[Tuple[str, tuple, tuple]] = []  # (op, params, keys)
+        self._pending_keys: Counter = Counter()  # keys of queued and in-flight writes
+        self._pending_done: Optional[asyncio.Future] = None
+        self._in_flight: Optional[asyncio.Future] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._open_lock = asyncio.Lock()
+        self.metrics = {"queued": 0, "batches": 0, "committed": 0, "read_flushes": 0}
+    
+    async def open(self):
+        """Open both connections and start the writer"""
+        
+        # open() awaits before _writer is set; the lock keeps concurrent
+        # first callers from creating a second pair of connections
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            
+            self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-store-writer")
+            self._read_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-store-reader")
+            loop = asyncio.get_running_loop()
+            self._write_conn = await loop.run_in_executor(self._write_executor, self._connect, True)
+            self._read_conn = await loop.run_in_executor(self._read_executor, self._connect, False)
+            
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._run_writer())
+    
+    async def close(self):
+        """Commit queued writes, stop the writer and close the connections"""
+        
+        if self._writer is None:
+            return
+        
+        await self.flush()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._writer = None
+        
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._write_executor, self._write_conn.close)
+        await loop.run_in_executor(self._read_executor, self._read_conn.close)
+        self._write_executor.shutdown()
+        self._read_executor.shutdown()
+    
+    async def flush(self):
+        """Wait for the current batch and everything queued before this call"""
+        
+        if self._pending:
+            if self._pending_done is None:
+                self._pending_done = asyncio.get_running_loop().create_future()
+            self._wakeup.set()
+            await asyncio.shield(self._pending_done)
+        elif self._in_flight is not None:
+            await asyncio.shield(self._in_flight)
+    
+    async def insert(self, message: Message, seq: Optional[int] = None):
+        """Queue a new message"""
+        
+        await self._enqueue("insert", (
+            message.message_id, message.room_id, seq, message.recipient_id,
+            message.timestamp, self._encode(message)
+        ), self._message_keys(message))
+    
+    async def update(self, message: Message):
+        """Queue an update of a stored message"""
+        await self._enqueue("update", (self._encode(message), message.message_id), self._message_keys(message))
+    
+    async def delete(self, message_id: str):
+        """Queue a message deletion"""
+        # The room and recipient of a deleted message are unknown here, so a
+        # pending delete makes every room and recipient read wait
+        await self._enqueue("delete", (message_id,), (("message", message_id), ("delete", None)))
+    
+    async def get(self, message_id: str) -> Optional[Message]:
+        """Load a message by ID"""
+        
+        rows = await self._query("SELECT payload FROM messages WHERE message_id = ?", (message_id,),
+                                 (("message", message_id),))
+        return self._decode(rows[0][0]) if rows else None
+    
+    async def get_many(self, message_ids: List[str]) -> List[Message]:
+        """Load several messages by ID with one query per 500 ids"""
+        
+        messages = []
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            rows = await self._query(
+                f"SELECT payload FROM messages WHERE message_id IN ({', '.join('?' * len(chunk))})", tuple(chunk),
+                tuple(("message", message_id) for message_id in chunk)
+            )
+            messages.extend(self._decode(payload) for payload, in rows)
+        return messages
+    
+    async def get_room_page(self, room_id: str, before_seq: Optional[int] = None, limit: int = 50,
+                            before_timestamp: Optional[float] = None) -> List[Tuple[int, Message]]:
+        """Load a page of room history from the (room_id, seq) index"""
+        
+        sql = "SELECT seq, payload FROM messages WHERE room_id = ?"
+        params: List[Any] = [room_id]
+        if before_seq is not None:
+            sql += " AND seq < ?"
+            params.append(before_seq)
+        if before_timestamp is not None:
+            sql += " AND timestamp < ?"
+            params.append(before_timestamp)
+        sql += " ORDER BY seq DESC LIMIT ?"
+        params.append(limit)
+        
+        rows = await self._query(sql, tuple(params), (("room", room_id), ("delete", None)))
+        return [(seq, self._decode(payload)) for seq, payload in rows]
+    
+    async def get_room_head(self, room_id: str) -> int:
+        """Get the next unused sequence number of a room"""
+        
+        rows = await self._query("SELECT MAX(seq) FROM messages WHERE room_id = ?", (room_id,),
+                                 (("room", room_id), ("delete", None)))
+        return rows[0][0] + 1 if rows and rows[0][0] is not None else 0
+    
+    async def get_recipient_messages(self, user_id: str, limit: int = 50) -> List[Message]:
+        """Load direct messages for a user, newest first"""
+        
+        rows = await self._query(
+            "SELECT payload FROM messages WHERE recipient_id = ? ORDER BY timestamp DESC LIMIT ?",
+            (user_id, limit), (("recipient", user_id), ("delete", None))
+        )
+        return [self._decode(payload) for payload, in rows]
+    
+    async def iter_messages(self, direct_only: bool = False, batch_size: int = 1000) -> AsyncIterator[List[Message]]:
+        """Yield every stored message in rowid (insertion) order, a batch at a time"""
+        
+        await self.flush()
+        sql = "SELECT rowid, payload FROM messages WHERE rowid > ?"
+        if direct_only:
+            sql += " AND room_id IS NULL"
+        sql += " ORDER BY rowid LIMIT ?"
+        
+        last_rowid = 0
+        while True:
+            rows = await self._query(sql, (last_rowid, batch_size), ())
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [self._decode(payload) for _, payload in rows]
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """Get write batching metrics"""
+        
+        metrics = dict(self.metrics)
+        metrics["pending"] = len(self._pending)
+        metrics["average_batch"] = metrics["committed"] / metrics["batches"] if metrics["batches"] else 0.0
+        return metrics
+    
+    def _connect(self, writer: bool) -> sqlite3.Connection:
+        """Open a connection; runs on the connection's own executor thread"""
+        
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if writer:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+        return conn
+    
+    @staticmethod
+    def _message_keys(message: Message) -> tuple:
+        """Keys under which reads can see a write of this message"""
+        
+        keys = [("message", message.message_id)]
+        if message.room_id is not None:
+            keys.append(("room", message.room_id))
+        if message.recipient_id is not None:
+            keys.append(("recipient", message.recipient_id))
+        return tuple(keys)
+    
+    async def _enqueue(self, op: str, params: tuple, keys: tuple):
+        """Queue a write, applying backpressure when the queue is full"""
+        
+        if self._writer is None:
+            await self.open()
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+        
+        self._pending.append((op, params, keys))
+        self._pending_keys.update(keys)
+        self.metrics["queued"] += 1
+        self._wakeup.set()
+    
+    async def _query(self, sql: str, params: tuple, keys: tuple) -> List[tuple]:
+        """Run a read query, first committing queued writes only if they touch its keys"""
+        
+        if self._writer is None:
+            await self.open()
+        if any(key in self._pending_keys for key in keys):
+            self.metrics["read_flushes"] += 1
+            await self.flush()
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._read_executor, lambda: self._read_conn.execute(sql, params).fetchall()
+        )
+    
+    async def _run_writer(self):
+        """Commit queued writes in batches"""
+        
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            await self._wakeup.wait()
+            if self.commit_interval > 0:
+                await asyncio.sleep(self.commit_interval)
+            self._wakeup.clear()
+            
+            if not self._pending:
+                continue
+            
+            batch, self._pending = self._pending, []
+            done = self._pending_done or loop.create_future()
+            self._pending_done = None
+            self._in_flight = done
+            
+            try:
+                await loop.run_in_executor(self._write_executor, self._write_batch, batch)
+                self.metrics["batches"] += 1
+                self.metrics["committed"] += len(batch)
+                done.set_result(None)
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception as e:
+                logger.exception("Message store batch of %d writes failed", len(batch))
+                done.set_exception(e)
+                done.exception()  # mark retrieved when nobody is flushing
+            finally:
+                self._in_flight = None
+                pending_keys = self._pending_keys
+                for _, _, keys in batch:
+                    for key in keys:
+                        pending_keys[key] -= 1
+                        if not pending_keys[key]:
+                            del pending_keys[key]
+    
+    def _write_batch(self, batch: List[Tuple[str, tuple]]):
+        """Apply a batch of writes in one transaction; runs on the writer thread"""
+        
+        statements = {
+            "insert": "INSERT OR REPLACE INTO messages "
+                      "(message_id, room_id, seq, recipient_id, timestamp, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            "update": "UPDATE messages SET payload = ? WHERE message_id = ?",
+            "delete": "DELETE FROM messages WHERE message_id = ?",
+        }
+        
+        conn = self._write_conn
+        conn.execute("BEGIN")
+        try:
+            # Consecutive writes of the same kind go through one executemany
+            start = 0
+            while start < len(batch):
+                op = batch[start][0]
+                end = start
+                while end < len(batch) and batch[end][0] == op:
+                    end += 1
+                conn.executemany(statements[op], [params for _, params, _ in batch[start:end]])
+                start = end
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    
+    @staticmethod
+    def _encode(message: Message) -> str:
+        """Serialize a message payload"""
+        return json.dumps(asdict(message), separators=(",", ":"),
+                          default=lambda value: list(value) if isinstance(value, (set, frozenset)) else str(value))
+    
+    @staticmethod
+    def _decode(payload: str) -> Message:
+        """Deserialize a message payload"""
+        
+        message = Message(**json.loads(payload))
+        if message.reactions:
+            message.reactions = {emoji: set(user_ids) for emoji, user_ids in message.reactions.items()}
+        return message
+
+class RoomMessageLog:
+    """
+    Append-only message log for one room, keyed by monotonic sequence number
+    Parallel columns of sequence numbers, message ids and timestamps stay
+    sorted, so timestamp and sequence seeks are a bisect. Deletes leave a
+    tombstone (None id) and the columns are compacted once tombstones
+    outnumber live entries. With a message store the log can be trimmed to a
+    hot tail; entries below trimmed_before are then only in the store.
+    """
+    
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.message_ids: List[Optional[str]] = []
+        self.timestamps: List[float] = []  # clamped to be non-decreasing
+        self.positions: Dict[str, int] = {}  # message_id -> seq
+        self.next_seq = 0
+        self.tombstones = 0
+        self.trimmed_before = 0  # older seqs were trimmed to the message store
+    
+    def __len__(self) -> int:
+        return len(self.positions)
+    
+    def append(self, message_id: str, timestamp: float, seq: Optional[int] = None) -> int:
+        """Append a message and return its sequence number"""
+        
+        if seq is None:
+            seq = self.next_seq
+        self.next_seq = seq + 1
+        
+        self.seqs.append(seq)
+        self.message_ids.append(message_id)
+        self.timestamps.append(max(timestamp, self.timestamps[-1]) if self.timestamps else timestamp)
+        self.positions[message_id] = seq
+        
+        return seq
+    
+    def tombstone(self, message_id: str) -> bool:
+        """Mark a message as deleted"""
+        
+        seq = self.positions.pop(message_id, None)
+        if seq is None:
+            return False
+        
+        self.message_ids[bisect.bisect_left(self.seqs, seq)] = None
+        self.tombstones += 1
+        
+        if self.tombstones > len(self.positions):
+            self._compact()
+        
+        return True
+    
+    def entries(self) -> Iterable[Tuple[int, str]]:
+        """Iterate live (seq, message_id) entries, oldest first"""
+        return ((seq, message_id) for seq, message_id in zip(self.seqs, self.message_ids) if message_id is not None)
+    
+    def seq_of(self, message_id: str) -> Optional[int]:
+        """Get the sequence number of a live message"""
+        return self.positions.get(message_id)
+    
+    def seq_at_timestamp(self, timestamp: float) -> int:
+        """Get the sequence number of the first entry at or after the timestamp"""
+        
+        index = bisect.bisect_left(self.timestamps, timestamp)
+        return self.seqs[index] if index < len(self.seqs) else self.next_seq
+    
+    def page_before(self, before_seq: Optional[int] = None, limit: int = 50) -> List[Tuple[int, str]]:
+        """Get up to limit live (seq, message_id) entries older than before_seq, newest first"""
+        
+        end = len(self.seqs) if before_seq is None else bisect.bisect_left(self.seqs, before_seq)
+        page = []
+        
+        for index in range(end - 1, -1, -1):
+            message_id = self.message_ids[index]
+            if message_id is None:
+                continue
+            page.append((self.seqs[index], message_id))
+            if len(page) >= limit:
+                break
+        
+        return page
+    
+    def trim(self, keep: int) -> List[str]:
+        """Drop all but the newest keep entries and return the dropped live message ids"""
+        
+        drop = len(self.seqs) - keep
+        if drop <= 0:
+            return []
+        
+        dropped = [message_id for message_id in self.message_ids[:drop] if message_id is not None]
+        for message_id in dropped:
+            del self.positions[message_id]
+        self.tombstones -= drop - len(dropped)
+        self.trimmed_before = self.seqs[drop] if drop < len(self.seqs) else self.next_seq
+        
+        del self.seqs[:drop]
+        del self.message_ids[:drop]
+        del self.timestamps[:drop]
+        
+        return dropped
+    
+    def _compact(self):
+        """Drop tombstoned entries from the columns"""
+        
+        live = [index for index, message_id in enumerate(self.message_ids) if message_id is not None]
+        self.seqs = [self.seqs[index] for index in live]
+        self.message_ids = [self.message_ids[index] for index in live]
+        self.timestamps = [self.timestamps[index] for index in live]
+        self.tombstones = 0
+
+class MessageColumns:
+    """
+    Append-only columnar copy of message metadata for analytics scans
+    Sender, room and message type are interned to integer codes; contents
+    live in one shared bytes arena addressed by (start, length) columns.
+    Timestamps are clamped to be non-decreasing so a time window is a bisect,
+    and aggregates run as NumPy bincounts over zero-copy views of the
+    columns, with a Counter fallback when NumPy is unavailable.
+    """
+    
+    NO_ROOM = -1
+    
+    def __init__(self):
+        self.timestamps = array("d")
+        self.sender_codes = array("q")
+        self.room_codes = array("q")  # NO_ROOM for direct messages
+        self.type_codes = array("q")
+        self.content_starts = array("q")
+        self.content_lengths = array("q")
+        self.live = bytearray()  # 1 until the message is deleted
+        self.content_arena = bytearray()
+        self.rows: Dict[str, int] = {}  # message_id -> row
+        self.deleted = 0
+        
+        self.sender_ids: List[str] = []
+        self.sender_index: Dict[str, int] = {}
+        self.room_ids: List[str] = []
+        self.room_index: Dict[str, int] = {}
+        self.message_types: List[str] = []
+        self.type_index: Dict[str, int] = {}
+    
+    def __len__(self) -> int:
+        return len(self.rows)
+    
+    def append(self, message: Message) -> int:
+        """Append a message and return its row"""
+        
+        row = len(self.timestamps)
+        timestamp = message.timestamp
+        if row and timestamp < self.timestamps[-1]:
+            timestamp = self.timestamps[-1]
+        
+        self.timestamps.append(timestamp)
+        self.sender_codes.append(self._intern(self.sender_ids, self.sender_index, message.sender_id))
+        self.room_codes.append(
+            self._intern(self.room_ids, self.room_index, message.room_id) if message.room_id else self.NO_ROOM
+        )
+        self.type_codes.append(self._intern(self.message_types, self.type_index, message.message_type))
+        self._store_content(message.content)
+        self.live.append(1)
+        self.rows[message.message_id] = row
+        
+        return row
+    
+    def update_content(self, message: Message):
+        """Point a row at edited content; the old bytes stay in the arena"""
+        
+        row = self.rows.get(message.message_id)
+        if row is not None:
+            encoded = message.content.encode("utf-8")
+            self.content_starts[row] = len(self.content_arena)
+            self.content_lengths[row] = len(encoded)
+            self.content_arena += encoded
+    
+    def delete(self, message_id: str) -> bool:
+        """Exclude a message from all aggregates"""
+        
+        row = self.rows.pop(message_id, None)
+        if row is None:
+            return False
+        
+        self.live[row] = 0
+        self.deleted += 1
+        return True
+    
+    def get_content(self, row: int) -> str:
+        """Decode the content of a row"""
+        
+        start = self.content_starts[row]
+        return self.content_arena[start:start + self.content_lengths[row]].decode("utf-8")
+    
+    def count_by_room(self, since: Optional[float] = None, until: Optional[float] = None) -> Dict[str, int]:
+        """Count messages per room in [since, until)"""
+        
+        counts = self._count(self.room_codes, since, until, offset=1)  # shift NO_ROOM to bucket 0
+        return {self.room_ids[code - 1]: count for code, count in counts if code > 0}
+    
+    def top_senders(self, limit: int = 10, since: Optional[float] = None, until: Optional[float] = None,
+                    room_id: Optional[str] = None) -> List[Tuple[str, int]]:
+        """Get the senders with the most messages, optionally within one room"""
+        
+        room_code = None
+        if room_id is not None:
+            room_code = self.room_index.get(room_id)
+            if room_code is None:
+                return []
+        
+        if np is not None:
+            counts = self._bincount(self.sender_codes, since, until, room_code=room_code)
+            candidates = np.flatnonzero(counts)
+            if len(candidates) > limit:
+                # Keep ties at the cut-off so the final ordering is stable
+                threshold = np.partition(counts[candidates], len(candidates) - limit)[len(candidates) - limit]
+                candidates = candidates[counts[candidates] >= threshold]
+            top = [(int(code), int(counts[code])) for code in candidates]
+        else:
+            top = self._count(self.sender_codes, since, until, room_code=room_code)
+        
+        top = heapq.nsmallest(limit, top, key=lambda item: (-item[1], item[0]))
+        return [(self.sender_ids[code], count) for code, count in top]
+    
+    def count_by_interval(self, interval: float = 3600.0, since: Optional[float] = None,
+                          until: Optional[float] = None, room_id: Optional[str] = None) -> List[Tuple[float, int]]:
+        """Count messages per time bucket of interval seconds, oldest first"""
+        
+        start, end = self._window(since, until)
+        if start >= end:
+            return []
+        
+        room_code = None
+        if room_id is not None:
+            room_code = self.room_index.get(room_id)
+            if room_code is None:
+                return []
+        
+        origin = math.floor(self.timestamps[start] / interval) * interval
+        
+        if np is not None:
+            timestamps = np.frombuffer(self.timestamps, dtype=np.float64)[start:end]
+            mask = self._mask(start, end, room_code)
+            if mask is not None:
+                timestamps = timestamps[mask]
+            counts = np.bincount(((timestamps - origin) // interval).astype(np.int64))
+            return [(origin + bucket * interval, int(counts[bucket])) for bucket in np.flatnonzero(counts)]
+        
+        counts = Counter(
+            int((self.timestamps[row] - origin) // interval)
+            for row in range(start, end)
+            if self.live[row] and (room_code is None or self.room_codes[row] == room_code)
+        )
+        return [(origin + bucket * interval, counts[bucket]) for bucket in sorted(counts)]
+    
+    def _intern(self, values: List[str], index: Dict[str, int], value: str) -> int:
+        """Get the code of a value, assigning the next one if it is new"""
+        
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+    
+    def _store_content(self, content: str):
+        """Append content to the arena"""
+        
+        encoded = content.encode("utf-8")
+        self.content_starts.append(len(self.content_arena))
+        self.content_lengths.append(len(encoded))
+        self.content_arena += encoded
+    
+    def _window(self, since: Optional[float], until: Optional[float]) -> Tuple[int, int]:
+        """Row range of a time window"""
+        
+        start = 0 if since is None else bisect.bisect_left(self.timestamps, since)
+        end = len(self.timestamps) if until is None else bisect.bisect_left(self.timestamps, until)
+        return start, end
+    
+    def _mask(self, start: int, end: int, room_code: Optional[int]):
+        """Row filter for a window, or None when every row qualifies"""
+        
+        mask = None
+        if self.deleted:
+            mask = np.frombuffer(self.live, dtype=np.bool_)[start:end]
+        if room_code is not None:
+            in_room = np.frombuffer(self.room_codes, dtype=np.int64)[start:end] == room_code
+            mask = in_room if mask is None else mask & in_room
+        return mask
+    
+    def _bincount(self, codes: array, since: Optional[float], until: Optional[float],
+                  offset: int = 0, room_code: Optional[int] = None):
+        """NumPy count of live rows per code (plus offset) within a time window"""
+        
+        start, end = self._window(since, until)
+        values = np.frombuffer(codes, dtype=np.int64)[start:end]
+        mask = self._mask(start, end, room_code)
+        if mask is not None:
+            values = values[mask]
+        return np.bincount(values + offset) if offset else np.bincount(values)
+    
+    def _count(self, codes: array, since: Optional[float], until: Optional[float],
+               offset: int = 0, room_code: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Count live rows per code (plus offset) within a time window"""
+        
+        if np is not None:
+            counts = self._bincount(codes, since, until, offset, room_code)
+            return [(int(code), int(counts[code])) for code in np.flatnonzero(counts)]
+        
+        start, end = self._window(since, until)
+        counts = Counter(
+            codes[row] + offset
+            for row in range(start, end)
+            if self.live[row] and (room_code is None or self.room_codes[row] == room_code)
+        )
+        return list(counts.items())
+
+class Conversation:
+    """Direct-message thread between two users"""
+    
+    def __init__(self, key: Tuple[str, str]):
+        self.key = key
+        self.log = RoomMessageLog()
+        self.unread: Dict[str, int] = {user_id: 0 for user_id in key}
+        self.read_seq: Dict[str, int] = {user_id: 0 for user_id in key}  # first unread seq per participant
+        self.last_message_id: Optional[str] = None
+        self.last_activity = 0.0
+        self.activity_seq = 0
+    
+    def other(self, user_id: str) -> str:
+        """Get the other participant"""
+        return self.key[1] if self.key[0] == user_id else self.key[0]
+
+class ConversationIndex:
+    """
+    Direct-message conversations keyed by the ordered participant pair
+    Each user's inbox is a list of activity sequence numbers in ascending
+    order, so a new message moves its conversation to the top with one
+    append. The entry it replaces is left in place as stale (its sequence
+    number is no longer in by_activity) and skipped when paging; once stale
+    entries outnumber live ones the inbox is compacted, which keeps both
+    touches and pages amortized O(1) per conversation.
+    """
     
     def __init__(self):
+        self.conversations: Dict[Tuple[str, str], Conversation] = {}
+        self.by_activity: Dict[int, Conversation] = {}  # activity_seq -> conversation
+        self.inboxes: Dict[str, List[int]] = {}  # user_id -> activity seqs, oldest first
+        self.stale: Dict[str, int] = {}  # user_id -> superseded entries in the inbox
+        self.unread_totals: Dict[str, int] = {}
+        self.next_activity = 1
+    
+    @staticmethod
+    def key(user_id: str, other_id: str) -> Tuple[str, str]:
+        """Get the conversation key of two participants"""
+        return (user_id, other_id) if user_id <= other_id else (other_id, user_id)
+    
+    def get(self, user_id: str, other_id: str) -> Optional[Conversation]:
+        """Get the conversation between two users"""
+        return self.conversations.get(self.key(user_id, other_id))
+    
+    def append(self, message: Message) -> Conversation:
+        """Add a direct message to its conversation and move it to the top of both inboxes"""
+        
+        key = self.key(message.sender_id, message.recipient_id)
+        conversation = self.conversations.get(key)
+        if conversation is None:
+            conversation = self.conversations[key] = Conversation(key)
+        
+        conversation.log.append(message.message_id, message.timestamp)
+        conversation.last_message_id = message.message_id
+        conversation.last_activity = message.timestamp
+        
+        if message.recipient_id != message.sender_id:
+            conversation.unread[message.recipient_id] += 1
+            self.unread_totals[message.recipient_id] = self.unread_totals.get(message.recipient_id, 0) + 1
+        
+        self._touch(conversation)
+        return conversation
+    
+    def remove(self, message: Message) -> bool:
+        """Remove a deleted direct message from its conversation"""
+        
+        conversation = self.get(message.sender_id, message.recipient_id)
+        if conversation is None:
+            return False
+        
+        seq = conversation.log.seq_of(message.message_id)
+        if seq is None or not conversation.log.tombstone(message.message_id):
+            return False
+        
+        recipient_id = message.recipient_id
+        if recipient_id != message.sender_id and seq >= conversation.read_seq[recipient_id]:
+            conversation.unread[recipient_id] -= 1
+            self.unread_totals[recipient_id] -= 1
+        
+        if conversation.last_message_id == message.message_id:
+            latest = conversation.log.page_before(None, 1)
+            conversation.last_message_id = latest[0][1] if latest else None
+        
+        return True
+    
+    def mark_read(self, user_id: str, other_id: str) -> int:
+        """Mark a conversation read for one participant and return how many messages were unread"""
+        
+        conversation = self.get(user_id, other_id)
+        if conversation is None:
+            return 0
+        
+        cleared = conversation.unread[user_id]
+        conversation.unread[user_id] = 0
+        conversation.read_seq[user_id] = conversation.log.next_seq
+        if cleared:
+            self.unread_totals[user_id] -= cleared
+        
+        return cleared
+    
+    def restore_unread(self, user_id: str, other_id: str, unread: int, messages: Dict[str, Message]):
+        """Set a participant's unread count, treating their latest incoming messages as unread"""
+        
+        conversation = self.get(user_id, other_id)
+        if conversation is None:
+            return
+        
+        self.mark_read(user_id, other_id)
+        if unread <= 0 or user_id == other_id:
+            return
+        
+        # Walk back to the oldest of the last `unread` messages from the other participant
+        counted = 0
+        for seq, message_id in reversed(list(conversation.log.entries())):
+            message = messages.get(message_id)
+            if message is None or message.sender_id != other_id:
+                continue
+            counted += 1
+            conversation.read_seq[user_id] = seq
+            if counted >= unread:
+                break
+        
+        conversation.unread[user_id] = counted
+        self.unread_totals[user_id] = self.unread_totals.get(user_id, 0) + counted
+    
+    def inbox_page(self, user_id: str, cursor: Optional[int] = None,
+                   limit: int = 20) -> Tuple[List[Conversation], Optional[int]]:
+        """Get conversations by most recent activity; cursor is the previous page's next_cursor"""
+        
+        inbox = self.inboxes.get(user_id, [])
+        position = len(inbox) if cursor is None else bisect.bisect_left(inbox, cursor)
+        
+        # Walk back from the cursor, skipping stale entries, until one past the page
+        page: List[Conversation] = []
+        more = False
+        while position > 0:
+            position -= 1
+            conversation = self.by_activity.get(inbox[position])
+            if conversation is None:
+                continue
+            if len(page) == limit:
+                more = True
+                break
+            page.append(conversation)
+        
+        next_cursor = page[-1].activity_seq if page and more else None
+        
+        return page, next_cursor
+    
+    def _touch(self, conversation: Conversation):
+        """Give a conversation the newest activity sequence number"""
+        
+        previous = conversation.activity_seq
+        seq = self.next_activity
+        self.next_activity += 1
+        
+        if previous:
+            del self.by_activity[previous]
+        conversation.activity_seq = seq
+        self.by_activity[seq] = conversation
+        
+        for user_id in set(conversation.key):
+            inbox = self.inboxes.setdefault(user_id, [])
+            inbox.append(seq)  # the newest activity always sorts last
+            if previous:
+                stale = self.stale.get(user_id, 0) + 1
+                if stale * 2 > len(inbox):
+                    inbox[:] = [entry for entry in inbox if entry in self.by_activity]
+                    stale = 0
+                self.stale[user_id] = stale
+
+class MessageSearchIndex:
+    """
+    Incremental full-text index over message content
+    Content is case-folded and split into word tokens. Each term's postings
+    are one bytearray of varints: per document the doc id delta, the term
+    frequency and the delta-encoded token positions. Documents only ever
+    get new, increasing ids (an edit re-indexes the message under a new id),
+    so postings are append-only; deleted documents are flagged, and once
+    they outnumber live ones a background compaction renumbers the live
+    documents densely and rebuilds the postings without the dead ones.
+    Queries rank with BM25 and support quoted phrases and per-room scoping.
+    """
+    
+    TOKEN_PATTERN = re.compile(r"\w+")
+    PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+    K1 = 1.2
+    B = 0.75
+    COMPACT_TERMS = 500  # terms rebuilt between event loop yields while compacting
+    
+    def __init__(self):
+        self.postings: Dict[str, bytearray] = {}
+        self.last_doc: Dict[str, int] = {}  # term -> last doc id in its postings
+        self.doc_ids: Dict[str, int] = {}  # message_id -> current doc id
+        self.doc_messages: List[Optional[str]] = []  # doc id -> message_id, None once dead
+        self.doc_rooms = array("q")
+        self.doc_lengths = array("q")
+        self.room_codes: Dict[str, int] = {}
+        self.live_docs = 0
+        self.live_length = 0
+        self.dead_docs = 0
+        self.compaction_task: Optional[asyncio.Task] = None
+    
+    def __len__(self) -> int:
+        return self.live_docs
+    
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Split text into case-folded word tokens"""
+        return cls.TOKEN_PATTERN.findall(text.casefold())
+    
+    def add(self, message: Message):
+        """Index a message, replacing any previous version of it"""
+        
+        if message.message_id in self.doc_ids:
+            self.remove(message.message_id)
+        
+        tokens = self.tokenize(message.content)
+        doc_id = len(self.doc_messages)
+        self.doc_ids[message.message_id] = doc_id
+        self.doc_messages.append(message.message_id)
+        self.doc_rooms.append(self._room_code(message.room_id))
+        self.doc_lengths.append(len(tokens))
+        self.live_docs += 1
+        self.live_length += len(tokens)
+        
+        positions: Dict[str, List[int]] = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        
+        for term, term_positions in positions.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = bytearray()
+            self._encode_varint(postings, doc_id - self.last_doc.get(term, 0))
+            self._encode_varint(postings, len(term_positions))
+            previous = 0
+            for position in term_positions:
+                self._encode_varint(postings, position - previous)
+                previous = position
+            self.last_doc[term] = doc_id
+    
+    def remove(self, message_id: str) -> bool:
+        """Drop a message from search results"""
+        
+        doc_id = self.doc_ids.pop(message_id, None)
+        if doc_id is None:
+            return False
+        
+        self.doc_messages[doc_id] = None
+        self.live_docs -= 1
+        self.live_length -= self.doc_lengths[doc_id]
+        self.dead_docs += 1
+        
+        if (self.dead_docs > 1000 and self.dead_docs > self.live_docs
+                and (self.compaction_task is None or self.compaction_task.done())):
+            self.compaction_task = asyncio.get_running_loop().create_task(self.compact())
+        
+        return True
+    
+    def search(self, query: str, room_id: Optional[str] = None, limit: int = 20) -> List[Tuple[str, float]]:
+        """
+        Rank messages against a query with BM25
+        Bare terms are optional and only contribute to the score; every
+        quoted phrase must appear with its words adjacent and in order.
+        """
+        
+        phrases = [self.tokenize(phrase) for phrase in self.PHRASE_PATTERN.findall(query)]
+        phrases = [phrase for phrase in phrases if phrase]
+        terms = set(self.tokenize(self.PHRASE_PATTERN.sub(" ", query)))
+        phrase_terms = {term for phrase in phrases for term in phrase}
+        terms |= phrase_terms
+        
+        if not terms or not self.live_docs:
+            return []
+        
+        room_code = None
+        if room_id is not None:
+            room_code = self.room_codes.get(room_id)
+            if room_code is None:
+                return []
+        
+        # Phrase terms are decoded shortest posting list first, each restricted
+        # to the documents that still contain every phrase term decoded so far
+        matches: Dict[str, Dict[int, Any]] = {}
+        frequencies: Dict[str, int] = {}
+        required: Optional[Set[int]] = None
+        for term in sorted(phrase_terms, key=lambda term: len(self.postings.get(term, b""))):
+            matches[term], frequencies[term] = self._decode(self.postings.get(term, b""), True, room_code, required)
+            required = set(matches[term]) if required is None else required & matches[term].keys()
+        
+        for term in terms - phrase_terms:
+            matches[term], frequencies[term] = self._decode(self.postings.get(term, b""), False, room_code, required)
+        
+        candidates: Optional[Set[int]] = None
+        for phrase in phrases:
+            phrase_docs = self._match_phrase(phrase, matches)
+            candidates = phrase_docs if candidates is None else candidates & phrase_docs
+        if candidates is None:
+            candidates = set().union(*(term_matches.keys() for term_matches in matches.values()))
+        
+        # BM25 over every query term; document frequencies count live documents only
+        average_length = self.live_length / self.live_docs
+        scores: Dict[int, float] = {}
+        for term, term_matches in matches.items():
+            if not term_matches:
+                continue
+            document_frequency = frequencies[term]
+            idf = math.log(1 + (self.live_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+            for doc_id, match in term_matches.items():
+                if doc_id not in candidates:
+                    continue
+                frequency = len(match) if isinstance(match, list) else match
+                norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.K1 + 1) / (frequency + norm)
+        
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.doc_messages[doc_id], score) for doc_id, score in top]
+    
+    async def compact(self):
+        """
+        Renumber live documents densely and drop dead ones from the postings
+        Postings are rebuilt aside, a chunk of terms at a time with event
+        loop yields in between, while queries and updates keep using the
+        current postings. Documents dead when compaction starts are dropped
+        and the rest keep their order. The swap at the end also carries over
+        whatever was appended meanwhile, so it needs no lock; cancelling
+        compaction part-way leaves the index untouched.
+        """
+        
+        # Old doc id -> new doc id for documents that exist when compaction starts
+        cut = len(self.doc_messages)
+        new_ids = array("q", [-1]) * cut
+        kept = 0
+        for doc_id, message_id in enumerate(self.doc_messages):
+            if message_id is not None:
+                new_ids[doc_id] = kept
+                kept += 1
+        
+        def renumber(doc_id: int) -> int:
+            # Documents added during compaction follow the kept ones in order
+            return new_ids[doc_id] if doc_id < cut else kept + doc_id - cut
+        
+        rebuilt: Dict[str, Tuple[bytearray, int, int, int]] = {}  # term -> (postings, last, consumed, old last)
+        for count, term in enumerate(list(self.postings), 1):
+            postings = self.postings[term]
+            out = bytearray()
+            last = self._append_renumbered(out, 0, self._iter_documents(postings, 0, 0), renumber)
+            rebuilt[term] = (out, last, len(postings), self.last_doc[term])
+            if count % self.COMPACT_TERMS == 0:
+                await asyncio.sleep(0)
+        
+        # Swap without yielding: append what was indexed after each term was rebuilt
+        new_postings: Dict[str, bytearray] = {}
+        new_last_doc: Dict[str, int] = {}
+        for term, postings in self.postings.items():
+            out, last, consumed, old_last = rebuilt.get(term, (bytearray(), 0, 0, 0))
+            if consumed < len(postings):
+                last = self._append_renumbered(out, last, self._iter_documents(postings, consumed, old_last), renumber)
+            if out:
+                new_postings[term] = out
+                new_last_doc[term] = last
+        
+        survivors = [doc_id for doc_id in range(cut) if new_ids[doc_id] >= 0]
+        survivors.extend(range(cut, len(self.doc_messages)))
+        self.doc_messages = [self.doc_messages[doc_id] for doc_id in survivors]
+        self.doc_rooms = array("q", (self.doc_rooms[doc_id] for doc_id in survivors))
+        self.doc_lengths = array("q", (self.doc_lengths[doc_id] for doc_id in survivors))
+        self.doc_ids = {
+            message_id: doc_id for doc_id, message_id in enumerate(self.doc_messages) if message_id is not None
+        }
+        self.dead_docs = len(self.doc_messages) - len(self.doc_ids)
+        self.postings = new_postings
+        self.last_doc = new_last_doc
+    
+    def _append_renumbered(self, out: bytearray, last: int, documents: Iterable[Tuple[int, List[int]]],
+                           renumber: Callable[[int], int]) -> int:
+        """Encode documents under their new ids, skipping dropped ones; returns the last doc id written"""
+        
+        for doc_id, positions in documents:
+            new_id = renumber(doc_id)
+            if new_id < 0:
+                continue
+            self._encode_varint(out, new_id - last)
+            self._encode_varint(out, len(positions))
+            previous = 0
+            for position in positions:
+                self._encode_varint(out, position - previous)
+                previous = position
+            last = new_id
+        return last
+    
+    @staticmethod
+    def _iter_documents(postings: bytearray, index: int, doc_id: int):
+        """Decode every document of a posting list from a byte offset, given the doc id before it"""
+        
+        size = len(postings)
+        values = []
+        while index < size:
+            value = shift = 0
+            while True:
+                byte = postings[index]
+                index += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            values.append(value)
+            if len(values) == 2 + (values[1] if len(values) > 1 else 0):
+                doc_id += values[0]
+                positions = []
+                position = 0
+                for delta in values[2:]:
+                    position += delta
+                    positions.append(position)
+                yield doc_id, positions
+                values = []
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index size figures"""
+        
+        posting_bytes = sum(len(postings) for postings in self.postings.values())
+        return {
+            "documents": self.live_docs,
+            "dead_documents": self.dead_docs,
+            "terms": len(self.postings),
+            "posting_bytes": posting_bytes,
+            "bytes_per_token": posting_bytes / self.live_length if self.live_length else 0.0
+        }
+    
+    def _room_code(self, room_id: Optional[str]) -> int:
+        """Intern a room id; -1 for direct messages"""
+        
+        if room_id is None:
+            return -1
+        code = self.room_codes.get(room_id)
+        if code is None:
+            code = self.room_codes[room_id] = len(self.room_codes)
+        return code
+    
+    def _decode(self, postings: bytearray, with_positions: bool, room_code: Optional[int],
+                only: Optional[Set[int]] = None) -> Tuple[Dict[int, Any], int]:
+        """
+        Decode a posting list to doc_id -> positions (or term frequency)
+        Only live documents in the room and in `only` are returned; the
+        second value counts every live document in the list, which is the
+        term's document frequency.
+        """
+        
+        documents: Dict[int, Any] = {}
+        live = 0
+        doc_messages = self.doc_messages
+        doc_rooms = self.doc_rooms
+        index = 0
+        size = len(postings)
+        doc_id = 0
+        
+        while index < size:
+            # Inline varint decoding: doc id delta, then term frequency
+            value = shift = 0
+            while True:
+                byte = postings[index]
+                index += 1
+                value |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            doc_id += value
+            
+            frequency = shift = 0
+            while True:
+                byte = postings[index]
+                index += 1
+                frequency |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            
+            keep = doc_messages[doc_id] is not None
+            if keep:
+                live += 1
+                keep = (room_code is None or doc_rooms[doc_id] == room_code) and (only is None or doc_id in only)
+            if keep and with_positions:
+                positions = []
+                position = 0
+                for _ in range(frequency):
+                    value = shift = 0
+                    while True:
+                        byte = postings[index]
+                        index += 1
+                        value |= (byte & 0x7F) << shift
+                        if byte < 0x80:
+                            break
+                        shift += 7
+                    position += value
+                    positions.append(position)
+                documents[doc_id] = positions
+            else:
+                # Skip the position varints
+                remaining = frequency
+                while remaining:
+                    if postings[index] < 0x80:
+                        remaining -= 1
+                    index += 1
+                if keep:
+                    documents[doc_id] = frequency
+        
+        return documents, live
+    
+    @staticmethod
+    def _match_phrase(phrase: List[str], matches: Dict[str, Dict[int, Any]]) -> Set[int]:
+        """Documents where the phrase terms occur at consecutive positions"""
+        
+        documents = set(matches[phrase[0]])
+        for term in phrase[1:]:
+            documents &= matches[term].keys()
+        
+        found = set()
+        for doc_id in documents:
+            starts = set(matches[phrase[0]][doc_id])
+            for offset, term in enumerate(phrase[1:], 1):
+                starts &= {position - offset for position in matches[term][doc_id]}
+                if not starts:
+                    break
+            if starts:
+                found.add(doc_id)
+        
+        return found
+    
+    @staticmethod
+    def _encode_varint(out: bytearray, value: int):
+        """Append an unsigned LEB128 varint"""
+        
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+class MessageManager:
+    """
+    Manages messaging and communication
+    Without a store every message stays in memory. With a store, messages
+    are persisted through it, rooms keep only a hot tail of recent messages
+    in memory and direct messages are served from the store; open() must
+    then run first so the in-memory indexes are rebuilt from stored history.
+    With columnar set, sent messages are also appended to a MessageColumns
+    side store for analytics; with searchable set, contents are kept in a
+    full-text index.
+    """
+    
+    def __init__(self, store: Optional[MessageStore] = None, hot_messages_per_room: int = 500,
+                 columnar: bool = False, reaction_summary_window: float = 0.25, searchable: bool = False):
         self.messages: Dict[str, Message] = {}
-        self.room_messages: Dict[str, List[str]] = {}  # room_id -> message_ids
+        self.room_messages: Dict[str, RoomMessageLog] = {}  # room_id -> message log
         self.user_messages: Dict[str, List[str]] = {}  # user_id -> message_ids
         self.message_callbacks: List[Callable] = []
+        self.store = store
+        self.hot_messages_per_room = hot_messages_per_room
+        self.columns: Optional[MessageColumns] = MessageColumns() if columnar else None
+        self.search_index: Optional[MessageSearchIndex] = MessageSearchIndex() if searchable else None
+        self.conversations = ConversationIndex()
+        self.store_loaded = False
+        
+        # Reaction toggles are reported as one summary per message per window
+        self.reaction_summary_window = reaction_summary_window
+        self._dirty_reactions: Dict[str, Message] = {}
+        self._reaction_flush: Optional[asyncio.Task] = None
+        
+        # Cold messages being updated: message_id -> [load future, updaters]; every
+        # concurrent update of one stored message changes the same loaded copy
+        self._updating: Dict[str, list] = {}
+        
+        # History restored from a snapshot: room_id -> (next_seq, loader)
+        self.deferred_rooms: Dict[str, Tuple[int, Callable[[], Awaitable[List[Tuple[int, Message]]]]]] = {}
+        self.hydration_task: Optional[asyncio.Task] = None
+        self._room_hydration: Dict[str, asyncio.Future] = {}
+    
+    async def open(self):
+        """
+        Open the store and rebuild the indexes that only live in memory
+        Stored direct messages refill the conversation index, and every
+        stored message refills the analytics columns and the full-text index
+        when those are enabled. Unread counters are not persisted, so rebuilt conversations start
+        read. Must finish before messages are sent.
+        """
+        
+        if self.store is None or self.store_loaded:
+            return
+        
+        await self.store.open()
+        direct_only = self.columns is None and self.search_index is None
+        async for messages in self.store.iter_messages(direct_only=direct_only):
+            for message in messages:
+                if message.recipient_id and not message.room_id:
+                    self.conversations.append(message)
+                if self.columns is not None:
+                    self.columns.append(message)
+                if self.search_index is not None:
+                    self.search_index.add(message)
+        
+        for key in list(self.conversations.conversations):
+            for user_id in set(key):
+                self.conversations.mark_read(user_id, key[1] if key[0] == user_id else key[0])
+        
+        self.store_loaded = True
     
     async def send_message(self, message_data: Dict[str, Any]) -> Message:
         """Send a new message"""
@@ -624,23 +3080,39 @@ class MessageManager:
             recipient_id=message_data.get("recipient_id"),
             content=message_data.get("content", ""),
             message_type=message_data.get("message_type", "text"),
-            attachments=message_data.get("attachments", []),
-            metadata=message_data.get("metadata", {})
+            attachments=message_data.get("attachments") or None,
+            metadata=message_data.get("metadata") or None
         )
         
-        self.messages[message_id] = message
-        
         # Index message
+        seq = None
         if message.room_id:
-            if message.room_id not in self.room_messages:
-                self.room_messages[message.room_id] = []
-            self.room_messages[message.room_id].append(message_id)
+            log = await self._get_room_log(message.room_id, create=True)
+            seq = log.append(message_id, message.timestamp)
+            self.messages[message_id] = message
+        elif self.store is None:
+            self.messages[message_id] = message
         
-        if message.recipient_id:
+        if message.recipient_id and self.store is None:
             if message.recipient_id not in self.user_messages:
                 self.user_messages[message.recipient_id] = []
             self.user_messages[message.recipient_id].append(message_id)
         
+        if message.recipient_id and not message.room_id:
+            self.conversations.append(message)
+        
+        if self.columns is not None:
+            self.columns.append(message)
+        if self.search_index is not None:
+            self.search_index.add(message)
+        
+        # Persist and keep only the hot tail of the room in memory
+        if self.store is not None:
+            await self.store.insert(message, seq)
+            if message.room_id and len(log.seqs) > 2 * self.hot_messages_per_room:
+                for evicted_id in log.trim(self.hot_messages_per_room):
+                    self.messages.pop(evicted_id, None)
+        
         # Notify message callbacks
         await self._notify_message_event("message_sent", message)
         
@@ -648,140 +3120,986 @@ class MessageManager:
     
     async def get_message(self, message_id: str) -> Optional[Message]:
         """Get message by ID"""
-        return self.messages.get(message_id)
+        
+        message = self.messages.get(message_id)
+        if message is None and self.hydration_task is not None and not self.hydration_task.done():
+            await self.wait_hydrated()
+            message = self.messages.get(message_id)
+        if message is None and self.store is not None:
+            message = await self.store.get(message_id)
+        return message
+    
+    @asynccontextmanager
+    async def _message_for_update(self, message_id: str):
+        """
+        Get a message for a read-modify-write
+        Hot messages are changed in place. A cold message is loaded from the
+        store once and shared by every update in flight on it, so each write
+        back carries the changes of all of them instead of overwriting them.
+        """
+        
+        if self.store is None or message_id in self.messages:
+            yield await self.get_message(message_id)
+            return
+        
+        entry = self._updating.get(message_id)
+        if entry is None:
+            entry = self._updating[message_id] = [asyncio.ensure_future(self.get_message(message_id)), 0]
+        entry[1] += 1
+        try:
+            yield await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._updating[message_id]
     
     async def get_room_messages(self, room_id: str, limit: int = 50, 
-                               before_timestamp: Optional[float] = None) -> List[Message]:
-        """Get messages from a room"""
+                               before_timestamp: Optional[float] = None,
+                               before_seq: Optional[int] = None) -> List[Message]:
+        """Get messages from a room, most recent first"""
+        
+        messages, _ = await self.get_room_messages_page(room_id, limit, before_seq, before_timestamp)
+        return messages
+    
+    async def get_room_messages_page(self, room_id: str, limit: int = 50,
+                                     cursor: Optional[int] = None,
+                                     before_timestamp: Optional[float] = None) -> Tuple[List[Message], Optional[int]]:
+        """
+        Get a page of room messages, most recent first
+        cursor is a sequence number returned by the previous page; the returned
+        cursor is None once the start of the room history is reached.
+        """
+        
+        log = await self._get_room_log(room_id)
+        if log is None:
+            return [], None
+        
+        before_seq = cursor
+        if before_timestamp is not None:
+            timestamp_seq = log.seq_at_timestamp(before_timestamp)
+            before_seq = timestamp_seq if before_seq is None else min(before_seq, timestamp_seq)
+        
+        page = [(seq, self.messages[message_id]) for seq, message_id in log.page_before(before_seq, limit + 1)]
+        
+        # Continue into the store once the hot tail is exhausted
+        if len(page) <= limit and log.trimmed_before > 0:
+            cold_before = log.trimmed_before if before_seq is None else min(before_seq, log.trimmed_before)
+            if cold_before > 0:
+                page += await self.store.get_room_page(room_id, cold_before, limit + 1 - len(page), before_timestamp)
+        
+        messages = [message for _, message in page[:limit]]
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        
+        return messages, next_cursor
+    
+    async def get_messages(self, message_ids: List[str]) -> List[Message]:
+        """Get several messages by ID in the given order, skipping missing ones"""
+        
+        found = {message_id: self.messages[message_id] for message_id in message_ids if message_id in self.messages}
+        missing = [message_id for message_id in message_ids if message_id not in found]
+        if missing and self.store is not None:
+            for message in await self.store.get_many(missing):
+                found[message.message_id] = message
+        
+        return [found[message_id] for message_id in message_ids if message_id in found]
+    
+    async def get_conversation_messages(self, user_id: str, other_id: str, limit: int = 50,
+                                        cursor: Optional[int] = None) -> Tuple[List[Message], Optional[int]]:
+        """Get a page of the direct-message conversation between two users, most recent first"""
+        
+        await self.wait_hydrated()
+        
+        conversation = self.conversations.get(user_id, other_id)
+        if conversation is None:
+            return [], None
+        
+        page = conversation.log.page_before(cursor, limit + 1)
+        messages = await self.get_messages([message_id for _, message_id in page[:limit]])
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        
+        return messages, next_cursor
+    
+    async def get_inbox(self, user_id: str, limit: int = 20,
+                        cursor: Optional[int] = None) -> Tuple[List[Conversation], Optional[int]]:
+        """Get a user's conversations ordered by most recent activity"""
+        
+        await self.wait_hydrated()
+        return self.conversations.inbox_page(user_id, cursor, limit)
+    
+    async def mark_conversation_read(self, user_id: str, other_id: str) -> int:
+        """Mark a conversation read and return how many messages were unread"""
+        
+        await self.wait_hydrated()
+        return self.conversations.mark_read(user_id, other_id)
+    
+    async def get_unread_count(self, user_id: str) -> int:
+        """Get the number of unread direct messages across all of a user's conversations"""
+        
+        await self.wait_hydrated()
+        return self.conversations.unread_totals.get(user_id, 0)
+    
+    async def search_messages(self, query: str, room_id: Optional[str] = None,
+                              limit: int = 20) -> List[Tuple[Message, float]]:
+        """Full-text search over message contents, best BM25 match first"""
+        
+        if self.search_index is None:
+            return []
+        await self.wait_hydrated()
+        
+        ranked = self.search_index.search(query, room_id, limit)
+        messages = {message.message_id: message for message in await self.get_messages([mid for mid, _ in ranked])}
+        
+        return [(messages[message_id], score) for message_id, score in ranked if message_id in messages]
+    
+    async def get_user_messages(self, user_id: str, limit: int = 50) -> List[Message]:
+        """Get direct messages for a user"""
+        
+        if self.store is not None:
+            return await self.store.get_recipient_messages(user_id, limit)
+        await self.wait_hydrated()
+        
+        message_ids = self.user_messages.get(user_id, [])
+        messages = []
+        
+        for message_id in reversed(message_ids):  # Most recent first
+            message = self.messages.get(message_id)
+            if message:
+                messages.append(message)
+                if len(messages) >= limit:
+                    break
+        
+        return messages
+    
+    async def add_reaction(self, message_id: str, user_id: str, emoji: str) -> bool:
+        """Add reaction to a message"""
+        
+        async with self._message_for_update(message_id) as message:
+            if not message:
+                return False
+            
+            if self._apply_reaction(message, user_id, emoji, True) and self.store is not None:
+                await self.store.update(message)
+        
+        return True
+    
+    async def remove_reaction(self, message_id: str, user_id: str, emoji: str) -> bool:
+        """Remove reaction from a message"""
+        
+        async with self._message_for_update(message_id) as message:
+            if not message:
+                return False
+            
+            if not self._apply_reaction(message, user_id, emoji, False):
+                return False
+            
+            if self.store is not None:
+                await self.store.update(message)
+        
+        return True
+    
+    async def toggle_reactions(self, toggles: Iterable[Tuple[str, str, str]]) -> List[Optional[bool]]:
+        """
+        Toggle a batch of (message_id, user_id, emoji) reactions
+        Returns True for each reaction added, False for each removed and None
+        where the message does not exist. Each changed message is persisted
+        once per batch.
+        """
+        
+        results: List[Optional[bool]] = []
+        changed: Dict[str, Message] = {}
+        
+        async with AsyncExitStack() as updates:
+            for message_id, user_id, emoji in toggles:
+                message = changed.get(message_id)
+                if message is None:
+                    message = await updates.enter_async_context(self._message_for_update(message_id))
+                if message is None:
+                    results.append(None)
+                    continue
+                
+                add = not (message.reactions and user_id in message.reactions.get(emoji, ()))
+                self._apply_reaction(message, user_id, emoji, add)
+                changed[message_id] = message
+                results.append(add)
+            
+            if self.store is not None:
+                for message in changed.values():
+                    await self.store.update(message)
+        
+        return results
+    
+    async def get_reaction_counts(self, message_id: str) -> Dict[str, int]:
+        """Get the number of users per emoji on a message"""
+        
+        message = await self.get_message(message_id)
+        if not message or not message.reactions:
+            return {}
+        
+        return {emoji: len(user_ids) for emoji, user_ids in message.reactions.items()}
+    
+    async def flush_reactions(self):
+        """Emit one reaction_summary event per message whose reactions changed since the last flush"""
+        
+        if self._reaction_flush is not None:
+            self._reaction_flush.cancel()
+            self._reaction_flush = None
+        
+        dirty, self._dirty_reactions = self._dirty_reactions, {}
+        for message in dirty.values():
+            await self._notify_message_event("reaction_summary", message)
+    
+    def _apply_reaction(self, message: Message, user_id: str, emoji: str, add: bool) -> bool:
+        """Add or remove one reaction, returning whether it changed anything"""
+        
+        reactions = message.reactions
+        if add:
+            if reactions is None:
+                reactions = message.reactions = {}
+            user_ids = reactions.get(emoji)
+            if user_ids is None:
+                user_ids = reactions[emoji] = set()
+            elif user_id in user_ids:
+                return False
+            user_ids.add(user_id)
+        else:
+            user_ids = reactions.get(emoji) if reactions else None
+            if not user_ids or user_id not in user_ids:
+                return False
+            user_ids.discard(user_id)
+            
+            # Remove emoji if no users have reacted with it
+            if not user_ids:
+                del reactions[emoji]
+        
+        # Coalesce toggles into one summary per message per window
+        self._dirty_reactions[message.message_id] = message
+        if self._reaction_flush is None:
+            self._reaction_flush = asyncio.create_task(self._flush_reactions_later())
+        
+        return True
+    
+    async def _flush_reactions_later(self):
+        """Flush reaction summaries once the coalescing window has passed"""
+        
+        await asyncio.sleep(self.reaction_summary_window)
+        self._reaction_flush = None
+        await self.flush_reactions()
+    
+    async def edit_message(self, message_id: str, new_content: str, user_id: str) -> bool:
+        """Edit a message"""
+        
+        async with self._message_for_update(message_id) as message:
+            if not message or message.sender_id != user_id:
+                return False
+            
+            message.content = new_content
+            message.edited_at = time.time()
+            
+            if self.columns is not None:
+                self.columns.update_content(message)
+            if self.search_index is not None:
+                self.search_index.add(message)
+            
+            if self.store is not None:
+                await self.store.update(message)
+        
+        # Notify message callbacks
+        await self._notify_message_event("message_edited", message)
+        
+        return True
+    
+    async def delete_message(self, message_id: str, user_id: str) -> bool:
+        """Delete a message"""
+        
+        message = await self.get_message(message_id)
+        if not message or message.sender_id != user_id:
+            return False
+        
+        # Remove from indexes
+        if message.room_id and message.room_id in self.room_messages:
+            self.room_messages[message.room_id].tombstone(message_id)
+        
+        if message.recipient_id and not message.room_id:
+            self.conversations.remove(message)
+        
+        if message.recipient_id and message.recipient_id in self.user_messages:
+            if message_id in self.user_messages[message.recipient_id]:
+                self.user_messages[message.recipient_id].remove(message_id)
+        
+        # Delete message
+        self.messages.pop(message_id, None)
+        self._dirty_reactions.pop(message_id, None)
+        if self.columns is not None:
+            self.columns.delete(message_id)
+        if self.search_index is not None:
+            self.search_index.remove(message_id)
+        if self.store is not None:
+            await self.store.delete(message_id)
+        
+        # Notify message callbacks
+        await self._notify_message_event("message_deleted", message)
+        
+        return True
+    
+    def defer_history(self, rooms: Dict[str, Tuple[int, Callable[[], Awaitable[List[Tuple[int, Message]]]]]],
+                      direct: Optional[Callable[[], Awaitable[List[Message]]]] = None,
+                      on_complete: Optional[Callable[[], None]] = None,
+                      unread: Optional[List[Tuple[str, str, int]]] = None):
+        """
+        Register restored message history for lazy hydration
+        Every room is hydrated in the background; a room that is read or
+        written before its turn is hydrated on demand first. Direct messages
+        rebuild the conversation index, then the (user_id, other_id, count)
+        unread counters are reapplied.
+        """
+        
+        self.deferred_rooms.update(rooms)
+        self.hydration_task = asyncio.create_task(self._hydrate_deferred(direct, on_complete, unread or []))
+    
+    async def wait_hydrated(self):
+        """Wait until all deferred history has been hydrated"""
+        
+        if self.hydration_task is not None and not self.hydration_task.done():
+            await asyncio.shield(self.hydration_task)
+    
+    async def _hydrate_deferred(self, direct: Optional[Callable[[], Awaitable[List[Message]]]],
+                                on_complete: Optional[Callable[[], None]], unread: List[Tuple[str, str, int]]):
+        """Hydrate direct messages, then every deferred room"""
+        
+        try:
+            if direct is not None:
+                for message in sorted(await direct(), key=lambda message: message.timestamp):
+                    self.messages[message.message_id] = message
+                    if message.recipient_id:
+                        self.conversations.append(message)
+                    if self.search_index is not None:
+                        self.search_index.add(message)
+                for user_id, other_id, count in unread:
+                    self.conversations.restore_unread(user_id, other_id, count, self.messages)
+            
+            while self.deferred_rooms:
+                room_id = next(iter(self.deferred_rooms))
+                try:
+                    await self._hydrate_room(room_id)
+                except Exception:
+                    logger.exception("Failed to hydrate history of room %s", room_id)
+        finally:
+            if on_complete is not None:
+                on_complete()
+    
+    async def _hydrate_room(self, room_id: str):
+        """Hydrate one deferred room, sharing the load between concurrent callers"""
+        
+        future = self._room_hydration.get(room_id)
+        if future is None:
+            future = self._room_hydration[room_id] = asyncio.ensure_future(self._load_room(room_id))
+        await asyncio.shield(future)
+    
+    async def _load_room(self, room_id: str):
+        """Load the history of a deferred room into a fresh message log"""
+        
+        next_seq, loader = self.deferred_rooms[room_id]
+        try:
+            log = RoomMessageLog()
+            for seq, message in await loader():
+                self.messages[message.message_id] = message
+                log.append(message.message_id, message.timestamp, seq)
+                if self.search_index is not None:
+                    self.search_index.add(message)
+            log.next_seq = max(log.next_seq, next_seq)
+            self.room_messages[room_id] = log
+        finally:
+            del self.deferred_rooms[room_id]
+            del self._room_hydration[room_id]
+    
+    async def _get_room_log(self, room_id: str, create: bool = False) -> Optional[RoomMessageLog]:
+        """Get the message log of a room, resuming its sequence from the store"""
+        
+        if room_id in self.deferred_rooms:
+            await self._hydrate_room(room_id)
+        
+        log = self.room_messages.get(room_id)
+        if log is not None or (self.store is None and not create):
+            return log
+        
+        log = RoomMessageLog()
+        if self.store is not None:
+            # Everything already stored for the room is cold history
+            log.next_seq = log.trimmed_before = await self.store.get_room_head(room_id)
+        
+        return self.room_messages.setdefault(room_id, log)
+    
+    async def _notify_message_event(self, event_type: str, message: Message):
+        """Notify callbacks about message events"""
+        
+        for callback in self.message_callbacks:
+            try:
+                await callback(event_type, message)
+            except Exception as e:
+                print(f"Error in message callback: {e}")
+    
+    def add_message_callback(self, callback: Callable):
+        """Add a callback for message events"""
+        self.message_callbacks.append(callback)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram in milliseconds"""
+    
+    BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0, 5000.0)
+    
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.BUCKETS) + 1)  # last bucket is overflow
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def record(self, latency_ms: float):
+        """Record one observation"""
+        
+        self.counts[bisect.bisect_left(self.BUCKETS, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+    
+    def percentile(self, percent: float) -> float:
+        """Estimate a percentile as the upper bound of its bucket (capped at the max seen)"""
+        
+        if not self.count:
+            return 0.0
+        
+        threshold = self.count * percent / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= threshold:
+                return min(self.BUCKETS[index], self.max_ms) if index < len(self.BUCKETS) else self.max_ms
+        return self.max_ms
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Get a serializable view of the histogram"""
+        
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+            "buckets": {
+                (f"<={bound}" if index < len(self.BUCKETS) else f">{self.BUCKETS[-1]}"): bucket_count
+                for index, (bound, bucket_count) in enumerate(zip(self.BUCKETS + (None,), self.counts))
+                if bucket_count
+            }
+        }
+
+class HandlerRegistration:
+    """An event handler with its execution settings and statistics"""
+    
+    def __init__(self, handler: EventHandler, timeout: Optional[float], fire_and_forget: bool):
+        self.handler = handler
+        self.timeout = timeout
+        self.fire_and_forget = fire_and_forget
+        self.latency = LatencyHistogram()
+        self.timeouts = 0
+        self.errors = 0
+
+class EventLog:
+    """
+    Fixed-capacity ring buffer of recent events
+    Events get monotonically increasing sequence numbers. Per-user, per-room
+    and per-type deques of sequence numbers act as secondary indexes; since
+    events are evicted oldest first, eviction only ever pops their left ends.
+    Evicted events can optionally spill to JSON-lines segment files; they
+    are serialized on eviction and written in batches by a single writer
+    thread, and segment numbers continue after those already in spill_dir.
+    """
+    
+    SEGMENT_NAME = re.compile(r"events-(\d+)\.jsonl$")
+    
+    def __init__(self, capacity: int = 10000, max_age: Optional[float] = None,
+                 spill_dir: Optional[str] = None, segment_events: int = 10000, spill_batch: int = 256):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.buffer: List[Optional[SocialEvent]] = [None] * capacity
+        self.first_seq = 0  # oldest retained sequence number
+        self.next_seq = 0   # sequence number of the next event
+        self.by_user: Dict[str, deque] = {}  # user_id -> seqs
+        self.by_room: Dict[str, deque] = {}  # room_id -> seqs
+        self.by_type: Dict[str, deque] = {}  # event_type -> seqs
+        
+        # Spill segments for history beyond the in-memory window
+        self.spill_dir = spill_dir
+        self.segment_events = segment_events
+        self.spill_batch = spill_batch
+        self._spill_pending: List[str] = []  # serialized lines not yet handed to the writer
+        self._spill_executor: Optional[ThreadPoolExecutor] = None
+        self._spill_future: Optional[Future] = None  # last submitted batch
+        self._segment_file = None  # only touched by the writer thread
+        self._segment_count = 0
+        self._next_segment = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            numbers = [
+                int(match.group(1))
+                for match in map(self.SEGMENT_NAME.match, os.listdir(spill_dir)) if match
+            ]
+            self._next_segment = max(numbers, default=-1) + 1
+    
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+    
+    def append(self, event: SocialEvent) -> int:
+        """Append an event, evicting the oldest one when full"""
+        
+        if len(self) >= self.capacity:
+            self._evict_oldest()
+        
+        seq = self.next_seq
+        self.buffer[seq % self.capacity] = event
+        self.next_seq += 1
+        
+        self._index(self.by_user, event.user_id, seq)
+        if event.room_id:
+            self._index(self.by_room, event.room_id, seq)
+        self._index(self.by_type, event.event_type, seq)
+        
+        self.expire(event.timestamp)
+        
+        return seq
+    
+    def get(self, seq: int) -> Optional[SocialEvent]:
+        """Get a retained event by sequence number"""
+        
+        if self.first_seq <= seq < self.next_seq:
+            return self.buffer[seq % self.capacity]
+        return None
+    
+    def expire(self, now: Optional[float] = None):
+        """Evict events older than max_age"""
+        
+        if self.max_age is None:
+            return
+        
+        cutoff = (time.time() if now is None else now) - self.max_age
+        while len(self) and self.buffer[self.first_seq % self.capacity].timestamp < cutoff:
+            self._evict_oldest()
+    
+    def recent(self, user_ids: List[str] = (), room_ids: List[str] = (),
+               event_types: List[str] = (), limit: int = 50) -> List[SocialEvent]:
+        """Get the newest events matching any of the given keys, newest first"""
+        
+        streams = [reversed(self.by_user[key]) for key in user_ids if key in self.by_user]
+        streams += [reversed(self.by_room[key]) for key in room_ids if key in self.by_room]
+        streams += [reversed(self.by_type[key]) for key in event_types if key in self.by_type]
+        
+        events = []
+        last_seq = None
+        
+        # Each stream is already newest first; merge and drop duplicate hits
+        for seq in heapq.merge(*streams, reverse=True):
+            if seq == last_seq:
+                continue
+            last_seq = seq
+            events.append(self.buffer[seq % self.capacity])
+            if len(events) >= limit:
+                break
+        
+        return events
+    
+    async def flush_spill(self):
+        """Hand pending spilled events to the writer and wait until they are on disk"""
+        
+        self._submit_spill()
+        if self._spill_future is not None:
+            await asyncio.wrap_future(self._spill_future)
+    
+    async def iter_spilled(self):
+        """
+        Iterate spilled events from newest to oldest
+        Pending events are flushed first. Segments are read backwards one
+        block at a time in an executor, so only the events actually consumed
+        are loaded and the loop never waits on the disk.
+        """
+        
+        if not self.spill_dir:
+            return
+        
+        await self.flush_spill()
+        
+        loop = asyncio.get_running_loop()
+        names = await loop.run_in_executor(None, os.listdir, self.spill_dir)
+        segments = sorted(
+            (name for name in names if self.SEGMENT_NAME.match(name)),
+            key=lambda name: int(self.SEGMENT_NAME.match(name).group(1)),
+            reverse=True
+        )
+        for name in segments:
+            async for line in self._read_lines_reversed(os.path.join(self.spill_dir, name)):
+                yield SocialEvent(**json.loads(line))
+    
+    def close(self):
+        """Write pending spilled events, then stop the writer and close the current segment"""
+        
+        if self._spill_executor is None:
+            return
+        
+        self._submit_spill()
+        self._spill_executor.submit(self._close_segment)
+        self._spill_executor.shutdown(wait=True)
+        self._spill_executor = None
+        self._spill_future = None
+    
+    def _index(self, index: Dict[str, deque], key: str, seq: int):
+        """Record a sequence number under an index key"""
+        if key not in index:
+            index[key] = deque()
+        index[key].append(seq)
+    
+    def _unindex(self, index: Dict[str, deque], key: str, seq: int):
+        """Drop an evicted sequence number from the front of an index key"""
+        seqs = index.get(key)
+        if seqs and seqs[0] == seq:
+            seqs.popleft()
+            if not seqs:
+                del index[key]
+    
+    def _evict_oldest(self):
+        """Drop the oldest event from the buffer and its indexes"""
+        
+        seq = self.first_seq
+        slot = seq % self.capacity
+        event = self.buffer[slot]
+        self.buffer[slot] = None
+        self.first_seq += 1
+        
+        self._unindex(self.by_user, event.user_id, seq)
+        if event.room_id:
+            self._unindex(self.by_room, event.room_id, seq)
+        self._unindex(self.by_type, event.event_type, seq)
+        
+        if self.spill_dir:
+            self._spill(seq, event)
+    
+    def _spill(self, seq: int, event: SocialEvent):
+        """Queue an evicted event for the spill writer"""
+        
+        self._spill_pending.append(json.dumps({
+            "event_id": event.event_id,
+            "event_type": event.event_type,
+            "user_id": event.user_id,
+            "room_id": event.room_id,
+            "data": event.data,
+            "timestamp": event.timestamp
+        }, default=str) + "\n")
+        
+        if len(self._spill_pending) >= self.spill_batch:
+            self._submit_spill()
+    
+    def _submit_spill(self):
+        """Hand the pending lines to the writer thread as one batch"""
+        
+        if not self._spill_pending:
+            return
+        
+        if self._spill_executor is None:
+            self._spill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-log-spill")
+        lines, self._spill_pending = self._spill_pending, []
+        self._spill_future = self._spill_executor.submit(self._write_spilled, lines)
+    
+    def _write_spilled(self, lines: List[str]):
+        """Write a batch of lines, starting new segments as they fill (writer thread)"""
+        
+        start = 0
+        while start < len(lines):
+            if self._segment_file is None or self._segment_count >= self.segment_events:
+                self._close_segment()
+                path = os.path.join(self.spill_dir, f"events-{self._next_segment:020d}.jsonl")
+                self._segment_file = open(path, "x", encoding="utf-8")
+                self._next_segment += 1
+                self._segment_count = 0
+            
+            end = min(len(lines), start + self.segment_events - self._segment_count)
+            self._segment_file.writelines(lines[start:end])
+            self._segment_count += end - start
+            start = end
+        
+        self._segment_file.flush()
+    
+    def _close_segment(self):
+        """Close the current segment file (writer thread)"""
+        
+        if self._segment_file is not None:
+            self._segment_file.close()
+            self._segment_file = None
+    
+    @classmethod
+    async def _read_lines_reversed(cls, path: str, block_size: int = 1 << 16):
+        """Yield the non-empty lines of a file from last to first, reading blocks backwards in an executor"""
+        
+        loop = asyncio.get_running_loop()
+        segment = await loop.run_in_executor(None, open, path, "rb")
+        try:
+            position = await loop.run_in_executor(None, segment.seek, 0, os.SEEK_END)
+            tail = b""
+            while position > 0:
+                step = min(block_size, position)
+                position -= step
+                block = await loop.run_in_executor(None, cls._read_at, segment, position, step)
+                lines = (block + tail).split(b"\n")
+                tail = lines.pop(0)
+                for line in reversed(lines):
+                    if line:
+                        yield line
+            if tail:
+                yield tail
+        finally:
+            segment.close()
+    
+    @staticmethod
+    def _read_at(segment, position: int, size: int) -> bytes:
+        """Read size bytes at position (executor)"""
+        
+        segment.seek(position)
+        return segment.read(size)
+
+class GatewayConnection:
+    """A client connection registered with the realtime gateway"""
+    
+    def __init__(self, connection_id: str, user_id: str, send: Callable[[bytes], Awaitable],
+                 close: Optional[Callable[[], Awaitable]], queue_size: int):
+        self.connection_id = connection_id
+        self.user_id = user_id
+        self.send = send
+        self.close = close
+        self.queue_size = queue_size
+        self.outbox: deque = deque()  # frames waiting to be written
+        self.writer: Optional[asyncio.Task] = None
+        self.connected_at = time.time()
+        self._waiter: Optional[asyncio.Future] = None
+    
+    def offer(self, frame: bytes) -> bool:
+        """Queue a frame, returning False if the outbox is full"""
         
-        message_ids = self.room_messages.get(room_id, [])
-        messages = []
+        if len(self.outbox) >= self.queue_size:
+            return False
         
-        for message_id in reversed(message_ids):  # Most recent first
-            message = self.messages.get(message_id)
-            if message:
-                if before_timestamp and message.timestamp >= before_timestamp:
-                    continue
-                messages.append(message)
-                if len(messages) >= limit:
-                    break
+        self.outbox.append(frame)
         
-        return messages
+        # Only an idle writer needs waking
+        waiter = self._waiter
+        if waiter is not None:
+            self._waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+        
+        return True
     
-    async def get_user_messages(self, user_id: str, limit: int = 50) -> List[Message]:
-        """Get direct messages for a user"""
+    async def wait_for_frames(self):
+        """Wait until the outbox is non-empty"""
         
-        message_ids = self.user_messages.get(user_id, [])
-        messages = []
+        while not self.outbox:
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+
+class RealtimeGateway:
+    """
+    Push delivery of social events to connected clients (e.g. WebSockets)
+    Each event is encoded to UTF-8 JSON bytes once no matter how many
+    recipients it has, and the same immutable bytes object is queued for every
+    one of them. Every connection drains its own bounded send queue; a client
+    whose queue fills up is evicted instead of stalling the publisher.
+    """
+    
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self.connections: Dict[str, GatewayConnection] = {}
+        self.user_connections: Dict[str, Set[str]] = {}  # user_id -> connection_ids
+        self.metrics: Dict[str, int] = {
+            "published": 0,
+            "serialized": 0,
+            "enqueued": 0,
+            "sent": 0,
+            "evicted": 0,
+            "send_errors": 0
+        }
+    
+    async def register(self, user_id: str, send: Callable[[bytes], Awaitable],
+                       close: Optional[Callable[[], Awaitable]] = None) -> str:
+        """Register a client connection and start its writer"""
         
-        for message_id in reversed(message_ids):  # Most recent first
-            message = self.messages.get(message_id)
-            if message:
-                messages.append(message)
-                if len(messages) >= limit:
-                    break
+        connection_id = str(uuid.uuid4())
+        connection = GatewayConnection(connection_id, user_id, send, close, self.queue_size)
+        connection.writer = asyncio.create_task(self._run_writer(connection))
         
-        return messages
+        self.connections[connection_id] = connection
+        if user_id not in self.user_connections:
+            self.user_connections[user_id] = set()
+        self.user_connections[user_id].add(connection_id)
+        
+        return connection_id
     
-    async def add_reaction(self, message_id: str, user_id: str, emoji: str) -> bool:
-        """Add reaction to a message"""
+    async def unregister(self, connection_id: str, close: bool = False) -> bool:
+        """Remove a client connection, optionally closing the transport"""
         
-        message = self.messages.get(message_id)
-        if not message:
+        connection = self._detach(connection_id)
+        if connection is None:
             return False
         
-        if emoji not in message.reactions:
-            message.reactions[emoji] = []
+        if connection.writer is not None and connection.writer is not asyncio.current_task():
+            connection.writer.cancel()
         
-        if user_id not in message.reactions[emoji]:
-            message.reactions[emoji].append(user_id)
-        
-        # Notify message callbacks
-        await self._notify_message_event("reaction_added", message)
+        if close and connection.close is not None:
+            try:
+                await connection.close()
+            except Exception:
+                logger.debug("Error closing gateway connection %s", connection_id, exc_info=True)
         
         return True
     
-    async def remove_reaction(self, message_id: str, user_id: str, emoji: str) -> bool:
-        """Remove reaction from a message"""
+    def is_connected(self, user_id: str) -> bool:
+        """Check whether a user has at least one live connection"""
+        return bool(self.user_connections.get(user_id))
+    
+    def publish(self, user_ids: Iterable[str], event: SocialEvent) -> int:
+        """Queue an event for every connection of the given users"""
         
-        message = self.messages.get(message_id)
-        if not message:
-            return False
+        self.metrics["published"] += 1
+        frame = None
+        enqueued = 0
         
-        if emoji in message.reactions and user_id in message.reactions[emoji]:
-            message.reactions[emoji].remove(user_id)
+        for user_id in user_ids:
+            connection_ids = self.user_connections.get(user_id)
+            if not connection_ids:
+                continue
             
-            # Remove emoji if no users have reacted with it
-            if not message.reactions[emoji]:
-                del message.reactions[emoji]
-            
-            # Notify message callbacks
-            await self._notify_message_event("reaction_removed", message)
+            # Encode lazily, and only once per event
+            if frame is None:
+                frame = self.encode_event(event)
+                self.metrics["serialized"] += 1
             
-            return True
+            enqueued += self._offer(connection_ids, frame)
         
-        return False
+        self.metrics["enqueued"] += enqueued
+        return enqueued
     
-    async def edit_message(self, message_id: str, new_content: str, user_id: str) -> bool:
-        """Edit a message"""
-        
-        message = self.messages.get(message_id)
-        if not message or message.sender_id != user_id:
-            return False
+    def publish_frame(self, user_ids: Iterable[str], frame: bytes) -> int:
+        """Queue an already encoded event frame, e.g. one forwarded from another process"""
         
-        message.content = new_content
-        message.edited_at = time.time()
+        self.metrics["published"] += 1
+        enqueued = 0
         
-        # Notify message callbacks
-        await self._notify_message_event("message_edited", message)
+        for user_id in user_ids:
+            connection_ids = self.user_connections.get(user_id)
+            if connection_ids:
+                enqueued += self._offer(connection_ids, frame)
         
-        return True
+        self.metrics["enqueued"] += enqueued
+        return enqueued
     
-    async def delete_message(self, message_id: str, user_id: str) -> bool:
-        """Delete a message"""
-        
-        message = self.messages.get(message_id)
-        if not message or message.sender_id != user_id:
-            return False
+    async def close_all(self):
+        """Disconnect every client"""
         
-        # Remove from indexes
-        if message.room_id and message.room_id in self.room_messages:
-            if message_id in self.room_messages[message.room_id]:
-                self.room_messages[message.room_id].remove(message_id)
+        for connection_id in list(self.connections):
+            await self.unregister(connection_id, close=True)
+    
+    @staticmethod
+    def encode_event(event: SocialEvent) -> bytes:
+        """Encode an event as the immutable JSON frame shared by all recipients"""
+        
+        payload = json.dumps({
+            "event_id": event.event_id,
+            "event_type": event.event_type,
+            "user_id": event.user_id,
+            "room_id": event.room_id,
+            "data": event.data or {},
+            "timestamp": event.timestamp
+        }, separators=(",", ":"), default=str)
+        
+        return payload.encode("utf-8")
+    
+    def _offer(self, connection_ids: Set[str], frame: bytes) -> int:
+        """Queue a frame on each connection, evicting the ones that are full"""
+        
+        enqueued = 0
+        for connection_id in list(connection_ids):
+            connection = self.connections[connection_id]
+            if connection.offer(frame):
+                enqueued += 1
+            else:
+                self._evict(connection)
+        
+        return enqueued
+    
+    def _detach(self, connection_id: str) -> Optional[GatewayConnection]:
+        """Remove a connection from the routing tables"""
         
-        if message.recipient_id and message.recipient_id in self.user_messages:
-            if message_id in self.user_messages[message.recipient_id]:
-                self.user_messages[message.recipient_id].remove(message_id)
+        connection = self.connections.pop(connection_id, None)
+        if connection is None:
+            return None
         
-        # Delete message
-        del self.messages[message_id]
+        connection_ids = self.user_connections.get(connection.user_id)
+        if connection_ids is not None:
+            connection_ids.discard(connection_id)
+            if not connection_ids:
+                del self.user_connections[connection.user_id]
         
-        # Notify message callbacks
-        await self._notify_message_event("message_deleted", message)
+        return connection
+    
+    def _evict(self, connection: GatewayConnection):
+        """Drop a slow consumer without blocking the publisher"""
+        
+        self.metrics["evicted"] += 1
+        self._detach(connection.connection_id)
+        if connection.writer is not None:
+            connection.writer.cancel()
+        if connection.close is not None:
+            asyncio.get_running_loop().create_task(self._close_quietly(connection))
+    
+    async def _close_quietly(self, connection: GatewayConnection):
+        """Close an evicted connection's transport"""
         
-        return True
+        try:
+            await connection.close()
+        except Exception:
+            logger.debug("Error closing evicted connection %s", connection.connection_id, exc_info=True)
     
-    async def _notify_message_event(self, event_type: str, message: Message):
-        """Notify callbacks about message events"""
+    async def _run_writer(self, connection: GatewayConnection):
+        """Write queued frames to one connection"""
         
-        for callback in self.message_callbacks:
+        while True:
+            if not connection.outbox:
+                await connection.wait_for_frames()
+            frame = connection.outbox.popleft()
             try:
-                await callback(event_type, message)
-            except Exception as e:
-                print(f"Error in message callback: {e}")
-    
-    def add_message_callback(self, callback: Callable):
-        """Add a callback for message events"""
-        self.message_callbacks.append(callback)
+                await connection.send(frame)
+                self.metrics["sent"] += 1
+            except Exception:
+                # The transport is gone; stop routing to it
+                self.metrics["send_errors"] += 1
+                await self.unregister(connection.connection_id)
+                return
 
 class RealtimeManager:
     """Manages real-time events and notifications"""
     
-    def __init__(self):
-        self.event_handlers: Dict[str, List[EventHandler]] = {}
+    def __init__(self, event_log_capacity: int = 10000, event_max_age: Optional[float] = None,
+                 spill_dir: Optional[str] = None, handler_timeout: Optional[float] = 5.0,
+                 background_workers: int = 4, background_queue_size: int = 10000):
+        self.event_handlers: Dict[str, List[HandlerRegistration]] = {}
+        self.handler_timeout = handler_timeout
         self.user_subscriptions: Dict[str, Set[str]] = {}  # user_id -> event_types
+        self.event_subscribers: Dict[str, Set[str]] = {}  # event_type -> user_ids
         self.room_subscriptions: Dict[str, Set[str]] = {}  # room_id -> user_ids
-        self.event_queue: List[SocialEvent] = []
+        self.user_rooms: Dict[str, Set[str]] = {}  # user_id -> subscribed room_ids
+        self.event_log = EventLog(event_log_capacity, event_max_age, spill_dir)
+        self.gateway = RealtimeGateway()
+        
+        # Worker pool for fire-and-forget handlers
+        self.background_workers = background_workers
+        self.background_queue_size = background_queue_size
+        self.background_dropped = 0
+        self._background_queue: Optional[asyncio.Queue] = None
+        self._background_tasks: List[asyncio.Task] = []
+        self._background_loop: Optional[asyncio.AbstractEventLoop] = None
     
     async def subscribe_user(self, user_id: str, event_types: List[str]):
         """Subscribe user to event types"""
@@ -790,12 +4108,24 @@ class RealtimeManager:
             self.user_subscriptions[user_id] = set()
         
         self.user_subscriptions[user_id].update(event_types)
+        
+        for event_type in event_types:
+            if event_type not in self.event_subscribers:
+                self.event_subscribers[event_type] = set()
+            self.event_subscribers[event_type].add(user_id)
     
     async def unsubscribe_user(self, user_id: str, event_types: List[str]):
         """Unsubscribe user from event types"""
         
         if user_id in self.user_subscriptions:
             self.user_subscriptions[user_id].difference_update(event_types)
+        
+        for event_type in event_types:
+            subscribers = self.event_subscribers.get(event_type)
+            if subscribers is not None:
+                subscribers.discard(user_id)
+                if not subscribers:
+                    del self.event_subscribers[event_type]
     
     async def subscribe_to_room(self, user_id: str, room_id: str):
         """Subscribe user to room events"""
@@ -804,96 +4134,553 @@ class RealtimeManager:
             self.room_subscriptions[room_id] = set()
         
         self.room_subscriptions[room_id].add(user_id)
+        
+        if user_id not in self.user_rooms:
+            self.user_rooms[user_id] = set()
+        self.user_rooms[user_id].add(room_id)
     
     async def unsubscribe_from_room(self, user_id: str, room_id: str):
         """Unsubscribe user from room events"""
         
         if room_id in self.room_subscriptions:
             self.room_subscriptions[room_id].discard(user_id)
+        
+        if user_id in self.user_rooms:
+            self.user_rooms[user_id].discard(room_id)
+    
+    async def subscribe_many_to_room(self, room_id: str, user_ids: Iterable[str]):
+        """Subscribe many users to room events"""
+        
+        if room_id not in self.room_subscriptions:
+            self.room_subscriptions[room_id] = set()
+        subscribers = self.room_subscriptions[room_id]
+        
+        for user_id in user_ids:
+            subscribers.add(user_id)
+            if user_id not in self.user_rooms:
+                self.user_rooms[user_id] = set()
+            self.user_rooms[user_id].add(room_id)
+    
+    async def unsubscribe_many_from_room(self, room_id: str, user_ids: Iterable[str]):
+        """Unsubscribe many users from room events"""
+        
+        subscribers = self.room_subscriptions.get(room_id)
+        
+        for user_id in user_ids:
+            if subscribers is not None:
+                subscribers.discard(user_id)
+            if user_id in self.user_rooms:
+                self.user_rooms[user_id].discard(room_id)
+        
+        if subscribers is not None and not subscribers:
+            del self.room_subscriptions[room_id]
     
     async def emit_event(self, event: SocialEvent):
         """Emit a social event"""
         
-        # Add to event queue
-        self.event_queue.append(event)
-        
-        # Process event handlers
-        if event.event_type in self.event_handlers:
-            for handler in self.event_handlers[event.event_type]:
-                try:
-                    await handler.handle_event(event)
-                except Exception as e:
-                    print(f"Error in event handler: {e}")
+        # Add to event log
+        self.event_log.append(event)
+        
+        # Process event handlers concurrently; fire-and-forget ones go to the worker pool
+        registrations = self.event_handlers.get(event.event_type)
+        if registrations:
+            inline = []
+            for registration in registrations:
+                if registration.fire_and_forget:
+                    self._submit_background(registration, event)
+                else:
+                    inline.append(self._run_handler(registration, event))
+            
+            if len(inline) == 1:
+                await inline[0]
+            elif inline:
+                await asyncio.gather(*inline)
         
         # Notify subscribed users
         await self._notify_subscribers(event)
     
-    async def _notify_subscribers(self, event: SocialEvent):
-        """Notify users subscribed to this event type"""
+    async def _run_handler(self, registration: HandlerRegistration, event: SocialEvent):
+        """Run one handler with its timeout, recording latency and failures"""
+        
+        start = time.perf_counter()
+        try:
+            if registration.timeout is not None:
+                await asyncio.wait_for(registration.handler.handle_event(event), registration.timeout)
+            else:
+                await registration.handler.handle_event(event)
+        except asyncio.TimeoutError:
+            registration.timeouts += 1
+            logger.warning("Event handler %r timed out after %ss on %s",
+                           registration.handler, registration.timeout, event.event_type)
+        except Exception:
+            registration.errors += 1
+            logger.exception("Error in event handler %r", registration.handler)
+        finally:
+            registration.latency.record((time.perf_counter() - start) * 1000)
+    
+    def _submit_background(self, registration: HandlerRegistration, event: SocialEvent):
+        """Queue a fire-and-forget handler run on the worker pool"""
+        
+        loop = loop_to_rebind(self._background_loop)
+        if loop is not None:
+            self._background_loop = loop
+            self._background_queue = asyncio.Queue(maxsize=self.background_queue_size)
+            self._background_tasks = [
+                loop.create_task(self._run_background_worker(self._background_queue))
+                for _ in range(self.background_workers)
+            ]
+        
+        try:
+            self._background_queue.put_nowait((registration, event))
+        except asyncio.QueueFull:
+            self.background_dropped += 1
+    
+    async def _run_background_worker(self, queue: asyncio.Queue):
+        """Run queued fire-and-forget handlers"""
+        
+        while True:
+            registration, event = await queue.get()
+            try:
+                await self._run_handler(registration, event)
+            finally:
+                queue.task_done()
+    
+    async def drain_handlers(self):
+        """Wait until all queued fire-and-forget handlers have run"""
         
-        notified_users = set()
+        if self._background_queue is not None:
+            await self._background_queue.join()
+    
+    async def stop_handler_workers(self):
+        """Drain and stop the fire-and-forget worker pool"""
         
-        # Notify users subscribed to this event type
-        for user_id, subscriptions in self.user_subscriptions.items():
-            if event.event_type in subscriptions:
-                notified_users.add(user_id)
+        if self._background_loop is None:
+            return
         
-        # Notify users subscribed to the room
-        if event.room_id and event.room_id in self.room_subscriptions:
-            notified_users.update(self.room_subscriptions[event.room_id])
+        await self.drain_handlers()
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
         
-        # Send notifications (this would integrate with actual notification system)
-        for user_id in notified_users:
-            await self._send_notification(user_id, event)
+        self._background_tasks = []
+        self._background_queue = None
+        self._background_loop = None
     
-    async def _send_notification(self, user_id: str, event: SocialEvent):
-        """Send notification to user (placeholder for actual implementation)"""
+    async def _notify_subscribers(self, event: SocialEvent):
+        """Notify users subscribed to this event type"""
+        
+        # Users subscribed to this event type
+        type_subscribers = self.event_subscribers.get(event.event_type)
+        
+        # Users subscribed to the room
+        room_subscribers = self.room_subscriptions.get(event.room_id) if event.room_id else None
+        
+        # Only copy when both audiences have to be merged; a plain room
+        # broadcast hands the room's subscriber set straight to the gateway
+        if type_subscribers and room_subscribers:
+            notified_users = room_subscribers.union(type_subscribers)
+        else:
+            notified_users = room_subscribers or type_subscribers or ()
         
-        # This would integrate with WebSocket, push notifications, etc.
-        print(f"Notification to {user_id}: {event.event_type}")
+        # Push to connected clients, the event is serialized once for all of them
+        self.gateway.publish(notified_users, event)
     
-    def add_event_handler(self, event_type: str, handler: EventHandler):
-        """Add an event handler for a specific event type"""
+    def add_event_handler(self, event_type: str, handler: EventHandler,
+                          timeout: Optional[float] = None, fire_and_forget: bool = False):
+        """
+        Add an event handler for a specific event type
+        timeout defaults to the manager's handler_timeout; fire_and_forget handlers
+        run on the background worker pool instead of delaying emit_event.
+        """
         
         if event_type not in self.event_handlers:
             self.event_handlers[event_type] = []
         
-        self.event_handlers[event_type].append(handler)
+        self.event_handlers[event_type].append(HandlerRegistration(
+            handler,
+            timeout if timeout is not None else self.handler_timeout,
+            fire_and_forget
+        ))
     
-    async def get_recent_events(self, user_id: str, limit: int = 50) -> List[SocialEvent]:
-        """Get recent events for a user"""
+    def get_handler_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get latency histograms and failure counts per registered handler"""
+        
+        stats = {}
+        for event_type, registrations in self.event_handlers.items():
+            for registration in registrations:
+                key = f"{event_type}:{type(registration.handler).__name__}:{id(registration.handler):x}"
+                stats[key] = {
+                    "fire_and_forget": registration.fire_and_forget,
+                    "timeout": registration.timeout,
+                    "timeouts": registration.timeouts,
+                    "errors": registration.errors,
+                    "latency": registration.latency.snapshot()
+                }
+        return stats
+    
+    async def get_recent_events(self, user_id: str, limit: int = 50,
+                                include_history: bool = False) -> List[SocialEvent]:
+        """Get recent events for a user, optionally reaching into spilled history"""
         
         user_subscriptions = self.user_subscriptions.get(user_id, set())
-        relevant_events = []
+        user_rooms = self.user_rooms.get(user_id, set())
+        
+        self.event_log.expire()
+        relevant_events = self.event_log.recent(
+            user_ids=[user_id],
+            room_ids=list(user_rooms),
+            event_types=list(user_subscriptions),
+            limit=limit
+        )
         
-        for event in reversed(self.event_queue):  # Most recent first
-            if (event.event_type in user_subscriptions or 
-                event.user_id == user_id or
-                (event.room_id and event.room_id in self.room_subscriptions and 
-                 user_id in self.room_subscriptions[event.room_id])):
-                
-                relevant_events.append(event)
-                if len(relevant_events) >= limit:
-                    break
+        # Continue into spilled history beyond the in-memory window
+        if include_history and len(relevant_events) < limit:
+            async with aclosing(self.event_log.iter_spilled()) as spilled:
+                async for event in spilled:
+                    if (event.event_type in user_subscriptions or
+                        event.user_id == user_id or
+                        event.room_id in user_rooms):
+                        
+                        relevant_events.append(event)
+                        if len(relevant_events) >= limit:
+                            break
         
         return relevant_events
 
+class PlatformSnapshot:
+    """
+    Streamed binary snapshot of platform state
+    The file is a magic header, a sequence of blocks and a JSON footer. Each
+    block is a section tag, a record count and a zlib-compressed JSON array
+    of up to block_records records, so writing never holds more than one
+    block in memory. The footer maps every section, and the message history
+    of every room, to its block offsets so a reader can load any of them
+    independently.
+    """
+    
+    MAGIC = b"SOCIALSNAP\x01\n"
+    BLOCK_HEADER = struct.Struct("<BII")  # section, record count, payload bytes
+    TRAILER = struct.Struct("<Q")         # footer offset
+    YIELD_RECORDS = 100                   # records converted between event loop yields
+    SECTIONS = ("users", "connections", "rooms", "event_subscriptions", "room_subscriptions",
+                "room_messages", "direct_messages", "recipient_index", "conversations")
+    
+    def __init__(self, path: str, mode: str = "rb", block_records: int = 1000):
+        self.path = path
+        self.block_records = block_records
+        self.footer: Dict[str, Any] = {"version": 1, "sections": {name: [] for name in self.SECTIONS}, "rooms": {}}
+        self._lock = threading.Lock()
+        
+        if mode == "wb":
+            # Written to a temporary file and renamed on close
+            self._file = open(path + ".tmp", "wb")
+            self._file.write(self.MAGIC)
+        else:
+            self._file = open(path, "rb")
+            if self._file.read(len(self.MAGIC)) != self.MAGIC:
+                self._file.close()
+                raise ValueError(f"Not a platform snapshot: {path}")
+            self._file.seek(-self.TRAILER.size, os.SEEK_END)
+            footer_offset, = self.TRAILER.unpack(self._file.read(self.TRAILER.size))
+            self._file.seek(footer_offset)
+            self.footer = json.loads(self._file.read()[:-self.TRAILER.size])
+    
+    def write_section(self, section: str, records: Iterable[Any]) -> List[int]:
+        """Write records in blocks and return the block offsets"""
+        
+        records = iter(records)
+        offsets = []
+        for block in iter(lambda: list(islice(records, self.block_records)), []):
+            offsets.append(self._write_block(section, block))
+        self.footer["sections"][section].extend(offsets)
+        return offsets
+    
+    async def write_blocks(self, section: str, records: Iterable[Any]) -> List[int]:
+        """
+        Write records in blocks, compressing and writing off the event loop
+        Records are pulled from the iterable on the loop a few at a time,
+        yielding in between, and must not share mutable state with live
+        objects, since each block is encoded in an executor while the loop
+        keeps running.
+        """
+        
+        loop = asyncio.get_running_loop()
+        records = iter(records)
+        offsets = []
+        while True:
+            block = []
+            while len(block) < self.block_records:
+                chunk = list(islice(records, min(self.YIELD_RECORDS, self.block_records - len(block))))
+                if not chunk:
+                    break
+                block.extend(chunk)
+                await asyncio.sleep(0)
+            if not block:
+                break
+            offsets.append(await loop.run_in_executor(None, self._write_block, section, block))
+        self.footer["sections"][section].extend(offsets)
+        return offsets
+    
+    def commit(self):
+        """Write the footer and atomically replace the snapshot file"""
+        
+        footer_offset = self._file.tell()
+        self._file.write(json.dumps(self.footer, separators=(",", ":")).encode("utf-8"))
+        self._file.write(self.TRAILER.pack(footer_offset))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+    
+    def close(self):
+        """Close the file, discarding an uncommitted write"""
+        
+        if not self._file.closed:
+            self._file.close()
+            if "w" in self._file.mode:
+                os.remove(self.path + ".tmp")
+    
+    def read_block(self, offset: int) -> List[Any]:
+        """Read and decode one block; safe to call from several threads"""
+        
+        with self._lock:
+            self._file.seek(offset)
+            _, count, size = self.BLOCK_HEADER.unpack(self._file.read(self.BLOCK_HEADER.size))
+            payload = self._file.read(size)
+        return json.loads(zlib.decompress(payload))
+    
+    async def iter_blocks(self, offsets: List[int]):
+        """Read blocks off the event loop, yielding the records of each"""
+        
+        loop = asyncio.get_running_loop()
+        for offset in offsets:
+            yield await loop.run_in_executor(None, self.read_block, offset)
+    
+    def _write_block(self, section: str, records: List[Any]) -> int:
+        """Compress and append one block"""
+        
+        offset = self._file.tell()
+        payload = zlib.compress(json.dumps(records, separators=(",", ":"), default=self._encode_value).encode("utf-8"))
+        self._file.write(self.BLOCK_HEADER.pack(self.SECTIONS.index(section), len(records), len(payload)))
+        self._file.write(payload)
+        return offset
+    
+    @staticmethod
+    def _encode_value(value: Any) -> Any:
+        """JSON fallback for enums and sets"""
+        
+        if isinstance(value, Enum):
+            return value.value
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f"Cannot snapshot {type(value).__name__}")
+    
+    # Record codecs
+    @staticmethod
+    def decode_user(record: Dict[str, Any]) -> UserProfile:
+        record["status"] = UserStatus(record["status"])
+        record["privacy_settings"] = {key: PrivacyLevel(level) for key, level in record["privacy_settings"].items()}
+        return UserProfile(**record)
+    
+    @staticmethod
+    def decode_connection(record: Dict[str, Any]) -> SocialConnection:
+        record["connection_type"] = ConnectionType(record["connection_type"])
+        return SocialConnection(**record)
+    
+    @staticmethod
+    def decode_room(record: Dict[str, Any]) -> SocialRoom:
+        record["room_type"] = RoomType(record["room_type"])
+        record["current_users"] = set(record["current_users"])
+        record["moderators"] = set(record["moderators"])
+        return SocialRoom(**record)
+    
+    @staticmethod
+    def decode_message(record: Dict[str, Any]) -> Message:
+        if record["reactions"]:
+            record["reactions"] = {emoji: set(user_ids) for emoji, user_ids in record["reactions"].items()}
+        return Message(**record)
+
 class SocialPlatform:
     """
     Main social platform that orchestrates all social features
     Provides a unified interface for social interactions
     """
     
-    def __init__(self):
+    def __init__(self, message_store: Optional[MessageStore] = None, columnar_messages: bool = False,
+                 searchable_messages: bool = False):
         self.user_manager = UserManager()
         self.connection_manager = ConnectionManager()
         self.room_manager = RoomManager()
-        self.message_manager = MessageManager()
+        self.message_manager = MessageManager(
+            store=message_store, columnar=columnar_messages, searchable=searchable_messages
+        )
         self.realtime_manager = RealtimeManager()
         
         # Set up cross-component callbacks
         self._setup_callbacks()
     
+    async def start(self):
+        """Start background maintenance tasks"""
+        
+        self.user_manager.start_session_expiry()
+        self.connection_manager.start_friend_graph_refresh()
+        await self.message_manager.open()
+    
+    async def shutdown(self):
+        """Stop background maintenance tasks"""
+        
+        await self.user_manager.stop_session_expiry()
+        await self.connection_manager.stop_friend_graph_refresh()
+        await self.user_manager.presence_dispatcher.close()
+        await self.message_manager.flush_reactions()
+        await self.realtime_manager.stop_handler_workers()
+        await self.realtime_manager.gateway.close_all()
+        self.realtime_manager.event_log.close()
+        if self.message_manager.hydration_task is not None:
+            self.message_manager.hydration_task.cancel()
+        search_index = self.message_manager.search_index
+        if search_index is not None and search_index.compaction_task is not None:
+            search_index.compaction_task.cancel()
+        if self.message_manager.store is not None:
+            await self.message_manager.store.close()
+    
+    async def save_snapshot(self, path: str, block_records: int = 1000):
+        """
+        Write a snapshot of all managers to path
+        Each collection is copied by reference when its section starts, then
+        records are converted on the loop one block at a time while
+        compression and file writes run in an executor, so a large save keeps
+        yielding to other traffic. A record changed while the save is running
+        may be written in either state. With a message store only room
+        sequence numbers are written, since the messages themselves are
+        already durable.
+        """
+        
+        await self.message_manager.wait_hydrated()
+        
+        loop = asyncio.get_running_loop()
+        message_manager = self.message_manager
+        snapshot = await loop.run_in_executor(None, PlatformSnapshot, path, "wb", block_records)
+        try:
+            await snapshot.write_blocks("users", map(asdict, list(self.user_manager.users.values())))
+            await snapshot.write_blocks("connections", map(asdict, list(self.connection_manager.connections.values())))
+            await snapshot.write_blocks("rooms", map(asdict, list(self.room_manager.rooms.values())))
+            await snapshot.write_blocks("event_subscriptions", (
+                [user_id, list(event_types)]
+                for user_id, event_types in list(self.realtime_manager.user_subscriptions.items())
+            ))
+            await snapshot.write_blocks("room_subscriptions", (
+                [room_id, list(user_ids)]
+                for room_id, user_ids in list(self.realtime_manager.room_subscriptions.items())
+            ))
+            
+            for room_id, log in list(message_manager.room_messages.items()):
+                next_seq = log.next_seq
+                blocks = []
+                if message_manager.store is None:
+                    entries = zip(log.seqs[:], log.message_ids[:])  # copied, the log may be trimmed meanwhile
+                    blocks = await snapshot.write_blocks("room_messages", (
+                        [seq, asdict(message)] for seq, message in (
+                            (seq, message_manager.messages.get(message_id)) for seq, message_id in entries
+                            if message_id is not None
+                        ) if message is not None
+                    ))
+                snapshot.footer["rooms"][room_id] = {"next_seq": next_seq, "blocks": blocks}
+            
+            if message_manager.store is None:
+                await snapshot.write_blocks("direct_messages", (
+                    asdict(message) for message in list(message_manager.messages.values()) if not message.room_id
+                ))
+                await snapshot.write_blocks("recipient_index", (
+                    [user_id, list(message_ids)] for user_id, message_ids in list(message_manager.user_messages.items())
+                ))
+                await snapshot.write_blocks("conversations", (
+                    [user_id, conversation.other(user_id), count]
+                    for conversation in list(message_manager.conversations.conversations.values())
+                    for user_id, count in list(conversation.unread.items())
+                ))
+            
+            await loop.run_in_executor(None, snapshot.commit)
+        finally:
+            snapshot.close()
+    
+    async def restore_snapshot(self, path: str):
+        """
+        Load a snapshot written by save_snapshot into this platform
+        Users, connections, rooms and subscriptions are loaded before this
+        returns. Message history is hydrated in the background, and a room
+        that is accessed before its turn is hydrated on demand.
+        """
+        
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(None, PlatformSnapshot, path)
+        sections = snapshot.footer["sections"]
+        
+        try:
+            # Sessions are not snapshotted, so nobody is still logged in after a
+            # restore; users come back offline until they start a new session
+            async for records in snapshot.iter_blocks(sections["users"]):
+                for record in records:
+                    user = PlatformSnapshot.decode_user(record)
+                    user.status = UserStatus.OFFLINE
+                    self.user_manager.add_user(user)
+            
+            async for records in snapshot.iter_blocks(sections["connections"]):
+                for record in records:
+                    self.connection_manager.add_connection(PlatformSnapshot.decode_connection(record))
+            
+            async for records in snapshot.iter_blocks(sections["rooms"]):
+                for record in records:
+                    self.room_manager.add_room(PlatformSnapshot.decode_room(record))
+            
+            async for records in snapshot.iter_blocks(sections["event_subscriptions"]):
+                for user_id, event_types in records:
+                    await self.realtime_manager.subscribe_user(user_id, event_types)
+            
+            async for records in snapshot.iter_blocks(sections["room_subscriptions"]):
+                for room_id, user_ids in records:
+                    for user_id in user_ids:
+                        await self.realtime_manager.subscribe_to_room(user_id, room_id)
+            
+            async for records in snapshot.iter_blocks(sections["recipient_index"]):
+                for user_id, message_ids in records:
+                    self.message_manager.user_messages[user_id] = message_ids
+            
+            unread = []
+            async for records in snapshot.iter_blocks(sections.get("conversations", [])):
+                unread.extend(records)
+        except BaseException:
+            snapshot.close()
+            raise
+        
+        if self.message_manager.store is not None:
+            snapshot.close()
+            return
+        
+        def room_loader(offsets: List[int]) -> Callable[[], Awaitable[List[Tuple[int, Message]]]]:
+            async def load() -> List[Tuple[int, Message]]:
+                return [
+                    (seq, PlatformSnapshot.decode_message(record))
+                    async for records in snapshot.iter_blocks(offsets)
+                    for seq, record in records
+                ]
+            return load
+        
+        async def load_direct() -> List[Message]:
+            return [
+                PlatformSnapshot.decode_message(record)
+                async for records in snapshot.iter_blocks(sections["direct_messages"])
+                for record in records
+            ]
+        
+        self.message_manager.defer_history(
+            {room_id: (entry["next_seq"], room_loader(entry["blocks"]))
+             for room_id, entry in snapshot.footer["rooms"].items()},
+            load_direct,
+            snapshot.close,
+            unread
+        )
+    
     def _setup_callbacks(self):
         """Set up callbacks between components"""
         
@@ -921,6 +4708,22 @@ class SocialPlatform:
         
         self.room_manager.add_room_callback(on_room_event)
         
+        # Bulk membership changes: one event for the whole delta. Joiners are
+        # subscribed first and leavers unsubscribed last, so both get it.
+        async def on_membership_delta(room_id: str, joined: List[str], left: List[str], actor_id: str):
+            await self.realtime_manager.subscribe_many_to_room(room_id, joined)
+            event = SocialEvent(
+                event_id=str(uuid.uuid4()),
+                event_type="room_members_changed",
+                user_id=actor_id,
+                room_id=room_id,
+                data={"joined": joined, "left": left}
+            )
+            await self.realtime_manager.emit_event(event)
+            await self.realtime_manager.unsubscribe_many_from_room(room_id, left)
+        
+        self.room_manager.add_membership_callback(on_membership_delta)
+        
         # Message event callbacks
         async def on_message_event(event_type: str, message: Message):
             event = SocialEvent(
@@ -934,6 +4737,10 @@ class SocialPlatform:
                     "message_type": message.message_type
                 }
             )
+            if event_type == "reaction_summary":
+                event.data["reaction_counts"] = {
+                    emoji: len(user_ids) for emoji, user_ids in (message.reactions or {}).items()
+                }
             await self.realtime_manager.emit_event(event)
         
         self.message_manager.add_message_callback(on_message_event)
@@ -981,6 +4788,20 @@ class SocialPlatform:
         
         return {"success": success}
     
+    async def touch_session(self, session_id: str) -> Dict[str, Any]:
+        """Keep a session alive"""
+        
+        success = await self.user_manager.touch_session(session_id)
+        
+        return {"success": success}
+    
+    async def logout_sessions(self, session_ids: List[str]) -> Dict[str, Any]:
+        """Logout many sessions at once (e.g. on mass disconnect)"""
+        
+        ended = await self.user_manager.end_sessions(session_ids)
+        
+        return {"success": True, "ended": ended}
+    
     # Social Connection API
     async def send_friend_request(self, user_id: str, target_user_id: str) -> Dict[str, Any]:
         """Send a friend request"""
@@ -1084,6 +4905,35 @@ class SocialPlatform:
         
         return {"success": success}
     
+    async def join_room_many(self, room_id: str, user_ids: List[str],
+                             actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Join many users to a room with a single membership event"""
+        
+        if not await self.room_manager.get_room(room_id):
+            return {"success": False, "error": "Room not found"}
+        
+        joined = await self.room_manager.join_room_many(room_id, user_ids, actor_id)
+        return {"success": True, "joined": joined}
+    
+    async def leave_room_many(self, room_id: str, user_ids: List[str],
+                              actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Remove many users from a room with a single membership event"""
+        
+        if not await self.room_manager.get_room(room_id):
+            return {"success": False, "error": "Room not found"}
+        
+        left = await self.room_manager.leave_room_many(room_id, user_ids, actor_id)
+        return {"success": True, "left": left}
+    
+    async def evacuate_room(self, room_id: str, actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Remove every member of a room with a single membership event"""
+        
+        if not await self.room_manager.get_room(room_id):
+            return {"success": False, "error": "Room not found"}
+        
+        left = await self.room_manager.evacuate_room(room_id, actor_id)
+        return {"success": True, "left": left}
+    
     async def get_room_info(self, room_id: str) -> Dict[str, Any]:
         """Get room information"""
         
@@ -1134,37 +4984,161 @@ class SocialPlatform:
             }
         }
     
-    async def get_room_messages(self, room_id: str, limit: int = 50) -> Dict[str, Any]:
+    async def get_inbox(self, user_id: str, cursor: Optional[int] = None, limit: int = 20) -> Dict[str, Any]:
+        """Get a user's direct-message conversations, most recently active first"""
+        
+        conversations, next_cursor = await self.message_manager.get_inbox(user_id, limit, cursor)
+        
+        participants = await self.user_manager.get_sender_projections(
+            conversation.other(user_id) for conversation in conversations
+        )
+        last_messages = {
+            message.message_id: message
+            for message in await self.message_manager.get_messages([
+                conversation.last_message_id for conversation in conversations if conversation.last_message_id
+            ])
+        }
+        
+        conversation_list = []
+        for conversation in conversations:
+            last_message = last_messages.get(conversation.last_message_id)
+            conversation_list.append({
+                "participant": participants[conversation.other(user_id)],
+                "unread": conversation.unread[user_id],
+                "last_activity": conversation.last_activity,
+                "last_message": {
+                    "message_id": last_message.message_id,
+                    "sender_id": last_message.sender_id,
+                    "content": last_message.content,
+                    "timestamp": last_message.timestamp
+                } if last_message else None
+            })
+        
+        return {
+            "success": True,
+            "conversations": conversation_list,
+            "unread_total": await self.message_manager.get_unread_count(user_id),
+            "next_cursor": next_cursor
+        }
+    
+    async def get_conversation(self, user_id: str, other_id: str, cursor: Optional[int] = None,
+                               limit: int = 50, mark_read: bool = True) -> Dict[str, Any]:
+        """Get a page of the direct-message conversation with another user"""
+        
+        messages, next_cursor = await self.message_manager.get_conversation_messages(
+            user_id, other_id, limit, cursor
+        )
+        if mark_read:
+            await self.message_manager.mark_conversation_read(user_id, other_id)
+        
+        return {
+            "success": True,
+            "messages": [
+                {
+                    "message_id": message.message_id,
+                    "sender_id": message.sender_id,
+                    "content": message.content,
+                    "message_type": message.message_type,
+                    "timestamp": message.timestamp
+                }
+                for message in messages
+            ],
+            "next_cursor": next_cursor
+        }
+    
+    async def get_room_messages(self, room_id: str, limit: int = 50,
+                                cursor: Optional[int] = None) -> Dict[str, Any]:
         """Get messages from a room"""
         
-        messages = await self.message_manager.get_room_messages(room_id, limit)
+        messages, next_cursor = await self.message_manager.get_room_messages_page(room_id, limit, cursor)
+        
+        senders = await self.user_manager.get_sender_projections(message.sender_id for message in messages)
         
         message_list = []
         for message in messages:
-            sender = await self.user_manager.get_user(message.sender_id)
             message_list.append({
                 "message_id": message.message_id,
-                "sender": {
-                    "user_id": sender.user_id,
-                    "username": sender.username,
-                    "display_name": sender.display_name
-                } if sender else None,
+                "sender": senders[message.sender_id],
                 "content": message.content,
                 "message_type": message.message_type,
                 "timestamp": message.timestamp,
-                "reactions": message.reactions
+                "reactions": {emoji: list(user_ids) for emoji, user_ids in (message.reactions or {}).items()}
             })
         
         return {
             "success": True,
-            "messages": message_list
+            "messages": message_list,
+            "next_cursor": next_cursor
+        }
+    
+    async def get_message_activity(self, window: float = 3600.0, limit: int = 10) -> Dict[str, Any]:
+        """Get per-room message counts and top senders over the last window seconds"""
+        
+        columns = self.message_manager.columns
+        if columns is None:
+            return {"success": False, "error": "Message analytics are not enabled"}
+        
+        since = time.time() - window
+        return {
+            "success": True,
+            "window": window,
+            "messages_per_room": columns.count_by_room(since=since),
+            "top_senders": [
+                {"user_id": user_id, "messages": count}
+                for user_id, count in columns.top_senders(limit, since=since)
+            ]
+        }
+    
+    async def search_messages(self, query: str, room_id: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """Search message contents; quoted phrases must match exactly"""
+        
+        if self.message_manager.search_index is None:
+            return {"success": False, "error": "Message search is not enabled"}
+        
+        results = await self.message_manager.search_messages(query, room_id, limit)
+        senders = await self.user_manager.get_sender_projections(message.sender_id for message, _ in results)
+        
+        return {
+            "success": True,
+            "results": [
+                {
+                    "message_id": message.message_id,
+                    "room_id": message.room_id,
+                    "sender": senders[message.sender_id],
+                    "content": message.content,
+                    "timestamp": message.timestamp,
+                    "score": score
+                }
+                for message, score in results
+            ]
         }
     
     # Search and Discovery API
-    async def search_users(self, query: str, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+    async def get_online_users(self, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """Get a page of online users for the presence sidebar"""
+        
+        users, next_cursor = await self.user_manager.get_online_users_page(cursor, limit)
+        
+        return {
+            "success": True,
+            "users": [
+                {
+                    "user_id": user.user_id,
+                    "username": user.username,
+                    "display_name": user.display_name,
+                    "status": user.status.value
+                }
+                for user in users
+            ],
+            "next_cursor": next_cursor,
+            "counts": await self.user_manager.get_status_counts()
+        }
+    
+    async def search_users(self, query: str, filters: Dict[str, Any] = None,
+                           limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
         """Search for users"""
         
-        users = await self.user_manager.search_users(query, filters)
+        users = await self.user_manager.search_users(query, filters, limit, offset)
         
         user_list = []
         for user in users:
@@ -1204,26 +5178,46 @@ class SocialPlatform:
             "rooms": room_list
         }
     
+    async def get_popular_rooms(self, limit: int = 10, has_space: bool = False) -> Dict[str, Any]:
+        """Get the most occupied rooms"""
+        
+        rooms = await self.room_manager.get_popular_rooms(limit, has_space)
+        
+        return {
+            "success": True,
+            "rooms": [
+                {
+                    "room_id": room.room_id,
+                    "name": room.name,
+                    "room_type": room.room_type.value,
+                    "current_users": len(room.current_users),
+                    "capacity": room.capacity
+                }
+                for room in rooms
+            ]
+        }
+    
     async def get_suggestions(self, user_id: str) -> Dict[str, Any]:
         """Get personalized suggestions for a user"""
         
         # Get friend suggestions
         friend_suggestions = await self.connection_manager.suggest_connections(user_id)
         
+        # Batch mutual friend and shared interest lookups for all suggestions
+        mutual_counts = await self.connection_manager.count_mutuals(user_id, friend_suggestions)
+        common_interests = await self.user_manager.get_common_interests(user_id, friend_suggestions)
+        
         # Get suggested users info
         suggested_users = []
         for suggested_user_id in friend_suggestions:
             user = await self.user_manager.get_user(suggested_user_id)
             if user:
-                mutual_friends = await self.connection_manager.get_mutual_connections(
-                    user_id, suggested_user_id
-                )
                 suggested_users.append({
                     "user_id": user.user_id,
                     "username": user.username,
                     "display_name": user.display_name,
-                    "mutual_friends_count": len(mutual_friends),
-                    "common_interests": []  # Could be calculated based on interests
+                    "mutual_friends_count": mutual_counts[suggested_user_id],
+                    "common_interests": common_interests[suggested_user_id]
                 })
         
         return {
@@ -1317,6 +5311,9 @@ async def demo_social_platform():
     suggestions = await platform.get_suggestions(user1_id)
     print(f"Friend suggestions: {len(suggestions['friend_suggestions'])}")
     
+    # Deliver outstanding notifications and stop background tasks
+    await platform.shutdown()
+    
     return {
         "platform": platform,
         "users": [user1_id, user2_id],
@@ -0,0 +1,601 @@
+"""
+Sharded Social Platform
+Spreads rooms, their members and their messages over worker processes
+
+Each shard process runs its own SocialPlatform and serves requests over a
+Unix socket. Rooms are assigned to shards by consistent hashing on room_id,
+so every operation on a room is handled by the one process that owns it.
+Users stay in the front process, which projects message senders itself.
+Clients connect to the front process, so realtime events raised on a shard
+are pushed back over the shard socket and delivered by the front gateway.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Any, Callable, Iterable, Optional, Set
+
+from social_platform import RealtimeGateway, SocialEvent, SocialPlatform, UserManager
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("<I")
+
+async def _read_frame(reader: asyncio.StreamReader) -> Optional[Any]:
+    """Read one length-prefixed JSON frame, None at end of stream"""
+    
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        payload = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+    return json.loads(payload)
+
+class FrameWriter:
+    """
+    Coalescing writer of length-prefixed JSON frames
+    Frames written during one event loop iteration are joined and handed to
+    the transport in a single write, so a pipelined burst of requests or
+    responses costs one syscall instead of one per frame.
+    """
+    
+    HIGH_WATER = 65536
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.frames: List[bytes] = []
+        self.buffered = 0
+    
+    def write(self, value: Any):
+        """Queue one frame, flushing at the end of the loop iteration"""
+        
+        payload = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        if not self.frames:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.frames.append(FRAME_HEADER.pack(len(payload)))
+        self.frames.append(payload)
+        self.buffered += FRAME_HEADER.size + len(payload)
+    
+    def flush(self):
+        """Hand the queued frames to the transport"""
+        
+        if self.frames and not self.writer.is_closing():
+            self.writer.write(b"".join(self.frames))
+        self.frames.clear()
+        self.buffered = 0
+    
+    async def drain(self):
+        """Apply back-pressure once enough output is queued or unsent"""
+        
+        if self.buffered + self.writer.transport.get_write_buffer_size() > self.HIGH_WATER:
+            self.flush()
+            await self.writer.drain()
+    
+    def close(self):
+        """Flush and close the stream"""
+        
+        self.flush()
+        self.writer.close()
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to nodes
+    Every node owns `replicas` virtual points on the ring, so adding or
+    removing a node only moves the keys adjacent to its points, about 1/N
+    of them, and load stays even across nodes.
+    """
+    
+    def __init__(self, nodes: List[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self.points: List[int] = []  # sorted virtual point hashes
+        self.owners: Dict[int, str] = {}  # point hash -> node
+        
+        for node in nodes:
+            self.add_node(node)
+    
+    def __len__(self) -> int:
+        return len(self.points) // self.replicas
+    
+    @staticmethod
+    def hash(key: str) -> int:
+        """Stable 64-bit hash, identical in every process"""
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+    
+    def add_node(self, node: str):
+        """Place a node's virtual points on the ring"""
+        
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            if point in self.owners:
+                continue
+            self.owners[point] = node
+            bisect.insort(self.points, point)
+    
+    def remove_node(self, node: str):
+        """Take a node's virtual points off the ring"""
+        
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                del self.points[bisect.bisect_left(self.points, point)]
+    
+    def node_for(self, key: str) -> str:
+        """Get the node owning a key: the first point clockwise of its hash"""
+        
+        if not self.points:
+            raise LookupError("Hash ring has no nodes")
+        
+        index = bisect.bisect_right(self.points, self.hash(key))
+        return self.owners[self.points[index % len(self.points)]]
+
+class ShardGateway(RealtimeGateway):
+    """
+    Realtime gateway of a shard process
+    No client connects to a shard, so instead of queueing an event for local
+    connections it encodes it once and pushes it, with its recipients, to
+    every front process connected to the shard as an unsolicited frame
+    [None, "event", [user_ids, frame]].
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.fronts: Set[FrameWriter] = set()
+    
+    def publish(self, user_ids: Iterable[str], event: SocialEvent) -> int:
+        """Forward an event to the front processes for delivery"""
+        
+        self.metrics["published"] += 1
+        user_ids = list(user_ids)
+        if not user_ids or not self.fronts:
+            return 0
+        
+        frame = self.encode_event(event).decode("utf-8")
+        self.metrics["serialized"] += 1
+        for frames in self.fronts:
+            frames.write([None, "event", [user_ids, frame]])
+        
+        self.metrics["enqueued"] += len(self.fronts)
+        return len(self.fronts)
+
+class ShardServer:
+    """
+    One shard: a SocialPlatform behind a Unix socket
+    Requests on a connection are handled strictly in order, so a client
+    that pipelines a join and a send sees them applied in that order.
+    """
+    
+    OPERATIONS = (
+        "create_room", "join_room", "leave_room", "join_room_many", "leave_room_many", "evacuate_room",
+        "get_room_info", "send_message", "get_room_messages", "search_rooms", "get_stats"
+    )
+    
+    def __init__(self, shard_id: str, socket_path: str):
+        self.shard_id = shard_id
+        self.socket_path = socket_path
+        self.platform = SocialPlatform()
+        self.gateway = self.platform.realtime_manager.gateway = ShardGateway()
+        self.stopped = asyncio.Event()
+        self.requests = 0
+    
+    async def serve(self):
+        """Serve requests until a client asks the shard to shut down"""
+        
+        await self.platform.start()
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        
+        try:
+            await self.stopped.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            await self.platform.shutdown()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer the requests of one client connection"""
+        
+        frames = FrameWriter(writer)
+        self.gateway.fronts.add(frames)
+        try:
+            while True:
+                request = await _read_frame(reader)
+                if request is None:
+                    break
+                
+                request_id, operation, args = request
+                if operation == "shutdown":
+                    frames.write([request_id, True, None])
+                    frames.flush()
+                    await writer.drain()
+                    self.stopped.set()
+                    break
+                
+                if operation not in self.OPERATIONS:
+                    frames.write([request_id, False, f"Unknown shard operation: {operation}"])
+                    continue
+                
+                try:
+                    result = await getattr(self, f"_op_{operation}")(*args)
+                    frames.write([request_id, True, result])
+                except Exception as e:
+                    logger.exception("Shard %s failed %s", self.shard_id, operation)
+                    frames.write([request_id, False, f"{type(e).__name__}: {e}"])
+                
+                self.requests += 1
+                await frames.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.gateway.fronts.discard(frames)
+            frames.close()
+    
+    async def _op_create_room(self, room_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a room owned by this shard"""
+        return await self.platform.create_room(room_data)
+    
+    async def _op_join_room(self, room_id: str, user_id: str) -> Dict[str, Any]:
+        """Join a room and subscribe the user to its events"""
+        return await self.platform.join_room(room_id, user_id)
+    
+    async def _op_leave_room(self, room_id: str, user_id: str) -> Dict[str, Any]:
+        """Leave a room and unsubscribe the user from its events"""
+        return await self.platform.leave_room(room_id, user_id)
+    
+    async def _op_join_room_many(self, room_id: str, user_ids: List[str], actor_id: Optional[str]) -> Dict[str, Any]:
+        """Join many users with one membership event"""
+        return await self.platform.join_room_many(room_id, user_ids, actor_id)
+    
+    async def _op_leave_room_many(self, room_id: str, user_ids: List[str], actor_id: Optional[str]) -> Dict[str, Any]:
+        """Remove many users with one membership event"""
+        return await self.platform.leave_room_many(room_id, user_ids, actor_id)
+    
+    async def _op_evacuate_room(self, room_id: str, actor_id: Optional[str]) -> Dict[str, Any]:
+        """Remove every member with one membership event"""
+        return await self.platform.evacuate_room(room_id, actor_id)
+    
+    async def _op_get_room_info(self, room_id: str) -> Dict[str, Any]:
+        """Get room information with member ids"""
+        
+        room = await self.platform.room_manager.get_room(room_id)
+        if not room:
+            return {"success": False, "error": "Room not found"}
+        
+        return {
+            "success": True,
+            "room": {
+                "room_id": room.room_id,
+                "name": room.name,
+                "description": room.description,
+                "room_type": room.room_type.value,
+                "owner_id": room.owner_id,
+                "capacity": room.capacity,
+                "current_users": sorted(room.current_users),
+                "moderators": list(room.moderators),
+                "tags": room.tags
+            }
+        }
+    
+    async def _op_send_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a message into a room owned by this shard"""
+        return await self.platform.send_message(message_data)
+    
+    async def _op_get_room_messages(self, room_id: str, limit: int, cursor: Optional[int]) -> Dict[str, Any]:
+        """Get a page of room messages; senders are projected by the front process"""
+        
+        messages, next_cursor = await self.platform.message_manager.get_room_messages_page(room_id, limit, cursor)
+        
+        return {
+            "success": True,
+            "messages": [
+                {
+                    "message_id": message.message_id,
+                    "sender_id": message.sender_id,
+                    "content": message.content,
+                    "message_type": message.message_type,
+                    "timestamp": message.timestamp,
+                    "reactions": {emoji: list(user_ids) for emoji, user_ids in (message.reactions or {}).items()}
+                }
+                for message in messages
+            ],
+            "next_cursor": next_cursor
+        }
+    
+    async def _op_search_rooms(self, query: str, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Search the rooms owned by this shard"""
+        return await self.platform.search_rooms(query, filters)
+    
+    async def _op_get_stats(self) -> Dict[str, Any]:
+        """Get shard counters"""
+        
+        return {
+            "shard_id": self.shard_id,
+            "pid": os.getpid(),
+            "rooms": len(self.platform.room_manager.rooms),
+            "requests": self.requests
+        }
+
+def run_shard(shard_id: str, socket_path: str):
+    """Process entry point of a shard worker"""
+    asyncio.run(ShardServer(shard_id, socket_path).serve())
+
+class ShardClient:
+    """
+    Pipelined connection from the front process to one shard
+    Calls are tagged with request ids and may be in flight concurrently;
+    a reader task resolves each call's future as its response arrives and
+    hands events pushed by the shard to on_event(user_ids, frame).
+    """
+    
+    def __init__(self, shard_id: str, socket_path: str,
+                 on_event: Optional[Callable[[List[str], str], Any]] = None):
+        self.shard_id = shard_id
+        self.socket_path = socket_path
+        self.on_event = on_event
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.frames: Optional[FrameWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.request_ids = itertools.count(1)
+        self.reader_task: Optional[asyncio.Task] = None
+    
+    async def connect(self, timeout: float = 30.0):
+        """Connect, retrying while the shard process is still starting"""
+        
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+                self.frames = FrameWriter(self.writer)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Shard {self.shard_id} did not start listening")
+                await asyncio.sleep(0.05)
+        
+        self.reader_task = asyncio.create_task(self._read_responses())
+    
+    async def call(self, operation: str, *args) -> Any:
+        """Send one request and wait for its result"""
+        
+        if self.writer is None or self.reader_task.done():
+            raise ConnectionError(f"Shard {self.shard_id} is not connected")
+        
+        request_id = next(self.request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.frames.write([request_id, operation, list(args)])
+        await self.frames.drain()
+        
+        return await future
+    
+    async def close(self):
+        """Close the connection, failing any calls still in flight"""
+        
+        if self.frames is not None:
+            self.frames.close()
+        if self.reader_task is not None:
+            await self.reader_task
+    
+    async def _read_responses(self):
+        """Resolve pending calls as responses arrive"""
+        
+        try:
+            while True:
+                response = await _read_frame(self.reader)
+                if response is None:
+                    break
+                
+                request_id, ok, result = response
+                if request_id is None:
+                    # Pushed event, not the response to a call
+                    if self.on_event is not None:
+                        self.on_event(*result)
+                    continue
+                
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(f"Shard {self.shard_id}: {result}"))
+        except ConnectionError:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Shard {self.shard_id} connection closed"))
+            self.pending.clear()
+
+class ShardedPlatform:
+    """
+    Front process of a sharded platform
+    Routes room operations to the shard that owns the room on the hash ring
+    and keeps users locally. Cross-room queries are scattered to every shard
+    and gathered. Realtime clients register with the front gateway, which
+    delivers the room events the shards push back to it; per-type event
+    subscriptions, direct messages and connections are not sharded, and
+    moving rooms when the shard count changes is left to a restart from
+    snapshots.
+    """
+    
+    def __init__(self, shards: int = 4, socket_dir: Optional[str] = None, replicas: int = 128):
+        self.shard_ids = [f"shard-{i}" for i in range(shards)]
+        self.ring = HashRing(self.shard_ids, replicas)
+        self.socket_dir = socket_dir
+        self.owns_socket_dir = socket_dir is None
+        self.processes: Dict[str, multiprocessing.Process] = {}
+        self.clients: Dict[str, ShardClient] = {}
+        self.user_manager = UserManager()
+        self.gateway = RealtimeGateway()
+    
+    async def start(self):
+        """Spawn the shard processes and connect to them"""
+        
+        if self.socket_dir is None:
+            self.socket_dir = tempfile.mkdtemp(prefix="social-shards-")
+        
+        # Spawned, not forked: a forked child would inherit the running event loop
+        context = multiprocessing.get_context("spawn")
+        for shard_id in self.shard_ids:
+            socket_path = os.path.join(self.socket_dir, f"{shard_id}.sock")
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            process = context.Process(target=run_shard, args=(shard_id, socket_path), name=shard_id, daemon=True)
+            process.start()
+            self.processes[shard_id] = process
+            self.clients[shard_id] = ShardClient(shard_id, socket_path, self._deliver_event)
+        
+        await asyncio.gather(*(client.connect() for client in self.clients.values()))
+    
+    async def shutdown(self, timeout: float = 10.0):
+        """Stop every shard process and remove the sockets"""
+        
+        for shard_id, client in self.clients.items():
+            try:
+                await client.call("shutdown")
+            except ConnectionError:
+                logger.warning("Shard %s was already disconnected", shard_id)
+            await client.close()
+        
+        loop = asyncio.get_running_loop()
+        for process in self.processes.values():
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+        
+        await self.gateway.close_all()
+        self.clients.clear()
+        self.processes.clear()
+        if self.owns_socket_dir and self.socket_dir is not None:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+            self.socket_dir = None
+    
+    def shard_for(self, room_id: str) -> str:
+        """Get the shard owning a room"""
+        return self.ring.node_for(room_id)
+    
+    def _client_for(self, room_id: str) -> ShardClient:
+        """Get the connection to the shard owning a room"""
+        return self.clients[self.shard_for(room_id)]
+    
+    def _deliver_event(self, user_ids: List[str], frame: str):
+        """Deliver an event pushed by a shard to the local client connections"""
+        self.gateway.publish_frame(user_ids, frame.encode("utf-8"))
+    
+    # User Management API
+    async def register_user(self, user_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Register a new user in the front process"""
+        
+        user = await self.user_manager.create_user(user_data)
+        
+        return {
+            "success": True,
+            "user": {
+                "user_id": user.user_id,
+                "username": user.username,
+                "display_name": user.display_name,
+                "status": user.status.value
+            }
+        }
+    
+    # Room Management API
+    async def create_room(self, room_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a room on the shard its id hashes to"""
+        
+        # The id must be known before routing, so it is assigned here
+        room_data = {**room_data, "room_id": room_data.get("room_id") or str(uuid.uuid4())}
+        return await self._client_for(room_data["room_id"]).call("create_room", room_data)
+    
+    async def join_room(self, room_id: str, user_id: str) -> Dict[str, Any]:
+        """Join a room on its shard"""
+        return await self._client_for(room_id).call("join_room", room_id, user_id)
+    
+    async def leave_room(self, room_id: str, user_id: str) -> Dict[str, Any]:
+        """Leave a room on its shard"""
+        return await self._client_for(room_id).call("leave_room", room_id, user_id)
+    
+    async def join_room_many(self, room_id: str, user_ids: List[str],
+                             actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Join many users to a room on its shard in one request"""
+        return await self._client_for(room_id).call("join_room_many", room_id, list(user_ids), actor_id)
+    
+    async def leave_room_many(self, room_id: str, user_ids: List[str],
+                              actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Remove many users from a room on its shard in one request"""
+        return await self._client_for(room_id).call("leave_room_many", room_id, list(user_ids), actor_id)
+    
+    async def evacuate_room(self, room_id: str, actor_id: Optional[str] = None) -> Dict[str, Any]:
+        """Remove every member of a room on its shard"""
+        return await self._client_for(room_id).call("evacuate_room", room_id, actor_id)
+    
+    async def get_room_info(self, room_id: str) -> Dict[str, Any]:
+        """Get room information, with members projected from the local users"""
+        
+        result = await self._client_for(room_id).call("get_room_info", room_id)
+        if not result["success"]:
+            return result
+        
+        users = []
+        for user_id in result["room"]["current_users"]:
+            user = await self.user_manager.get_user(user_id)
+            if user:
+                users.append({
+                    "user_id": user.user_id,
+                    "username": user.username,
+                    "display_name": user.display_name,
+                    "status": user.status.value
+                })
+        result["room"]["current_users"] = users
+        
+        return result
+    
+    async def search_rooms(self, query: str, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Search rooms on every shard"""
+        
+        results = await asyncio.gather(*(
+            client.call("search_rooms", query, filters) for client in self.clients.values()
+        ))
+        
+        return {
+            "success": True,
+            "rooms": [room for result in results for room in result["rooms"]]
+        }
+    
+    # Messaging API
+    async def send_message(self, message_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a room message through the room's shard"""
+        
+        room_id = message_data.get("room_id")
+        if not room_id:
+            return {"success": False, "error": "Only room messages are sharded"}
+        
+        return await self._client_for(room_id).call("send_message", message_data)
+    
+    async def get_room_messages(self, room_id: str, limit: int = 50,
+                                cursor: Optional[int] = None) -> Dict[str, Any]:
+        """Get messages from a room, with senders projected from the local users"""
+        
+        result = await self._client_for(room_id).call("get_room_messages", room_id, limit, cursor)
+        
+        senders = await self.user_manager.get_sender_projections(
+            message["sender_id"] for message in result["messages"]
+        )
+        for message in result["messages"]:
+            message["sender"] = senders[message.pop("sender_id")]
+        
+        return result
+    
+    async def get_shard_stats(self) -> List[Dict[str, Any]]:
+        """Get room and request counts of every shard"""
+        return list(await asyncio.gather(*(client.call("get_stats") for client in self.clients.values())))
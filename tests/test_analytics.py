@@ -0,0 +1,70 @@
+import collections
+import random
+
+import pytest
+
+import social_platform
+from social_platform import Message, MessageColumns
+
+
+def _columns(rng, base):
+    columns = MessageColumns()
+    messages = []
+    for i in range(3000):
+        message = Message(
+            message_id=f"m{i}",
+            sender_id=f"s{rng.randrange(40)}",
+            room_id=rng.choice([None, "a", "b", "c"]),
+            recipient_id="x",
+            content=f"héllo {i}",
+            message_type=rng.choice(["text", "image"]),
+            timestamp=base + i * 3.0,
+        )
+        columns.append(message)
+        messages.append(message)
+    
+    for message in rng.sample(messages, 400):
+        assert columns.delete(message.message_id)
+        messages.remove(message)
+    return columns, messages
+
+
+# Columnar message analytics (user-018)
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_columns_aggregates_match_brute_force(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(social_platform, "np", None)
+    elif social_platform.np is None:
+        pytest.skip("NumPy is not installed")
+    
+    base = 1_000_000.0
+    columns, messages = _columns(random.Random(5), base)
+    
+    edited = messages[5]
+    edited.content = "edited ✓"
+    columns.update_content(edited)
+    assert columns.get_content(columns.rows[edited.message_id]) == "edited ✓"
+    assert columns.get_content(columns.rows[messages[6].message_id]) == messages[6].content
+    
+    for since, until in [(None, None), (base + 3000, None), (base + 1000, base + 9000)]:
+        window = [
+            m for m in messages
+            if (since is None or m.timestamp >= since) and (until is None or m.timestamp < until)
+        ]
+        
+        rooms = collections.Counter(m.room_id for m in window if m.room_id)
+        assert columns.count_by_room(since, until) == dict(rooms)
+        
+        senders = collections.Counter(m.sender_id for m in window)
+        expected = sorted(senders.items(), key=lambda item: (-item[1], columns.sender_index[item[0]]))[:5]
+        assert columns.top_senders(5, since, until) == expected
+        
+        in_room = collections.Counter(m.sender_id for m in window if m.room_id == "b")
+        assert dict(columns.top_senders(100, since, until, room_id="b")) == dict(in_room)
+        
+        origin = (window[0].timestamp // 3600) * 3600
+        buckets = collections.Counter(
+            origin + ((m.timestamp - origin) // 3600) * 3600 for m in window if m.room_id == "a"
+        )
+        assert dict(columns.count_by_interval(3600, since, until, room_id="a")) == dict(buckets)
@@ -0,0 +1,73 @@
+import asyncio
+
+from social_platform import ConnectionManager, ConnectionType
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+# Pair and inbound indexes (user-002)
+
+def test_pair_index_keeps_connections_of_every_type():
+    async def scenario():
+        manager = ConnectionManager()
+        follow = await manager.create_connection("a", "b", ConnectionType.FOLLOWER)
+        friend = await manager.create_connection("a", "b", ConnectionType.FRIEND)
+        
+        assert await manager.get_connection("a", "b") is friend
+        assert await manager.get_connection("a", "b", ConnectionType.FOLLOWER) is follow
+        assert await manager.get_inbound_connections("b", ConnectionType.FOLLOWER) == [follow]
+        assert await manager.get_inbound_connections("b", ConnectionType.FRIEND) == [friend]
+        assert await manager.get_inbound_count("b") == 1
+        
+        await manager.remove_connection(friend.connection_id)
+        assert await manager.get_connection("a", "b") is follow
+        assert await manager.get_inbound_connections("b") == [follow]
+        
+        await manager.remove_connection(follow.connection_id)
+        assert await manager.get_connection("a", "b") is None
+        assert "b" not in manager.inbound_connections
+        assert ("a", "b") not in manager.pair_connections
+    
+    run(scenario())
+
+
+def test_reverse_connection_marks_both_mutual():
+    async def scenario():
+        manager = ConnectionManager()
+        forward = await manager.create_connection("a", "b", ConnectionType.FRIEND)
+        backward = await manager.create_connection("b", "a", ConnectionType.FRIEND)
+        return forward.mutual, backward.mutual
+    
+    assert run(scenario()) == (True, True)
+
+
+# Batched mutual friend counts (user-004)
+
+def test_count_mutuals_agrees_with_mutual_connections():
+    async def scenario():
+        manager = ConnectionManager()
+        await manager.create_connection("a", "f", ConnectionType.FRIEND)
+        await manager.create_connection("a", "g", ConnectionType.FRIEND)
+        
+        # c has many connections, so the user's friends are walked instead
+        await manager.create_connection("c", "f", ConnectionType.FRIEND)
+        await manager.create_connection("c", "f", ConnectionType.FOLLOWER)
+        await manager.create_connection("c", "g", ConnectionType.FOLLOWER)
+        for i in range(5):
+            await manager.create_connection("c", f"x{i}", ConnectionType.FRIEND)
+        
+        # d has few connections, so its own connections are walked
+        await manager.create_connection("d", "f", ConnectionType.FRIEND)
+        await manager.create_connection("d", "g", ConnectionType.FOLLOWER)
+        
+        counts = await manager.count_mutuals("a", ["c", "d", "nobody"])
+        expected = {
+            candidate: len(await manager.get_mutual_connections("a", candidate))
+            for candidate in ("c", "d", "nobody")
+        }
+        return counts, expected
+    
+    counts, expected = run(scenario())
+    assert counts == expected == {"c": 1, "d": 1, "nobody": 0}
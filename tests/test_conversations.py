@@ -0,0 +1,87 @@
+import asyncio
+import random
+
+from social_platform import ConversationIndex, MessageManager
+
+
+async def _inbox(manager, user_id, limit):
+    keys, cursor = [], None
+    while True:
+        page, cursor = await manager.get_inbox(user_id, limit, cursor)
+        keys.extend(conversation.key for conversation in page)
+        if cursor is None:
+            return keys
+
+
+# Direct-message conversations (user-021)
+
+def test_inbox_pages_and_unread_counts_match_brute_force():
+    async def scenario():
+        rng = random.Random(2)
+        users = [f"u{i}" for i in range(12)]
+        manager = MessageManager()
+        sent, order, read_from, deleted = [], [], {}, set()
+        
+        for i in range(2000):
+            sender_id, recipient_id = rng.choice(users), rng.choice(users)
+            sent.append(await manager.send_message(
+                {"sender_id": sender_id, "recipient_id": recipient_id, "content": str(i)}
+            ))
+            key = ConversationIndex.key(sender_id, recipient_id)
+            if key in order:
+                order.remove(key)
+            order.append(key)
+            
+            roll = rng.random()
+            if roll < 0.05:
+                user_id, other_id = rng.choice(users), rng.choice(users)
+                if manager.conversations.get(user_id, other_id):
+                    await manager.mark_conversation_read(user_id, other_id)
+                    read_from[(user_id, other_id)] = len(sent)
+            elif roll < 0.08:
+                victim = rng.choice(sent)
+                if victim.message_id not in deleted:
+                    assert await manager.delete_message(victim.message_id, victim.sender_id)
+                    deleted.add(victim.message_id)
+        
+        inboxes = {user_id: await _inbox(manager, user_id, 7) for user_id in users}
+        unread = {user_id: await manager.get_unread_count(user_id) for user_id in users}
+        return users, sent, order, read_from, deleted, inboxes, unread, manager.conversations
+    
+    users, sent, order, read_from, deleted, inboxes, unread, index = asyncio.run(scenario())
+    for user_id in users:
+        assert inboxes[user_id] == [key for key in reversed(order) if user_id in key]
+        
+        expected = 0
+        for position, message in enumerate(sent):
+            other_id = message.sender_id
+            if (message.recipient_id == user_id and other_id != user_id and message.message_id not in deleted
+                    and position >= read_from.get((user_id, other_id), 0)):
+                expected += 1
+        assert unread[user_id] == expected
+        
+        # Stale inbox entries never outnumber live ones
+        live = sum(1 for seq in index.inboxes[user_id] if seq in index.by_activity)
+        assert index.stale[user_id] <= live
+
+
+def test_conversation_thread_pages_newest_first():
+    async def scenario():
+        manager = MessageManager()
+        thread = []
+        for i in range(25):
+            sender_id, recipient_id = ("a", "b") if i % 2 else ("b", "a")
+            thread.append(await manager.send_message(
+                {"sender_id": sender_id, "recipient_id": recipient_id, "content": str(i)}
+            ))
+            await manager.send_message({"sender_id": "a", "recipient_id": "c", "content": str(i)})
+        
+        message_ids, cursor = [], None
+        while True:
+            page, cursor = await manager.get_conversation_messages("b", "a", 4, cursor)
+            message_ids.extend(message.message_id for message in page)
+            if cursor is None:
+                return thread, message_ids
+    
+    thread, message_ids = asyncio.run(scenario())
+    assert message_ids == [message.message_id for message in reversed(thread)]
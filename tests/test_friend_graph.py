@@ -0,0 +1,84 @@
+import asyncio
+import random
+
+import pytest
+
+import social_platform
+from social_platform import ConnectionManager, ConnectionType
+
+
+async def _random_graph(manager, users, edges, seed):
+    rng = random.Random(seed)
+    for _ in range(edges):
+        source, target = rng.sample(users, 2)
+        if await manager.get_connection(source, target) is None:
+            await manager.create_connection(source, target, ConnectionType.FRIEND)
+
+
+def _brute_force(manager, user_id):
+    friends = {
+        connection.target_user_id
+        for connection in manager.connections.values()
+        if connection.user_id == user_id and connection.connection_type == ConnectionType.FRIEND
+    }
+    counts = {}
+    for connection in manager.connections.values():
+        if connection.user_id in friends and connection.connection_type == ConnectionType.FRIEND:
+            candidate = connection.target_user_id
+            if candidate != user_id and candidate not in friends:
+                counts[candidate] = counts.get(candidate, 0) + 1
+    return counts
+
+
+# Friend graph snapshot (user-003)
+
+def test_suggestions_match_brute_force_counts():
+    async def scenario():
+        manager = ConnectionManager()
+        users = [f"u{i}" for i in range(120)]
+        await _random_graph(manager, users, 900, seed=3)
+        return manager, users
+    
+    manager, users = asyncio.run(scenario())
+    graph = manager.get_friend_graph()
+    for user_id in users[:30]:
+        expected = _brute_force(manager, user_id)
+        suggested = graph.suggest(user_id, 10)
+        assert all(expected[candidate] == count for candidate, count in suggested)
+        assert [count for _, count in suggested] == sorted(expected.values(), reverse=True)[:10]
+
+
+@pytest.mark.skipif(social_platform.np is None, reason="NumPy is not installed")
+def test_vectorized_and_counter_scoring_agree_on_ties():
+    async def scenario():
+        manager = ConnectionManager()
+        users = [f"u{i}" for i in range(300)]
+        await _random_graph(manager, users, 3000, seed=1)
+        return manager, users
+    
+    manager, users = asyncio.run(scenario())
+    graph = manager.get_friend_graph()
+    for user_id in users[:100]:
+        index = graph.user_index.get(user_id)
+        if index is None:
+            continue
+        excluded = {index, *graph.neighbors[graph.offsets[index]:graph.offsets[index + 1]]}
+        for limit in (1, 3, 10, 50):
+            assert graph._score_vectorized(index, excluded, limit) == graph._score_counter(index, excluded, limit)
+
+
+def test_friend_graph_refreshes_in_background():
+    async def scenario():
+        manager = ConnectionManager(friend_graph_interval=0.05)
+        await manager.create_connection("a", "b", ConnectionType.FRIEND)
+        first = manager.get_friend_graph()
+        manager.start_friend_graph_refresh()
+        
+        await manager.create_connection("b", "c", ConnectionType.FRIEND)
+        served_stale = manager.get_friend_graph() is first  # requests never rebuild
+        await asyncio.sleep(0.15)
+        refreshed = manager.get_friend_graph()
+        await manager.stop_friend_graph_refresh()
+        return served_stale, refreshed is not first, refreshed.version == manager.friend_graph_version
+    
+    assert asyncio.run(scenario()) == (True, True, True)
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import random
+
+from social_platform import MessageManager, RoomMessageLog, SQLiteMessageStore
+
+
+async def _all_pages(manager, room_id, limit):
+    message_ids, cursor = [], None
+    while True:
+        page, cursor = await manager.get_room_messages_page(room_id, limit, cursor)
+        message_ids.extend(message.message_id for message in page)
+        if cursor is None:
+            return message_ids
+
+
+# Append-only room message log (user-014)
+
+def test_room_message_log_pages_skip_tombstones():
+    log = RoomMessageLog()
+    for i in range(10):
+        log.append(f"m{i}", 1000.0 + i)
+    for message_id in ("m3", "m4", "m8"):
+        assert log.tombstone(message_id)
+    assert not log.tombstone("m3")
+    
+    assert [message_id for _, message_id in log.page_before(None, 3)] == ["m9", "m7", "m6"]
+    assert [message_id for _, message_id in log.page_before(log.seq_of("m6"), 3)] == ["m5", "m2", "m1"]
+    assert log.seq_at_timestamp(1004.5) == log.seq_of("m5")
+    assert log.seq_of("m4") is None and len(log) == 7
+    
+    # Trimming counts entry slots, tombstoned ones included
+    assert log.trim(2) == ["m0", "m1", "m2", "m5", "m6", "m7"]
+    assert [message_id for _, message_id in log.entries()] == ["m9"]
+
+
+def test_room_history_pages_match_brute_force():
+    async def scenario():
+        manager = MessageManager()
+        rng = random.Random(9)
+        sent = [
+            (await manager.send_message({"sender_id": "u", "room_id": "r", "content": str(i)})).message_id
+            for i in range(600)
+        ]
+        alive = list(sent)
+        for message_id in rng.sample(sent, 400):
+            assert await manager.delete_message(message_id, "u")
+            alive.remove(message_id)
+        
+        pages = {limit: await _all_pages(manager, "r", limit) for limit in (1, 37, 1000)}
+        before = []
+        for _ in range(20):
+            timestamp = manager.messages[rng.choice(alive)].timestamp
+            expected = [m for m in reversed(alive) if manager.messages[m].timestamp < timestamp][:20]
+            actual = [m.message_id for m in await manager.get_room_messages("r", 20, before_timestamp=timestamp)]
+            before.append((actual, expected))
+        return alive, pages, before
+    
+    alive, pages, before = asyncio.run(scenario())
+    assert all(message_ids == alive[::-1] for message_ids in pages.values())
+    assert all(actual == expected for actual, expected in before)
+
+
+# Group-committed message store (user-015)
+
+def test_sqlite_store_batches_and_reads_pending_writes(tmp_path):
+    async def scenario():
+        store = SQLiteMessageStore(os.path.join(str(tmp_path), "messages.db"))
+        manager = MessageManager(store=store, hot_messages_per_room=10)
+        await manager.open()
+        
+        sent = await asyncio.gather(*(
+            manager.send_message({"sender_id": "u", "room_id": "r", "content": f"m{i}"})
+            for i in range(200)
+        ))
+        cold = sent[5]
+        assert await manager.edit_message(cold.message_id, "edited", "u")
+        assert (await manager.get_message(cold.message_id)).content == "edited"
+        await store.flush()
+        metrics = store.get_metrics()
+        await store.close()
+        
+        reopened = MessageManager(store=SQLiteMessageStore(store.path))
+        await reopened.open()
+        history = await reopened.get_room_messages("r", 500)
+        await reopened.store.close()
+        return metrics, history
+    
+    metrics, history = asyncio.run(scenario())
+    assert metrics["committed"] >= 200
+    assert metrics["batches"] < metrics["committed"]
+    assert len(history) == 200
+    assert [message.content for message in history].count("edited") == 1
+
+
+def test_concurrent_updates_of_a_cold_message_are_not_lost(tmp_path):
+    async def scenario():
+        store = SQLiteMessageStore(os.path.join(str(tmp_path), "messages.db"))
+        manager = MessageManager(store=store, hot_messages_per_room=2)
+        await manager.open()
+        
+        first = await manager.send_message({"sender_id": "s", "room_id": "r", "content": "x"})
+        for i in range(5):
+            await manager.send_message({"sender_id": "s", "room_id": "r", "content": str(i)})
+        assert first.message_id not in manager.messages
+        
+        await asyncio.gather(*(manager.add_reaction(first.message_id, f"u{i}", "+") for i in range(5)))
+        await asyncio.gather(
+            manager.edit_message(first.message_id, "edited", "s"),
+            manager.add_reaction(first.message_id, "z", "!"),
+            manager.toggle_reactions([(first.message_id, "u0", "+")]),
+            manager.remove_reaction(first.message_id, "u1", "+"),
+        )
+        await store.flush()
+        stored = await store.get(first.message_id)
+        await store.close()
+        return stored, manager._updating
+    
+    stored, updating = asyncio.run(scenario())
+    assert stored.content == "edited"
+    assert stored.reactions == {"+": {"u2", "u3", "u4"}, "!": {"z"}}
+    assert updating == {}
+
+
+# Reaction sets and coalesced summaries (user-019)
+
+def test_reactions_are_sets_with_coalesced_summaries():
+    async def scenario():
+        events = []
+        manager = MessageManager(reaction_summary_window=0.05)
+        
+        async def on_event(event_type, message):
+            counts = {emoji: len(users) for emoji, users in (message.reactions or {}).items()}
+            events.append((event_type, message.message_id, counts))
+        
+        manager.add_message_callback(on_event)
+        first = await manager.send_message({"sender_id": "a", "room_id": "r"})
+        second = await manager.send_message({"sender_id": "a", "room_id": "r"})
+        events.clear()
+        
+        for i in range(1000):
+            assert await manager.add_reaction(first.message_id, f"u{i}", "+")
+        assert await manager.add_reaction(first.message_id, "u1", "+")
+        assert await manager.remove_reaction(first.message_id, "u1", "+")
+        assert not await manager.remove_reaction(first.message_id, "u1", "+")
+        
+        toggled = await manager.toggle_reactions([
+            (first.message_id, "u2", "+"),
+            (first.message_id, "z", "!"),
+            (second.message_id, "z", "!"),
+            ("missing", "z", "!"),
+            (first.message_id, "z", "!"),
+        ])
+        counts = await manager.get_reaction_counts(first.message_id)
+        pending = list(events)
+        await asyncio.sleep(0.1)
+        return toggled, counts, pending, events, first, second
+    
+    toggled, counts, pending, events, first, second = asyncio.run(scenario())
+    assert toggled == [False, True, True, None, False]
+    assert counts == {"+": 998}
+    assert pending == []
+    assert sorted(events) == sorted([
+        ("reaction_summary", first.message_id, {"+": 998}),
+        ("reaction_summary", second.message_id, {"!": 1}),
+    ])
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import time
+
+from social_platform import EventHandler, EventLog, RealtimeGateway, RealtimeManager, SocialEvent
+
+
+def _event(i, user_id="u", room_id=None, event_type="t"):
+    return SocialEvent(event_id=str(i), event_type=event_type, user_id=user_id, room_id=room_id,
+                       timestamp=1000.0 + i)
+
+
+async def _spilled(log):
+    return [event.event_id async for event in log.iter_spilled()]
+
+
+# Event log (user-009)
+
+def test_event_log_evicts_oldest_and_indexes():
+    log = EventLog(capacity=5)
+    for i in range(12):
+        log.append(_event(i, user_id=f"u{i % 2}", room_id="r" if i % 3 == 0 else None))
+    
+    assert len(log) == 5 and log.first_seq == 7
+    assert log.get(6) is None and log.get(7).event_id == "7"
+    assert [event.event_id for event in log.recent(user_ids=["u0"])] == ["10", "8"]
+    assert [event.event_id for event in log.recent(room_ids=["r"], user_ids=["u1"])] == ["11", "9", "7"]
+    assert sum(len(seqs) for seqs in log.by_user.values()) == 5
+
+
+def test_event_log_expires_by_age():
+    log = EventLog(capacity=10, max_age=5)
+    for i in range(4):
+        log.append(_event(i))
+    log.expire(now=1006.5)
+    assert [event.event_id for event in log.recent(user_ids=["u"])] == ["3", "2"]
+
+
+def test_event_log_spill_survives_restart(tmp_path):
+    spill_dir = str(tmp_path)
+    
+    log = EventLog(capacity=4, spill_dir=spill_dir, segment_events=3, spill_batch=2)
+    for i in range(10):
+        log.append(_event(i))
+    log.close()
+    
+    # Sequence numbers restart with a new log; segments must not collide
+    log = EventLog(capacity=4, spill_dir=spill_dir, segment_events=3, spill_batch=2)
+    for i in range(100, 107):
+        log.append(_event(i))
+    spilled = asyncio.run(_spilled(log))
+    log.close()
+    
+    assert spilled == ["102", "101", "100"] + [str(i) for i in range(5, -1, -1)]
+    assert all(len(open(os.path.join(spill_dir, name)).readlines()) <= 3 for name in os.listdir(spill_dir))
+
+
+def test_spilled_segments_read_backwards_across_blocks(tmp_path):
+    path = os.path.join(str(tmp_path), "events-00000000000000000000.jsonl")
+    lines = [f"line {i} {'x' * (i % 7)}".encode() for i in range(50)]
+    with open(path, "wb") as segment:
+        segment.write(b"\n".join(lines) + b"\n")
+    
+    async def read():
+        return [line async for line in EventLog._read_lines_reversed(path, block_size=5)]
+    
+    assert asyncio.run(read()) == lines[::-1]
+
+
+def test_recent_events_continue_into_spilled_history(tmp_path):
+    async def scenario():
+        manager = RealtimeManager(event_log_capacity=10, spill_dir=str(tmp_path))
+        await manager.subscribe_to_room("alice", "r")
+        for i in range(60):
+            await manager.emit_event(_event(i, user_id="bob", room_id="r" if i % 2 else None))
+        recent = await manager.get_recent_events("alice", limit=20)
+        history = await manager.get_recent_events("alice", limit=20, include_history=True)
+        manager.event_log.close()
+        return recent, history
+    
+    recent, history = asyncio.run(scenario())
+    assert [event.event_id for event in recent] == ["59", "57", "55", "53", "51"]
+    assert [event.event_id for event in history] == [str(i) for i in range(59, 19, -2)]
+
+
+# Topic-indexed subscribers (user-010)
+
+def test_events_reach_type_and_room_subscribers_once():
+    async def scenario():
+        manager = RealtimeManager()
+        audiences = []
+        manager.gateway.publish = lambda user_ids, event: audiences.append((event.event_id, sorted(user_ids)))
+        
+        await manager.subscribe_user("alice", ["likes", "posts"])
+        await manager.subscribe_user("bob", ["posts"])
+        await manager.subscribe_to_room("bob", "r")
+        await manager.subscribe_to_room("carol", "r")
+        
+        await manager.emit_event(_event(1, event_type="posts"))
+        await manager.emit_event(_event(2, event_type="posts", room_id="r"))
+        await manager.emit_event(_event(3, event_type="other", room_id="r"))
+        await manager.unsubscribe_user("bob", ["posts"])
+        await manager.unsubscribe_user("alice", ["likes"])
+        await manager.emit_event(_event(4, event_type="posts"))
+        return audiences, manager.event_subscribers
+    
+    audiences, subscribers = asyncio.run(scenario())
+    assert audiences == [
+        ("1", ["alice", "bob"]),
+        ("2", ["alice", "bob", "carol"]),
+        ("3", ["bob", "carol"]),
+        ("4", ["alice"]),
+    ]
+    assert subscribers == {"posts": {"alice"}}
+
+
+# WebSocket delivery gateway (user-011)
+
+def test_gateway_delivers_to_every_connection_of_a_user():
+    async def scenario():
+        gateway = RealtimeGateway()
+        received = {"phone": [], "laptop": [], "other": []}
+        for name, user_id in (("phone", "alice"), ("laptop", "alice"), ("other", "bob")):
+            async def send(frame, name=name):
+                received[name].append(json.loads(bytes(frame)))
+            await gateway.register(user_id, send)
+        
+        gateway.publish(["alice", "nobody"], _event(1))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await gateway.close_all()
+        return received
+    
+    received = asyncio.run(scenario())
+    assert [frame["event_id"] for frame in received["phone"]] == ["1"]
+    assert received["laptop"] == received["phone"] and received["other"] == []
+
+
+def test_gateway_evicts_slow_and_broken_connections():
+    async def scenario():
+        gateway = RealtimeGateway(queue_size=2)
+        closed = []
+        stalled = asyncio.Event()
+        
+        async def never(frame):
+            await stalled.wait()
+        
+        async def broken(frame):
+            raise ConnectionError("gone")
+        
+        async def close():
+            closed.append("slow")
+        
+        slow = await gateway.register("slow", never, close)
+        await gateway.register("broken", broken)
+        for i in range(5):
+            gateway.publish(["slow", "broken"], _event(i))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return gateway, slow, closed
+    
+    gateway, slow, closed = asyncio.run(scenario())
+    assert not gateway.is_connected("slow") and not gateway.is_connected("broken")
+    assert slow not in gateway.connections and closed == ["slow"]
+    assert gateway.metrics["evicted"] == 1 and gateway.metrics["send_errors"] == 1
+
+
+# Serialize-once fan-out (user-012)
+
+def test_room_broadcast_shares_one_encoded_frame():
+    async def scenario():
+        manager = RealtimeManager()
+        frames = []
+        
+        async def send(frame):
+            frames.append(frame)
+        
+        for i in range(20):
+            await manager.subscribe_to_room(f"user{i}", "r")
+            await manager.gateway.register(f"user{i}", send)
+        await manager.emit_event(_event(1, room_id="r"))
+        for _ in range(3):
+            await asyncio.sleep(0)
+        await manager.gateway.close_all()
+        return frames, manager.gateway.metrics
+    
+    frames, metrics = asyncio.run(scenario())
+    assert len(frames) == 20 and isinstance(frames[0], bytes)
+    assert all(frame is frames[0] for frame in frames)
+    assert metrics["serialized"] == 1
+    assert json.loads(frames[0])["room_id"] == "r"
+
+
+# Concurrent event handlers (user-013)
+
+class _SleepyHandler(EventHandler):
+    def __init__(self, delay):
+        self.delay = delay
+        self.handled = 0
+    
+    async def handle_event(self, event):
+        await asyncio.sleep(self.delay)
+        self.handled += 1
+
+
+class _FailingHandler(EventHandler):
+    async def handle_event(self, event):
+        raise RuntimeError("boom")
+
+
+def test_handlers_run_concurrently_with_timeouts():
+    async def scenario():
+        manager = RealtimeManager(handler_timeout=0.2)
+        quick, other, stuck, background = (_SleepyHandler(0.1), _SleepyHandler(0.1),
+                                           _SleepyHandler(1.0), _SleepyHandler(0.3))
+        for handler in (quick, other, stuck, _FailingHandler()):
+            manager.add_event_handler("t", handler)
+        manager.add_event_handler("t", background, timeout=1.0, fire_and_forget=True)
+        
+        start = time.perf_counter()
+        await manager.emit_event(_event(1))
+        elapsed = time.perf_counter() - start
+        handled_before_drain = background.handled
+        await manager.drain_handlers()
+        await manager.stop_handler_workers()
+        return elapsed, (quick, other, stuck, background), handled_before_drain, manager.get_handler_stats()
+    
+    elapsed, (quick, other, stuck, background), handled_before_drain, stats = asyncio.run(scenario())
+    assert elapsed < 0.5  # bounded by the timeout, not the sum of handler delays
+    assert quick.handled == other.handled == 1 and stuck.handled == 0
+    assert handled_before_drain == 0 and background.handled == 1
+    assert sum(entry["timeouts"] for entry in stats.values()) == 1
+    assert sum(entry["errors"] for entry in stats.values()) == 1
@@ -0,0 +1,143 @@
+import asyncio
+import random
+
+from social_platform import RoomManager, RoomType, SocialPlatform
+
+
+def _search(manager, query, filters):
+    query = query.lower()
+    matches = []
+    for room in manager.rooms.values():
+        texts = [room.name, room.description, *room.tags]
+        if not any(query in text.lower() for text in texts):
+            continue
+        if "room_type" in filters and room.room_type != RoomType(filters["room_type"]):
+            continue
+        if filters.get("has_space") and len(room.current_users) >= room.capacity:
+            continue
+        if "tags" in filters and not any(tag in room.tags for tag in filters["tags"]):
+            continue
+        matches.append(room.room_id)
+    return matches
+
+
+def _popular(manager, limit, has_space):
+    rooms = [room for room in manager.rooms.values() if not has_space or len(room.current_users) < room.capacity]
+    rooms.sort(key=lambda room: (-len(room.current_users), room.room_id))
+    return [room.room_id for room in rooms[:limit]]
+
+
+# Room search and occupancy ordering (user-023)
+
+def test_room_search_and_popular_rooms_match_brute_force():
+    async def scenario():
+        rng = random.Random(3)
+        manager = RoomManager()
+        words = ["art", "Music", "code", "chill", "game", "study", "arty"]
+        tags = ["fun", "dev", "late", "Art"]
+        types = [room_type.value for room_type in RoomType]
+        for i in range(300):
+            await manager.create_room({
+                "room_id": f"r{i}",
+                "name": " ".join(rng.sample(words, 2)),
+                "description": rng.choice(words),
+                "owner_id": "o",
+                "capacity": rng.randint(0, 6),
+                "tags": rng.sample(tags, rng.randint(0, 2)),
+                "room_type": rng.choice(types),
+            })
+        
+        checks = []
+        for _ in range(3000):
+            roll = rng.random()
+            room_id = f"r{rng.randrange(320)}"
+            if roll < 0.5:
+                await manager.join_room(room_id, f"u{rng.randrange(20)}")
+            elif roll < 0.85:
+                await manager.leave_room(room_id, f"u{rng.randrange(20)}")
+            elif roll < 0.9:
+                await manager.delete_room(room_id)
+            elif roll < 0.95:
+                await manager.create_room({
+                    "room_id": room_id,
+                    "name": rng.choice(words),
+                    "owner_id": "o",
+                    "capacity": 3,
+                    "tags": ["fun"],
+                    "room_type": rng.choice(types),
+                })
+            else:
+                query = rng.choice(["", "ar", "a", "art", "music", "zz", "hil", "Fun"])
+                filters = rng.choice([
+                    {}, {"has_space": True}, {"room_type": rng.choice(types)}, {"tags": ["fun", "dev"]},
+                    {"has_space": True, "tags": ["Art"], "room_type": "public"}, {"has_space": False},
+                ])
+                found = [room.room_id for room in await manager.search_rooms(query, filters)]
+                checks.append((found, _search(manager, query, filters)))
+                for has_space in (False, True):
+                    popular = [room.room_id for room in await manager.get_popular_rooms(15, has_space)]
+                    checks.append((popular, _popular(manager, 15, has_space)))
+        return manager, checks
+    
+    manager, checks = asyncio.run(scenario())
+    assert checks and all(actual == expected for actual, expected in checks)
+    assert len(manager.room_positions) == len(manager.rooms) == len(manager.open_order) + len(manager.full_order)
+    assert len(manager.open_order.heap) <= 2 * len(manager.open_order) + 64
+
+
+# Bulk membership changes (user-025)
+
+def test_bulk_membership_emits_one_event_per_change():
+    async def scenario():
+        platform = SocialPlatform()
+        emitted = []
+        emit = platform.realtime_manager.emit_event
+        
+        async def record(event):
+            emitted.append(event)
+            await emit(event)
+        
+        platform.realtime_manager.emit_event = record
+        await platform.create_room({"room_id": "hall", "name": "hall", "owner_id": "owner", "capacity": 6})
+        emitted.clear()
+        
+        joined = await platform.join_room_many("hall", ["a", "b", "c", "d", "e", "f", "owner"])
+        after_join = list(emitted)
+        emitted.clear()
+        left = await platform.leave_room_many("hall", ["a", "nobody"])
+        after_leave = list(emitted)
+        emitted.clear()
+        evacuated = await platform.evacuate_room("hall")
+        room = platform.room_manager.rooms["hall"]
+        return joined, after_join, left, after_leave, evacuated, list(emitted), room, platform
+    
+    joined, after_join, left, after_leave, evacuated, after_evacuate, room, platform = asyncio.run(scenario())
+    
+    assert joined["joined"] == ["a", "b", "c", "d", "e"]  # capacity 6 including the owner
+    assert len(after_join) == 1 and after_join[0].event_type == "room_members_changed"
+    assert after_join[0].data["joined"] == joined["joined"]
+    assert left["left"] == ["a"] and len(after_leave) == 1
+    assert sorted(evacuated["left"]) == ["b", "c", "d", "e", "owner"] and len(after_evacuate) == 1
+    assert not room.current_users
+    assert "hall" not in platform.realtime_manager.room_subscriptions
+
+
+def test_failing_membership_callback_is_logged(caplog):
+    async def scenario():
+        manager = RoomManager()
+        delivered = []
+        
+        async def failing(room_id, joined, left, actor_id):
+            raise RuntimeError("boom")
+        
+        async def recording(room_id, joined, left, actor_id):
+            delivered.append((room_id, joined, left))
+        
+        manager.add_membership_callback(failing)
+        manager.add_membership_callback(recording)
+        await manager.create_room({"room_id": "hall", "name": "hall", "owner_id": "owner"})
+        await manager.join_room_many("hall", ["a", "b"], "owner")
+        return delivered
+    
+    assert asyncio.run(scenario()) == [("hall", ["a", "b"], [])]
+    assert "Error in membership callback" in caplog.text
@@ -0,0 +1,120 @@
+import asyncio
+import math
+import random
+import re
+
+from social_platform import Message, MessageSearchIndex
+
+
+def _bm25(documents, terms, k1=MessageSearchIndex.K1, b=MessageSearchIndex.B):
+    tokens = {key: re.findall(r"\w+", text.casefold()) for key, text in documents.items()}
+    average = sum(len(words) for words in tokens.values()) / len(tokens)
+    scores = {}
+    for term in terms:
+        frequency = sum(1 for words in tokens.values() if term in words)
+        if not frequency:
+            continue
+        idf = math.log(1 + (len(tokens) - frequency + 0.5) / (frequency + 0.5))
+        for key, words in tokens.items():
+            count = words.count(term)
+            if count:
+                norm = count + k1 * (1 - b + b * len(words) / average)
+                scores[key] = scores.get(key, 0.0) + idf * count * (k1 + 1) / norm
+    return scores
+
+
+def _message(message_id, content, room_id="r"):
+    return Message(message_id=message_id, sender_id="s", room_id=room_id, content=content)
+
+
+# Message search (user-022)
+
+def test_search_index_ranks_with_bm25():
+    rng = random.Random(11)
+    vocabulary = ["apple", "banana", "cherry", "date", "elder", "fig", "grape"]
+    documents = {
+        str(i): " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 12)))
+        for i in range(300)
+    }
+    index = MessageSearchIndex()
+    for key, text in documents.items():
+        index.add(_message(key, text))
+    
+    # Deleted documents must not leak into the statistics
+    for key in rng.sample(sorted(documents), 60):
+        index.remove(key)
+        del documents[key]
+    
+    for query in ("apple", "banana cherry", "fig grape elder"):
+        expected = _bm25(documents, query.split())
+        results = index.search(query, limit=len(documents))
+        assert {key for key, _ in results} == set(expected)
+        for key, score in results:
+            assert math.isclose(score, expected[key], rel_tol=1e-9)
+        assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_search_index_phrases_rooms_and_compaction():
+    async def scenario():
+        index = MessageSearchIndex()
+        index.add(_message("1", "the quick brown fox", "a"))
+        index.add(_message("2", "brown quick fox", "a"))
+        index.add(_message("3", "quick brown dog", "b"))
+        assert {key for key, _ in index.search('"quick brown"')} == {"1", "3"}
+        assert {key for key, _ in index.search('"quick brown"', room_id="a")} == {"1"}
+        
+        index.remove("1")
+        await index.compact()
+        assert len(index.doc_messages) == 2 and index.dead_docs == 0
+        index.add(_message("4", "quick brown fox again", "a"))
+        return {key for key, _ in index.search('"quick brown"')}
+    
+    assert asyncio.run(scenario()) == {"3", "4"}
+
+
+
+def test_background_compaction_keeps_concurrent_updates():
+    async def scenario():
+        rng = random.Random(3)
+        vocabulary = [f"w{i}" for i in range(30)]
+        index = MessageSearchIndex()
+        index.COMPACT_TERMS = 3
+        documents = {}
+        
+        def add():
+            key = str(len(documents) + len(removed))
+            text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 8)))
+            index.add(_message(key, text))
+            documents[key] = text
+        
+        def remove(count):
+            for key in rng.sample(sorted(documents), count):
+                index.remove(key)
+                removed.add(key)
+                del documents[key]
+        
+        removed = set()
+        for _ in range(2000):
+            add()
+        remove(1500)  # compaction starts past 1000 dead documents
+        task = index.compaction_task
+        assert task is not None and not task.done()
+        
+        # Index and delete while the compaction yields between batches of terms
+        while not task.done():
+            for _ in range(5):
+                add()
+            remove(3)
+            await asyncio.sleep(0)
+        await task
+        return index, documents
+    
+    index, documents = asyncio.run(scenario())
+    assert len(index.doc_messages) - index.dead_docs == len(documents) == len(index)
+    assert len(index.doc_rooms) == len(index.doc_lengths) == len(index.doc_messages)
+    for query in ("w1", "w2 w3"):
+        expected = _bm25(documents, query.split())
+        results = index.search(query, limit=len(documents))
+        assert {key for key, _ in results} == set(expected)
+        for key, score in results:
+            assert math.isclose(score, expected[key], rel_tol=1e-9)
@@ -0,0 +1,68 @@
+import asyncio
+import json
+from collections import Counter
+
+import pytest
+
+from social_sharding import HashRing, ShardedPlatform
+
+
+# Consistent hashing (user-024)
+
+def test_hash_ring_routes_keys_stably():
+    ring = HashRing(["shard-0", "shard-1", "shard-2"])
+    again = HashRing(["shard-2", "shard-0", "shard-1"])
+    
+    keys = [f"room-{i}" for i in range(3000)]
+    owners = {key: ring.node_for(key) for key in keys}
+    
+    assert len(ring) == 3
+    assert all(again.node_for(key) == owner for key, owner in owners.items())
+    assert set(Counter(owners.values())) == {"shard-0", "shard-1", "shard-2"}
+    assert min(Counter(owners.values()).values()) > 500
+
+
+def test_hash_ring_moves_only_keys_of_changed_node():
+    ring = HashRing(["shard-0", "shard-1", "shard-2"])
+    keys = [f"room-{i}" for i in range(3000)]
+    before = {key: ring.node_for(key) for key in keys}
+    
+    ring.add_node("shard-3")
+    after = {key: ring.node_for(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved and all(after[key] == "shard-3" for key in moved)
+    
+    ring.remove_node("shard-3")
+    assert {key: ring.node_for(key) for key in keys} == before
+
+
+def test_hash_ring_without_nodes():
+    with pytest.raises(LookupError):
+        HashRing().node_for("room")
+
+
+# Realtime delivery from shard processes (user-024)
+
+def test_shard_room_events_reach_front_gateway():
+    async def scenario():
+        platform = ShardedPlatform(shards=2)
+        await platform.start()
+        try:
+            owner = (await platform.register_user({"username": "owner"}))["user"]["user_id"]
+            member = (await platform.register_user({"username": "member"}))["user"]["user_id"]
+            received = asyncio.Queue()
+            await platform.gateway.register(member, received.put)
+            
+            room = (await platform.create_room({"name": "lobby", "owner_id": owner}))["room"]
+            await platform.join_room(room["room_id"], member)
+            await platform.send_message({"sender_id": owner, "room_id": room["room_id"], "content": "hi"})
+            
+            events = []
+            while not any(event["data"].get("content") == "hi" for event in events):
+                events.append(json.loads(await asyncio.wait_for(received.get(), 10)))
+            return room, events
+        finally:
+            await platform.shutdown()
+    
+    room, events = asyncio.run(scenario())
+    assert all(event["room_id"] == room["room_id"] for event in events)
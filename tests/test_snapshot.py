@@ -0,0 +1,40 @@
+import asyncio
+import os
+
+from social_platform import SocialPlatform, UserStatus
+
+
+# Snapshot round-trip (user-016)
+
+def test_snapshot_round_trip(tmp_path):
+    path = os.path.join(str(tmp_path), "platform.snap")
+    
+    async def scenario():
+        source = SocialPlatform()
+        users = [await source.user_manager.create_user({"username": f"user{i}"}) for i in range(5)]
+        await source.user_manager.set_user_status(users[0].user_id, UserStatus.ONLINE)
+        room = await source.room_manager.create_room({"name": "lobby", "owner_id": users[0].user_id})
+        await source.room_manager.join_room(room.room_id, users[1].user_id)
+        for i in range(30):
+            await source.message_manager.send_message(
+                {"sender_id": users[i % 5].user_id, "room_id": room.room_id, "content": f"hello {i}"}
+            )
+        await source.message_manager.send_message(
+            {"sender_id": users[0].user_id, "recipient_id": users[1].user_id, "content": "direct"}
+        )
+        await source.save_snapshot(path, block_records=7)
+        
+        restored = SocialPlatform()
+        await restored.restore_snapshot(path)
+        await restored.message_manager.wait_hydrated()
+        
+        expected = [m.message_id for m in await source.message_manager.get_room_messages(room.room_id, 50)]
+        actual = [m.message_id for m in await restored.message_manager.get_room_messages(room.room_id, 50)]
+        return source, restored, room, users, expected, actual
+    
+    source, restored, room, users, expected, actual = asyncio.run(scenario())
+    assert actual == expected and len(actual) == 30
+    assert set(restored.user_manager.users) == set(source.user_manager.users)
+    assert all(user.status == UserStatus.OFFLINE for user in restored.user_manager.users.values())
+    assert restored.room_manager.rooms[room.room_id].current_users == {users[1].user_id}
+    assert restored.room_manager.rooms[room.room_id].moderators == {users[0].user_id}
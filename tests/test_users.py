@@ -0,0 +1,235 @@
+import asyncio
+import random
+
+from social_platform import (
+    PresenceDispatcher,
+    SenderProjectionCache,
+    SocialPlatform,
+    TimerWheel,
+    TrigramIndex,
+    UserManager,
+    UserStatus,
+)
+
+
+# Trigram search (user-001)
+
+def test_trigram_index_candidates_cover_substrings():
+    index = TrigramIndex()
+    texts = {"a": "Alice Smith", "b": "Bob Alison", "c": "carol"}
+    for key, text in texts.items():
+        index.add(key, index.grams([text]))
+    
+    for query in ("ali", "al", "s", "smith", "ol", "xyz", "on"):
+        matches = {key for key, text in texts.items() if query in text.lower()}
+        assert matches <= index.candidates(query)
+    assert index.candidates("") is None
+    
+    index.update("b", ["Bob Alison"], ["Bob"])
+    assert "b" not in index.candidates("ali")
+
+
+def test_search_users_matches_substrings():
+    async def scenario():
+        manager = UserManager()
+        for username in ("alice", "malik", "bob"):
+            await manager.create_user({"username": username, "display_name": username.title()})
+        return {user.username for user in await manager.search_users("ali")}
+    
+    assert asyncio.run(scenario()) == {"alice", "malik"}
+
+
+# Per-user session index (user-005)
+
+def test_end_sessions_sends_one_offline_update_per_user():
+    async def scenario():
+        manager = UserManager()
+        changes = []
+        
+        async def record(user_id, status):
+            changes.append((user_id, status))
+        
+        manager.add_presence_callback(record)
+        alice = await manager.create_user({"username": "alice"})
+        bob = await manager.create_user({"username": "bob"})
+        extra = await manager.create_session(alice.user_id)
+        await manager.presence_dispatcher.drain()
+        changes.clear()
+        
+        assert len(await manager.get_user_sessions(alice.user_id)) == 2
+        assert await manager.end_session(extra)
+        assert manager.users[alice.user_id].status == UserStatus.ONLINE
+        
+        ended = await manager.end_sessions(list(manager.active_sessions) + ["missing"])
+        await manager.presence_dispatcher.drain()
+        return ended, changes, manager, (alice.user_id, bob.user_id)
+    
+    ended, changes, manager, user_ids = asyncio.run(scenario())
+    assert ended == 2
+    assert sorted(changes) == sorted((user_id, UserStatus.OFFLINE) for user_id in user_ids)
+    assert not manager.active_sessions and not manager.user_sessions
+
+
+# Session expiry (user-006)
+
+def test_timer_wheel_expires_due_keys_only():
+    wheel = TimerWheel(tick=1.0, slots=8)
+    wheel.schedule("a", 3.5)
+    wheel.schedule("b", 5.0)
+    wheel.schedule("far", 30.0)  # several rotations away
+    wheel.schedule("cancelled", 2.0)
+    assert wheel.cancel("cancelled")
+    
+    assert wheel.advance(1.0) == []
+    assert wheel.advance(4.0) == ["a"]
+    wheel.schedule("b", 6.0)  # rescheduled before expiry
+    assert wheel.advance(5.5) == []
+    assert wheel.advance(6.0) == ["b"]
+    assert wheel.advance(29.0) == []
+    assert wheel.advance(31.0) == ["far"]
+    assert len(wheel) == 0
+
+
+def test_idle_sessions_expire_unless_touched():
+    async def scenario():
+        manager = UserManager(session_idle_timeout=10, expiry_tick=1)
+        user = await manager.create_user({"username": "alice"})
+        await manager.create_session(user.user_id)  # left idle
+        busy = await manager.create_session(user.user_id)
+        start = manager.active_sessions[busy]["created_at"]
+        manager.active_sessions[busy]["last_activity"] = start + 8
+        
+        first = await manager.expire_sessions(start + 11)
+        remaining = set(manager.active_sessions)
+        second = await manager.expire_sessions(start + 19)
+        return first, remaining, second, busy, manager, user.user_id
+    
+    first, remaining, second, busy, manager, user_id = asyncio.run(scenario())
+    assert first == 2 and remaining == {busy}  # the login session and the idle one
+    assert second == 1 and not manager.active_sessions
+    assert manager.users[user_id].status == UserStatus.OFFLINE
+    assert len(manager.session_wheel) == 0
+
+
+# Presence index (user-007)
+
+def test_online_users_pages_follow_status_changes():
+    async def scenario():
+        manager = UserManager()
+        rng = random.Random(2)
+        user_ids = [(await manager.create_user({"username": f"user{i}"})).user_id for i in range(200)]
+        for _ in range(800):
+            user_id = rng.choice(user_ids)
+            status = rng.choice(list(UserStatus))
+            if rng.random() < 0.5:
+                await manager.set_user_status(user_id, status)
+            else:
+                await manager.update_user(user_id, {"status": status})
+        
+        paged, cursor = [], None
+        while True:
+            page, cursor = await manager.get_online_users_page(cursor, 17)
+            paged.extend(user.user_id for user in page)
+            if cursor is None:
+                break
+        online = {user.user_id for user in await manager.get_online_users()}
+        return manager, paged, online, await manager.get_status_counts()
+    
+    manager, paged, online, counts = asyncio.run(scenario())
+    expected = sorted(user.user_id for user in manager.users.values() if user.status in UserManager.ONLINE_STATUSES)
+    assert paged == expected and online == set(expected)
+    assert counts == {
+        status.value: sum(1 for user in manager.users.values() if user.status == status) for status in UserStatus
+    }
+    assert set(manager.status_order) == set(UserManager.ONLINE_STATUSES)
+
+
+# Presence dispatch (user-008)
+
+def test_presence_changes_coalesce_and_isolate_slow_callbacks():
+    async def scenario():
+        manager = UserManager()
+        fast, slow = [], []
+        
+        async def record(user_id, status):
+            fast.append((user_id, status))
+        
+        async def lag(user_id, status):
+            await asyncio.sleep(0.2)
+            slow.append(user_id)
+        
+        async def fail(user_id, status):
+            raise ValueError("boom")
+        
+        for callback in (record, lag, fail):
+            manager.add_presence_callback(callback)
+        user = await manager.create_user({"username": "alice"})
+        for status in (UserStatus.AWAY, UserStatus.BUSY, UserStatus.OFFLINE, UserStatus.AWAY):
+            await manager.set_user_status(user.user_id, status)
+        
+        await asyncio.sleep(0.1)
+        early = (list(fast), list(slow))
+        await manager.flush_presence()
+        return user.user_id, early, slow, manager.get_presence_metrics()
+    
+    user_id, (fast, slow_before), slow_after, metrics = asyncio.run(scenario())
+    assert fast == [(user_id, UserStatus.AWAY)] and slow_before == []
+    assert slow_after == [user_id]
+    assert metrics["errors"] == 1 and metrics["coalesced"] == metrics["submitted"] - 1
+
+
+def test_presence_dispatcher_survives_a_new_event_loop():
+    dispatcher = PresenceDispatcher(coalesce_window=0.01)
+    delivered = []
+    
+    async def record(user_id, status):
+        delivered.append((user_id, status))
+    
+    dispatcher.add_callback(record)
+    
+    async def first():
+        dispatcher.submit("a", UserStatus.ONLINE)  # the loop ends before the flush fires
+    
+    async def second():
+        dispatcher.submit("b", UserStatus.AWAY)
+        await asyncio.sleep(0.05)
+    
+    asyncio.run(first())
+    asyncio.run(second())
+    assert sorted(delivered) == [("a", UserStatus.ONLINE), ("b", UserStatus.AWAY)]
+
+
+# Sender projections (user-020)
+
+def test_sender_projection_cache_evicts_least_recently_used():
+    cache = SenderProjectionCache(capacity=2)
+    cache.put("a", {"user_id": "a"})
+    cache.put("b", {"user_id": "b"})
+    assert cache.get("a") == {"user_id": "a"}
+    cache.put("c", {"user_id": "c"})
+    
+    assert cache.get("b") is None
+    assert list(cache.entries) == ["a", "c"]
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_room_history_senders_follow_profile_updates():
+    async def scenario():
+        platform = SocialPlatform()
+        user_id = (await platform.register_user({"username": "a"}))["user"]["user_id"]
+        room = await platform.room_manager.create_room({"name": "x", "owner_id": user_id})
+        await platform.message_manager.send_message({"sender_id": user_id, "room_id": room.room_id})
+        await platform.message_manager.send_message({"sender_id": "ghost", "room_id": room.room_id})
+        
+        before = await platform.get_room_messages(room.room_id)
+        await platform.user_manager.update_user(user_id, {"display_name": "B"})
+        after = await platform.get_room_messages(room.room_id)
+        await platform.shutdown()
+        return before["messages"], after["messages"]
+    
+    before, after = asyncio.run(scenario())
+    assert before[0]["sender"] is None
+    assert before[1]["sender"]["display_name"] == "a"
+    assert after[1]["sender"]["display_name"] == "B"